@@ -0,0 +1,168 @@
+"""partition invoice
+
+Converts `invoice` into a table range partitioned by month of `invoice_date`,
+see `app/core/partitions.py`. Partitions are created for every month with
+invoices up to 3 months ahead, existing rows are copied over. The table is
+rewritten, run it in a maintenance window.
+
+The unique key becomes (device_name, invoice_num, invoice_date), the
+partition key must be part of it. Downgrading restores the narrower
+(device_name, invoice_num) key, so invoices that only differ by invoice_date
+are deleted first: the earliest stored one (created_at, then id) of every
+key is kept and the others are subtracted from the daily rollups, like the
+query indexes migration (4b82c8751734) does.
+
+Revision ID: 4b70f98aeea5
+Revises: 4b82c8751734
+Create Date: 2026-10-17 12:02:17.553108
+
+"""
+import datetime
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+from app.core import partitions
+from app.core.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision = "4b70f98aeea5"
+down_revision = "4b82c8751734"
+branch_labels = None
+depends_on = None
+
+COLUMNS = (
+    "id, invoice_num, invoice_date, device_name, username, "
+    "tax_value, total_value, created_at, modified_at"
+)
+
+# invoices sharing (device_name, invoice_num) but the earliest one, and their
+# share of the rollups
+DEDUPLICATE = """
+WITH duplicate AS (
+    DELETE FROM invoice
+    WHERE id IN (
+        SELECT id FROM (
+            SELECT id, row_number() OVER (
+                PARTITION BY device_name, invoice_num ORDER BY created_at, id
+            ) AS position
+            FROM invoice
+            WHERE device_name IS NOT NULL AND invoice_num IS NOT NULL
+        ) AS ranked
+        WHERE position > 1
+    )
+    RETURNING invoice_date, device_name, username, tax_value, total_value
+), removed AS (
+    SELECT CAST(timezone(:tz, invoice_date) AS DATE) AS day,
+           device_name, username, count(*) AS invoice_count,
+           coalesce(sum(tax_value), 0) AS tax_value,
+           coalesce(sum(total_value), 0) AS total_value
+    FROM duplicate
+    WHERE invoice_date IS NOT NULL AND username IS NOT NULL
+    GROUP BY 1, 2, 3
+)
+UPDATE invoice_daily_rollup AS rollup
+SET invoice_count = rollup.invoice_count - removed.invoice_count,
+    tax_value = rollup.tax_value - removed.tax_value,
+    total_value = rollup.total_value - removed.total_value
+FROM removed
+WHERE rollup.day = removed.day
+  AND rollup.device_name = removed.device_name
+  AND rollup.username = removed.username
+"""
+
+
+def _create_invoice_table(**kw):
+    op.create_table(
+        "invoice",
+        sa.Column("invoice_date", sa.DateTime(timezone=True), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("modified_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("id", sqlmodel.sql.sqltypes.GUID(), nullable=False),
+        sa.Column("invoice_num", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column("device_name", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column("username", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column("tax_value", sa.Numeric(precision=15, scale=2), nullable=True),
+        sa.Column("total_value", sa.Numeric(precision=15, scale=2), nullable=True),
+        **kw,
+    )
+
+
+def _create_foreign_keys():
+    op.create_foreign_key(
+        "invoice_device_name_fkey", "invoice", "device", ["device_name"], ["name"]
+    )
+    op.create_foreign_key(
+        "invoice_username_fkey", "invoice", "user", ["username"], ["username"]
+    )
+
+
+def upgrade():
+    op.rename_table("invoice", "invoice_unpartitioned")
+    _create_invoice_table(postgresql_partition_by="RANGE (invoice_date)")
+
+    first_day = (
+        op.get_bind()
+        .execute(
+            sa.text(
+                "SELECT CAST(min(timezone(:tz, invoice_date)) AS DATE) "
+                "FROM invoice_unpartitioned"
+            ),
+            {"tz": settings.TIMEZONE},
+        )
+        .scalar()
+    )
+    today = datetime.datetime.now(partitions.timezone).date()
+    end = partitions.month_start(today)
+    for _ in range(4):
+        end = partitions.next_month(end)
+    for month in partitions.months(min(first_day or today, today), end):
+        op.execute(partitions.create_partition_sql(month))
+    op.execute(
+        f"CREATE TABLE {partitions.DEFAULT_PARTITION} PARTITION OF invoice DEFAULT"
+    )
+
+    op.execute(
+        f"INSERT INTO invoice ({COLUMNS}) "
+        "SELECT id, invoice_num, coalesce(invoice_date, created_at, now()), "
+        "device_name, username, tax_value, total_value, created_at, modified_at "
+        "FROM invoice_unpartitioned"
+    )
+    op.drop_table("invoice_unpartitioned")
+
+    op.create_primary_key("invoice_pkey", "invoice", ["invoice_date", "id"])
+    op.create_unique_constraint(
+        "uq_invoice_device_name_invoice_num_invoice_date",
+        "invoice",
+        ["device_name", "invoice_num", "invoice_date"],
+    )
+    op.create_index(
+        "ix_invoice_username_invoice_date", "invoice", ["username", "invoice_date"]
+    )
+    op.create_index("ix_invoice_invoice_date", "invoice", ["invoice_date"])
+    _create_foreign_keys()
+
+
+def downgrade():
+    op.rename_table("invoice", "invoice_partitioned")
+    _create_invoice_table()
+    op.execute(
+        f"INSERT INTO invoice ({COLUMNS}) SELECT {COLUMNS} FROM invoice_partitioned"
+    )
+    # drops every partition too
+    op.drop_table("invoice_partitioned")
+    op.execute(sa.text(DEDUPLICATE).bindparams(tz=settings.TIMEZONE))
+
+    op.create_primary_key("invoice_pkey", "invoice", ["id"])
+    op.create_unique_constraint(
+        "uq_invoice_device_name_invoice_num",
+        "invoice",
+        ["device_name", "invoice_num"],
+    )
+    op.create_index(
+        "ix_invoice_username_invoice_date", "invoice", ["username", "invoice_date"]
+    )
+    op.create_index("ix_invoice_invoice_date", "invoice", ["invoice_date"])
+    _create_foreign_keys()
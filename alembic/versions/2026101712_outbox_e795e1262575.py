@@ -0,0 +1,35 @@
+"""outbox
+
+Revision ID: e795e1262575
+Revises: f36ae69e3de5
+Create Date: 2026-10-17 09:12:41.118305
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "e795e1262575"
+down_revision = "f36ae69e3de5"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "outbox",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("topic", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("payload", postgresql.JSONB(), nullable=False),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index("ix_outbox_topic_id", "outbox", ["topic", "id"])
+
+
+def downgrade():
+    op.drop_index("ix_outbox_topic_id", table_name="outbox")
+    op.drop_table("outbox")
@@ -0,0 +1,60 @@
+"""invoice daily rollup
+
+Revision ID: 8bfe22d22b06
+Revises: e795e1262575
+Create Date: 2026-10-17 10:31:05.402271
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+from app.core.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision = "8bfe22d22b06"
+down_revision = "e795e1262575"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "invoice_daily_rollup",
+        sa.Column("day", sa.Date(), nullable=False),
+        sa.Column("device_name", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("username", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("invoice_count", sa.Integer(), nullable=True),
+        sa.Column("tax_value", sa.Numeric(precision=20, scale=2), nullable=True),
+        sa.Column("total_value", sa.Numeric(precision=20, scale=2), nullable=True),
+        sa.PrimaryKeyConstraint("day", "device_name", "username"),
+    )
+    op.create_index(
+        "ix_invoice_daily_rollup_username_day",
+        "invoice_daily_rollup",
+        ["username", "day"],
+    )
+    # backfill from existing invoices
+    op.execute(
+        sa.text(
+            """
+            INSERT INTO invoice_daily_rollup
+                (day, device_name, username, invoice_count, tax_value, total_value)
+            SELECT CAST(timezone(:tz, invoice_date) AS DATE) AS day,
+                   device_name, username, count(*),
+                   coalesce(sum(tax_value), 0), coalesce(sum(total_value), 0)
+            FROM invoice
+            WHERE invoice_date IS NOT NULL
+              AND device_name IS NOT NULL AND username IS NOT NULL
+            GROUP BY 1, 2, 3
+            """
+        ).bindparams(tz=settings.TIMEZONE)
+    )
+
+
+def downgrade():
+    op.drop_index(
+        "ix_invoice_daily_rollup_username_day", table_name="invoice_daily_rollup"
+    )
+    op.drop_table("invoice_daily_rollup")
@@ -0,0 +1,112 @@
+"""query indexes
+
+Indexes for the hot query paths and a unique (device_name, invoice_num) key
+that makes resubmitted invoices idempotent.
+
+Indexes are built CONCURRENTLY (outside of a transaction) so invoice writes
+keep going while they build. Duplicated invoices are deleted first, keeping
+the earliest stored one (created_at, then id) of every key, and subtracted
+from the daily rollups. A build that failed leaves an INVALID index behind,
+it is dropped and built again when the migration is rerun.
+
+Revision ID: 4b82c8751734
+Revises: 8bfe22d22b06
+Create Date: 2026-10-17 11:44:52.810946
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+from app.core.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision = "4b82c8751734"
+down_revision = "8bfe22d22b06"
+branch_labels = None
+depends_on = None
+
+INDEXES = [
+    ("ix_user_created_at_id", "user", ["created_at", "id"]),
+    ("ix_device_created_at_id", "device", ["created_at", "id"]),
+    ("ix_device_user_id", "device", ["user_id"]),
+    ("ix_invoice_username_invoice_date", "invoice", ["username", "invoice_date"]),
+    ("ix_invoice_invoice_date", "invoice", ["invoice_date"]),
+]
+
+DEDUPLICATE = """
+WITH duplicate AS (
+    DELETE FROM invoice
+    WHERE id IN (
+        SELECT id FROM (
+            SELECT id, row_number() OVER (
+                PARTITION BY device_name, invoice_num ORDER BY created_at, id
+            ) AS position
+            FROM invoice
+            WHERE device_name IS NOT NULL AND invoice_num IS NOT NULL
+        ) AS ranked
+        WHERE position > 1
+    )
+    RETURNING invoice_date, device_name, username, tax_value, total_value
+), removed AS (
+    SELECT CAST(timezone(:tz, invoice_date) AS DATE) AS day,
+           device_name, username, count(*) AS invoice_count,
+           coalesce(sum(tax_value), 0) AS tax_value,
+           coalesce(sum(total_value), 0) AS total_value
+    FROM duplicate
+    WHERE invoice_date IS NOT NULL AND username IS NOT NULL
+    GROUP BY 1, 2, 3
+)
+UPDATE invoice_daily_rollup AS rollup
+SET invoice_count = rollup.invoice_count - removed.invoice_count,
+    tax_value = rollup.tax_value - removed.tax_value,
+    total_value = rollup.total_value - removed.total_value
+FROM removed
+WHERE rollup.day = removed.day
+  AND rollup.device_name = removed.device_name
+  AND rollup.username = removed.username
+"""
+
+
+def _create_index(name, table, columns, unique=False):
+    """CREATE INDEX CONCURRENTLY, unless a valid one exists from an earlier run"""
+    valid = (
+        op.get_bind()
+        .execute(
+            sa.text(
+                "SELECT i.indisvalid FROM pg_index AS i "
+                "JOIN pg_class AS c ON c.oid = i.indexrelid WHERE c.relname = :name"
+            ),
+            {"name": name},
+        )
+        .scalar()
+    )
+    if valid:
+        return
+    if valid is not None:
+        op.drop_index(name, table_name=table, postgresql_concurrently=True)
+    op.create_index(name, table, columns, unique=unique, postgresql_concurrently=True)
+
+
+def upgrade():
+    with op.get_context().autocommit_block():
+        for name, table, columns in INDEXES:
+            _create_index(name, table, columns)
+        op.execute(sa.text(DEDUPLICATE).bindparams(tz=settings.TIMEZONE))
+        _create_index(
+            "uq_invoice_device_name_invoice_num",
+            "invoice",
+            ["device_name", "invoice_num"],
+            unique=True,
+        )
+    op.execute(
+        "ALTER TABLE invoice ADD CONSTRAINT uq_invoice_device_name_invoice_num "
+        "UNIQUE USING INDEX uq_invoice_device_name_invoice_num"
+    )
+
+
+def downgrade():
+    op.drop_constraint("uq_invoice_device_name_invoice_num", "invoice", type_="unique")
+    for name, table, _ in reversed(INDEXES):
+        op.drop_index(name, table_name=table)
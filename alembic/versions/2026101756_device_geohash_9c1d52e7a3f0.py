@@ -0,0 +1,53 @@
+"""device geohash
+
+Geohash of the device location, B-tree indexed for location search. The
+"C" collation keeps the index in byte order so geohash prefixes are ranges.
+Existing devices with coordinates are backfilled.
+
+Revision ID: 9c1d52e7a3f0
+Revises: 4b70f98aeea5
+Create Date: 2026-10-17 13:56:20.472913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+from app.core import geohash
+
+
+# revision identifiers, used by Alembic.
+revision = "9c1d52e7a3f0"
+down_revision = "4b70f98aeea5"
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 5000
+
+
+def upgrade():
+    op.add_column(
+        "device",
+        sa.Column("geohash", sa.VARCHAR(length=12, collation="C"), nullable=True),
+    )
+    connection = op.get_bind()
+    rows = connection.execute(
+        sa.text(
+            "SELECT id, lat, lon FROM device "
+            "WHERE lat IS NOT NULL AND lon IS NOT NULL"
+        )
+    ).fetchall()
+    values = [
+        {"id": row.id, "geohash": geohash.encode(row.lat, row.lon)} for row in rows
+    ]
+    for start in range(0, len(values), BACKFILL_BATCH_SIZE):
+        connection.execute(
+            sa.text("UPDATE device SET geohash = :geohash WHERE id = :id"),
+            values[start : start + BACKFILL_BATCH_SIZE],
+        )
+    op.create_index("ix_device_geohash", "device", ["geohash"])
+
+
+def downgrade():
+    op.drop_index("ix_device_geohash", table_name="device")
+    op.drop_column("device", "geohash")
@@ -0,0 +1,63 @@
+"""invoice import
+
+Progress of invoice imports and their unlogged staging table, see
+`app/import_invoices.py`.
+
+Revision ID: 1f6a3c9d8e42
+Revises: 9c1d52e7a3f0
+Create Date: 2026-10-17 13:59:37.214905
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = "1f6a3c9d8e42"
+down_revision = "9c1d52e7a3f0"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        "import_job",
+        sa.Column("id", sqlmodel.sql.sqltypes.GUID(), nullable=False),
+        sa.Column("filename", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column("format", sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+        sa.Column(
+            "status",
+            sa.Enum("loading", "merging", "done", name="importstatus"),
+            nullable=True,
+        ),
+        sa.Column("loaded_through", sa.BigInteger(), nullable=True),
+        sa.Column("merged_through", sa.BigInteger(), nullable=True),
+        sa.Column("loaded_rows", sa.Integer(), nullable=True),
+        sa.Column("rejected_rows", sa.Integer(), nullable=True),
+        sa.Column("merged_rows", sa.Integer(), nullable=True),
+        sa.Column("duplicate_rows", sa.Integer(), nullable=True),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("modified_at", sa.DateTime(timezone=True), nullable=True),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_table(
+        "invoice_import_staging",
+        sa.Column("job_id", sqlmodel.sql.sqltypes.GUID(), nullable=False),
+        sa.Column("line", sa.BigInteger(), nullable=False),
+        sa.Column("invoice_num", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column("invoice_date", sa.DateTime(timezone=True), nullable=True),
+        sa.Column("device_name", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column("username", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.Column("tax_value", sa.Numeric(precision=15, scale=2), nullable=True),
+        sa.Column("total_value", sa.Numeric(precision=15, scale=2), nullable=True),
+        sa.Column("error", sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+        sa.PrimaryKeyConstraint("job_id", "line"),
+        prefixes=["UNLOGGED"],
+    )
+
+
+def downgrade():
+    op.drop_table("invoice_import_staging")
+    op.drop_table("import_job")
+    sa.Enum(name="importstatus").drop(op.get_bind())
@@ -0,0 +1,48 @@
+"""created_at not null
+
+Keyset pagination of users and devices orders by `(created_at, id)` and
+puts `created_at` in the cursor, see `app/core/pagination.py`. Rows without
+it are backfilled from `modified_at` (now when missing too) and the columns
+become NOT NULL.
+
+Revision ID: 5d3e9a4c71b2
+Revises: 1f6a3c9d8e42
+Create Date: 2026-10-18 08:12:40.518337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+# revision identifiers, used by Alembic.
+revision = "5d3e9a4c71b2"
+down_revision = "1f6a3c9d8e42"
+branch_labels = None
+depends_on = None
+
+TABLES = ["user", "device"]
+
+
+def upgrade():
+    for table in TABLES:
+        op.execute(
+            f'UPDATE "{table}" SET created_at = coalesce(modified_at, now()) '
+            "WHERE created_at IS NULL"
+        )
+        op.alter_column(
+            table,
+            "created_at",
+            existing_type=sa.DateTime(timezone=True),
+            nullable=False,
+        )
+
+
+def downgrade():
+    for table in TABLES:
+        op.alter_column(
+            table,
+            "created_at",
+            existing_type=sa.DateTime(timezone=True),
+            nullable=True,
+        )
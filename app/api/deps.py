@@ -1,21 +1,54 @@
 import time
+import uuid
 from typing import AsyncGenerator
 
 import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached, sessionmaker
+from sqlalchemy.util import await_only
 from sqlmodel import select
 
 # from sqlalchemy.ext.asyncio import AsyncSession
 from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlmodel.orm.session import Session
 
-from app.core import config, security
-from app.core.session import SessionLocal
+from app.core import cache, config, security
+from app.core.session import SessionLocal, read_session_factory
 from app.model.models import User
-from app.schemas.responses import UserResponse
 
 reusable_oauth2 = OAuth2PasswordBearer(tokenUrl="auth/access-token")
 
+# authenticated users by id, see `get_current_user`. Shared: a deleted user
+# must not stay authenticated on other processes
+principal_cache = cache.create_cache(
+    "principal",
+    ttl=config.settings.PRINCIPAL_CACHE_TTL_SECONDS,
+    max_size=config.settings.PRINCIPAL_CACHE_MAX_SIZE,
+    shared=True,
+)
+
+# users who committed lately, their reads stay on the primary until the
+# replica has surely caught up, see `get_read_session`. Unless every process
+# sees these marks, reads stay on the primary
+recent_writers = cache.create_cache(
+    "recent_writer",
+    ttl=config.settings.REPLICA_MAX_LAG_SECONDS,
+    max_size=config.settings.PRINCIPAL_CACHE_MAX_SIZE,
+    shared=True,
+)
+READ_YOUR_WRITES_SHARED = cache.is_shared()
+
+
+@event.listens_for(Session, "after_commit")
+def _mark_recent_writer(session):
+    # runs inside AsyncSession.commit, so before the handler responds (the
+    # teardown of get_session only runs after the response is sent)
+    user_id = session.info.get("user_id")
+    if user_id is not None:
+        await_only(recent_writers.set(str(user_id), True))
+
 
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
     async with SessionLocal() as session:
@@ -50,9 +83,44 @@ async def get_current_user(
             detail="Could not validate credentials, token expired or not yet valid",
         )
 
+    session.info["user_id"] = token_data.sub
+    cached = await principal_cache.get(str(token_data.sub))
+    if cached is not None:
+        # detached instance, handlers can still session.add() and update it
+        user = User(**cached)
+        make_transient_to_detached(user)
+        return user
+
     result = await session.exec(select(User).where(User.id == token_data.sub))
-    user: UserResponse | None = result.one()
+    user: User | None = result.one_or_none()
 
     if not user:
         raise HTTPException(status_code=404, detail="User not found.")
+    # password hash is never needed by handlers, keep it out of the cache
+    await principal_cache.set(str(user.id), user.dict(exclude={"hashed_password"}))
     return user
+
+
+async def invalidate_principal(user_id: uuid.UUID | str) -> None:
+    """Drop cached user, call it after the user row has been changed or deleted"""
+    await principal_cache.delete(str(user_id))
+
+
+async def get_session_factory(
+    current_user: User = Depends(get_current_user),
+) -> sessionmaker:
+    """
+    Session factory for read only requests: the read replica, unless it lags
+    too much or the user committed something lately (read-your-own-writes),
+    then the primary.
+    """
+    if not READ_YOUR_WRITES_SHARED or await recent_writers.get(str(current_user.id)):
+        return SessionLocal
+    return await read_session_factory()
+
+
+async def get_read_session(
+    factory: sessionmaker = Depends(get_session_factory),
+) -> AsyncGenerator[AsyncSession, None]:
+    async with factory() as session:
+        yield session
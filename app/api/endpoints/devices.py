@@ -1,81 +1,273 @@
+import codecs
+import csv
 import uuid
 from datetime import datetime
 from typing import List, Optional
 
 import pytz
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, File, HTTPException, Query, Request, UploadFile
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import and_, bindparam, func, or_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import sessionmaker
 from sqlmodel import delete, select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.api import deps
+from app.core import geohash, pagination, response_cache, serialization
 from app.core.config import settings
 from app.model.models import Device, Invoice, Status, User
-from app.schemas.requests import DeviceAssignRequest, DeviceCreateRequest
+from app.repository import devices as device_repository
+from app.schemas.requests import (
+    DeviceAssignRequest,
+    DeviceBulkAssignItemRequest,
+    DeviceBulkAssignRequest,
+    DeviceBulkCreateRequest,
+    DeviceBulkUnassignItemRequest,
+    DeviceBulkUnassignRequest,
+    DeviceCreateRequest,
+)
 from app.schemas.responses import (
     DeviceAssignResponse,
+    DeviceBulkItemResponse,
+    DeviceBulkResponse,
     DeviceCreatedResponse,
+    DeviceGeoResponse,
     DeviceResponse,
 )
 
 timezone = pytz.timezone(settings.TIMEZONE)
 router = APIRouter()
 
+MAX_GEO_RESULTS = 5000
+MAX_DEVICES_PER_STATEMENT = 4000  # 7 bind params a row, asyncpg allows 32767
+NEAREST_START_RADIUS_M = 1000
+MAX_RADIUS_M = 20_037_509  # half of the earth circumference
+
+
+def _device_list_statement(status: Optional[Status]):
+    statement = select(
+        Device.id,
+        Device.name,
+        Device.serial_num,
+        Device.status,
+        Device.description,
+        Device.lat,
+        Device.lon,
+        Device.user_id,
+        Device.created_at,
+        Device.modified_at,
+        User.username,
+    ).join(User, isouter=True)
+    if status:
+        statement = statement.where(Device.status == status)
+    return statement
+
+
+def _device_row_to_response(dev) -> dict:
+    return {
+        "id": dev.id,
+        "name": dev.name,
+        "serial_num": dev.serial_num,
+        "status": dev.status,
+        "lat": dev.lat,
+        "lon": dev.lon,
+        "description": dev.description,
+        "owner": {"user_id": dev.user_id, "username": dev.username},
+    }
+
+
+async def _stream_devices(session_factory, statement):
+    # own session: the request scoped one may be closed before streaming ends
+    async with session_factory() as session:
+        result = await session.stream(statement)
+        async for dev in result:
+            yield serialization.dumps(_device_row_to_response(dev)) + b"\n"
+
 
 @router.get("/", response_model=List[DeviceResponse])
 async def get_device_list(
+    request: Request,
     status: Status = None,
-    session: AsyncSession = Depends(deps.get_session),
+    session_factory: sessionmaker = Depends(deps.get_session_factory),
     current_user: User = Depends(deps.get_current_user),
-    limit: Optional[int] = 10,
-    offset: Optional[int] = 0,
+    limit: int = Query(10, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    stream: bool = False,
 ):
-    """Get device list of current user"""
-    if status:
+    """
+    Get device list
+
+    Devices are ordered by creation time. Pass the `X-Next-Cursor` response
+    header as `cursor` to get the next page, the header is missing on the last page.
+
+    With `stream=true` all devices (after `cursor`, `limit` is ignored) are
+    streamed as NDJSON, one device per line, from a server-side cursor.
+
+    Pages are cached until the next device or user change and carry `ETag`
+    and `Last-Modified`, send them back as `If-None-Match` or
+    `If-Modified-Since` to get `304 Not Modified` while nothing changed.
+    """
+    if stream:
+        statement = pagination.paginate(
+            _device_list_statement(status), Device, cursor, limit=None
+        )
+        return StreamingResponse(
+            _stream_devices(session_factory, statement),
+            media_type="application/x-ndjson",
+        )
+
+    key = await response_cache.responses.key(request, current_user.id)
+    cached = await response_cache.responses.get(request, key)
+    if cached is not None:
+        return cached
+    async with response_cache.responses.session_factory(session_factory)() as session:
         result = await session.exec(
-            select(
-                Device.id,
-                Device.name,
-                Device.serial_num,
-                Device.status,
-                Device.description,
-                Device.lat,
-                Device.lon,
-                Device.user_id,
-                User.username,
+            pagination.paginate(_device_list_statement(status), Device, cursor, limit)
+        )
+        devices = result.fetchall()
+    next_cursor = pagination.next_cursor(devices, limit)
+    return await response_cache.responses.set(
+        request,
+        key,
+        [_device_row_to_response(dev) for dev in devices],
+        max((dev.modified_at for dev in devices), default=None),
+        headers={pagination.NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None,
+    )
+
+
+def _geo_statement(cells: list[str], status: Optional[Status]):
+    # one geohash index range scan per covering cell
+    return _device_list_statement(status).where(
+        or_(
+            *(
+                and_(Device.geohash >= cell, Device.geohash < cell + geohash.RANGE_END)
+                for cell in cells
             )
-            .join(User, isouter=True)
-            .where(Device.status == status)
         )
-    else:
-        result = await session.exec(
-            select(
-                Device.id,
-                Device.name,
-                Device.serial_num,
-                Device.status,
-                Device.description,
-                Device.lat,
-                Device.lon,
-                Device.user_id,
-                User.username,
-            ).join(User, isouter=True)
+    )
+
+
+def _distance(lat: float, lon: float):
+    """Great circle (haversine) distance in meters between devices and a point"""
+    return (
+        2
+        * geohash.EARTH_RADIUS_M
+        * func.asin(
+            func.least(
+                1.0,
+                func.sqrt(
+                    func.power(func.sin(func.radians(Device.lat - lat) / 2), 2)
+                    + func.cos(func.radians(lat))
+                    * func.cos(func.radians(Device.lat))
+                    * func.power(func.sin(func.radians(Device.lon - lon) / 2), 2)
+                ),
+            )
         )
-    devices = result.fetchall()
-    response = []
-    for dev in devices:
-        response.append(
+    )
+
+
+async def _nearby(
+    session: AsyncSession,
+    lat: float,
+    lon: float,
+    radius_m: float,
+    status: Optional[Status],
+    limit: int,
+) -> list:
+    distance = _distance(lat, lon)
+    distance_m = distance.label("distance_m")
+    statement = (
+        _geo_statement(geohash.cover(*geohash.radius_box(lat, lon, radius_m)), status)
+        .add_columns(distance_m)
+        .where(distance <= radius_m)
+        .order_by(distance_m, Device.id)
+        .limit(limit)
+    )
+    result = await session.exec(statement)
+    return result.fetchall()
+
+
+def _geo_response(devices: list) -> serialization.FastJSONResponse:
+    return serialization.FastJSONResponse(
+        [
             {
-                "id": dev.id,
-                "name": dev.name,
-                "serial_num": dev.serial_num,
-                "status": dev.status,
-                "lat": dev.lat,
-                "lon": dev.lon,
-                "description": dev.description,
-                "owner": {"user_id": dev.user_id, "username": dev.username},
+                **_device_row_to_response(dev),
+                "distance_m": getattr(dev, "distance_m", None),
             }
+            for dev in devices
+        ]
+    )
+
+
+@router.get("/within", response_model=List[DeviceGeoResponse])
+async def get_devices_within(
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lon: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lon: float = Query(..., ge=-180, le=180),
+    status: Status = None,
+    limit: int = Query(1000, ge=1, le=MAX_GEO_RESULTS),
+    session: AsyncSession = Depends(deps.get_read_session),
+    current_user: User = Depends(deps.get_current_user),
+):
+    """
+    Get devices inside a bounding box (map view)
+
+    Boxes crossing the antimeridian are not supported, query both sides.
+    """
+    if min_lat > max_lat or min_lon > max_lon:
+        raise HTTPException(
+            status_code=400, detail="min_lat/min_lon must not exceed max_lat/max_lon"
         )
-    return response  # devices
+    statement = (
+        _geo_statement(geohash.cover(min_lat, min_lon, max_lat, max_lon), status)
+        .where(Device.lat.between(min_lat, max_lat))
+        .where(Device.lon.between(min_lon, max_lon))
+        .order_by(Device.geohash)
+        .limit(limit)
+    )
+    result = await session.exec(statement)
+    return _geo_response(result.fetchall())
+
+
+@router.get("/nearby", response_model=List[DeviceGeoResponse])
+async def get_devices_nearby(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    radius_m: float = Query(..., gt=0, le=MAX_RADIUS_M),
+    status: Status = None,
+    limit: int = Query(1000, ge=1, le=MAX_GEO_RESULTS),
+    session: AsyncSession = Depends(deps.get_read_session),
+    current_user: User = Depends(deps.get_current_user),
+):
+    """Get devices within `radius_m` meters of a point, nearest first"""
+    devices = await _nearby(session, lat, lon, radius_m, status, limit)
+    return _geo_response(devices)
+
+
+@router.get("/nearest", response_model=List[DeviceGeoResponse])
+async def get_nearest_devices(
+    lat: float = Query(..., ge=-90, le=90),
+    lon: float = Query(..., ge=-180, le=180),
+    count: int = Query(10, ge=1, le=MAX_GEO_RESULTS),
+    status: Status = None,
+    session: AsyncSession = Depends(deps.get_read_session),
+    current_user: User = Depends(deps.get_current_user),
+):
+    """
+    Get the `count` devices nearest to a point
+
+    The search radius grows from 1 km until `count` devices are found, so
+    dense areas only touch a few index ranges.
+    """
+    radius_m = NEAREST_START_RADIUS_M
+    while True:
+        devices = await _nearby(session, lat, lon, radius_m, status, count)
+        if len(devices) >= count or radius_m >= MAX_RADIUS_M:
+            return _geo_response(devices)
+        radius_m = min(radius_m * 8, MAX_RADIUS_M)
 
 
 @router.post("/", response_model=DeviceCreatedResponse)
@@ -106,6 +298,7 @@ async def add_device(
         )
         session.add(device)
         await session.commit()
+        await response_cache.responses.invalidate()
         return device
     except Exception:
         await session.rollback()
@@ -114,6 +307,350 @@ async def add_device(
         )
 
 
+def _rejected(index: int, detail: str) -> DeviceBulkItemResponse:
+    return DeviceBulkItemResponse(index=index, ok=False, detail=detail)
+
+
+def _bulk_response(results: dict[int, DeviceBulkItemResponse]) -> DeviceBulkResponse:
+    accepted = sum(1 for item in results.values() if item.ok)
+    return DeviceBulkResponse(
+        accepted=accepted,
+        rejected=len(results) - accepted,
+        results=[results[index] for index in sorted(results)],
+    )
+
+
+async def _read_csv(file: UploadFile, model) -> tuple[list, dict]:
+    """
+    Rows of an uploaded CSV (with header) validated into `model`, as
+    (index, item) pairs, and the rejected rows by index. Empty cells are None.
+
+    The upload is decoded and parsed line by line from its spooled file, at
+    most `DEVICE_BULK_MAX_SIZE` rows are read.
+    """
+    await file.seek(0)
+    lines = codecs.iterdecode(file.file, "utf-8-sig")
+    items = []
+    results = {}
+    try:
+        for index, row in enumerate(csv.DictReader(lines)):
+            if index >= settings.DEVICE_BULK_MAX_SIZE:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"At most {settings.DEVICE_BULK_MAX_SIZE} rows per upload",
+                )
+            try:
+                items.append(
+                    (index, model(**{k: v or None for k, v in row.items() if k}))
+                )
+            except ValidationError as ex:
+                errors = "; ".join(
+                    f"{'.'.join(map(str, error['loc']))}: {error['msg']}"
+                    for error in ex.errors()
+                )
+                results[index] = _rejected(index, errors)
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=400, detail="CSV file must be UTF-8")
+    if not items and not results:
+        raise HTTPException(status_code=400, detail="CSV file has no rows")
+    return items, results
+
+
+async def _bulk_create(
+    session: AsyncSession, items: list, results: dict
+) -> DeviceBulkResponse:
+    now = datetime.now(timezone)
+    rows = {}
+    for index, item in items:
+        if item.name in rows:
+            results[index] = _rejected(index, f"Duplicate device {item.name}")
+            continue
+        rows[item.name] = (
+            index,
+            {
+                "id": uuid.uuid4(),
+                "name": item.name,
+                "serial_num": item.serial_num,
+                "description": item.description,
+                "status": Status.created,
+                "created_at": now,
+                "modified_at": now,
+            },
+        )
+    if rows:
+        result = await session.exec(
+            select(Device.name).where(Device.name.in_(list(rows)))
+        )
+        for name in result.all():
+            index, _ = rows.pop(name)
+            results[index] = _rejected(index, f"Device with {name} already exist")
+
+    values = [row for _, row in rows.values()]
+    try:
+        for start in range(0, len(values), MAX_DEVICES_PER_STATEMENT):
+            result = await session.exec(
+                insert(Device)
+                .values(values[start : start + MAX_DEVICES_PER_STATEMENT])
+                .on_conflict_do_nothing(index_elements=[Device.name])
+                .returning(Device.id, Device.name, Device.user_id, Device.status)
+            )
+            for device in result.all():
+                index, _ = rows.pop(device.name)
+                results[index] = DeviceBulkItemResponse(
+                    index=index, ok=True, device=DeviceAssignResponse(**device._mapping)
+                )
+        await session.commit()
+    except Exception as ex:
+        print(str(ex))
+        await session.rollback()
+        raise HTTPException(
+            status_code=500, detail="Something went wrong. Rollback has occured"
+        )
+    await response_cache.responses.invalidate()
+    # added by a concurrent request after the IN query
+    for name, (index, _) in rows.items():
+        results[index] = _rejected(index, f"Device with {name} already exist")
+    return _bulk_response(results)
+
+
+async def _bulk_assign(
+    session: AsyncSession, items: list, results: dict
+) -> DeviceBulkResponse:
+    # locked until commit, so the status checked below and the previous owner
+    # still hold when the UPDATE runs (in id order, against deadlocks)
+    result = await session.exec(
+        select(Device.id, Device.name, Device.user_id, Device.status)
+        .where(Device.name.in_({item.device_name for _, item in items}))
+        .order_by(Device.id)
+        .with_for_update()
+    )
+    devices = {device.name: device for device in result.all()}
+    result = await session.exec(
+        select(User.id, User.username).where(
+            User.username.in_({item.username for _, item in items})
+        )
+    )
+    users = {user.username: user.id for user in result.all()}
+
+    now = datetime.now(timezone)
+    params = []
+    params_by_name = set()
+    accepted = []
+    owners = set()
+    for index, item in items:
+        device = devices.get(item.device_name)
+        if device is None:
+            results[index] = _rejected(index, f"Device {item.device_name} not found")
+        elif item.device_name in params_by_name:
+            results[index] = _rejected(index, f"Duplicate device {item.device_name}")
+        elif device.status == Status.active:
+            results[index] = _rejected(
+                index, f"Device {item.device_name} has been assigned to a user"
+            )
+        elif item.username not in users:
+            results[index] = _rejected(index, f"User {item.username} not found")
+        else:
+            user_id = users[item.username]
+            owners.update({device.user_id, user_id})
+            params_by_name.add(item.device_name)
+            params.append(
+                {
+                    "b_id": device.id,
+                    "b_user_id": user_id,
+                    "b_lat": item.lat,
+                    "b_lon": item.lon,
+                    "b_geohash": geohash.encode(item.lat, item.lon),
+                    "b_serial_num": item.serial_num,
+                    "b_description": item.description,
+                }
+            )
+            accepted.append((index, device, user_id))
+
+    try:
+        if params:
+            # executemany: one prepared UPDATE, rows sent in a single batch
+            connection = await session.connection()
+            await connection.execute(
+                update(Device.__table__)
+                .where(Device.__table__.c.id == bindparam("b_id"))
+                .values(
+                    user_id=bindparam("b_user_id"),
+                    lat=bindparam("b_lat"),
+                    lon=bindparam("b_lon"),
+                    geohash=bindparam("b_geohash"),
+                    serial_num=bindparam("b_serial_num"),
+                    description=bindparam("b_description"),
+                    status=Status.active,
+                    modified_at=now,
+                ),
+                params,
+            )
+        await session.commit()
+    except Exception as ex:
+        print(str(ex))
+        await session.rollback()
+        raise HTTPException(
+            status_code=500, detail="Something went wrong. Rollback has occured"
+        )
+    await device_repository.invalidate_owned_devices(*owners)
+    await response_cache.responses.invalidate()
+    for index, device, user_id in accepted:
+        results[index] = DeviceBulkItemResponse(
+            index=index,
+            ok=True,
+            device=DeviceAssignResponse(
+                id=device.id, name=device.name, user_id=user_id, status=Status.active
+            ),
+        )
+    return _bulk_response(results)
+
+
+async def _bulk_unassign(
+    session: AsyncSession, items: list, results: dict
+) -> DeviceBulkResponse:
+    # locked until commit, so the previous owners invalidated below are current
+    result = await session.exec(
+        select(Device.id, Device.name, Device.user_id)
+        .where(Device.name.in_({item.device_name for _, item in items}))
+        .order_by(Device.id)
+        .with_for_update()
+    )
+    devices = {device.name: device for device in result.all()}
+
+    accepted = {}
+    for index, item in items:
+        device = devices.get(item.device_name)
+        if device is None:
+            results[index] = _rejected(index, f"Device {item.device_name} not found")
+        elif item.device_name in accepted:
+            results[index] = _rejected(index, f"Duplicate device {item.device_name}")
+        else:
+            accepted[item.device_name] = (index, device)
+
+    try:
+        if accepted:
+            await session.exec(
+                update(Device)
+                .where(Device.id.in_([device.id for _, device in accepted.values()]))
+                .values(
+                    user_id=None,
+                    status=Status.inactive,
+                    modified_at=datetime.now(timezone),
+                )
+                .execution_options(synchronize_session=False)
+            )
+        await session.commit()
+    except Exception as ex:
+        print(str(ex))
+        await session.rollback()
+        raise HTTPException(
+            status_code=500, detail="Something went wrong. Rollback has occured"
+        )
+    await device_repository.invalidate_owned_devices(
+        *(device.user_id for _, device in accepted.values())
+    )
+    await response_cache.responses.invalidate()
+    for index, device in accepted.values():
+        results[index] = DeviceBulkItemResponse(
+            index=index,
+            ok=True,
+            device=DeviceAssignResponse(
+                id=device.id, name=device.name, user_id=None, status=Status.inactive
+            ),
+        )
+    return _bulk_response(results)
+
+
+@router.post("/bulk", response_model=DeviceBulkResponse)
+async def add_devices(
+    bulk_request: DeviceBulkCreateRequest,
+    session: AsyncSession = Depends(deps.get_session),
+    current_user: User = Depends(deps.get_current_user),
+):
+    """
+    Add many devices at once
+
+    Names already taken (or repeated in the request) are rejected one by one,
+    the others are inserted in one transaction with status Created. `results`
+    holds the outcome of each device in request order.
+    """
+    return await _bulk_create(session, list(enumerate(bulk_request.devices)), {})
+
+
+@router.post("/bulk/csv", response_model=DeviceBulkResponse)
+async def add_devices_csv(
+    file: UploadFile = File(...),
+    session: AsyncSession = Depends(deps.get_session),
+    current_user: User = Depends(deps.get_current_user),
+):
+    """
+    Add many devices from a CSV upload
+
+    Columns: `name`, `serial_num`, `description`. `results` indexes are data
+    rows (header excluded), otherwise same as the JSON version.
+    """
+    items, results = await _read_csv(file, DeviceCreateRequest)
+    return await _bulk_create(session, items, results)
+
+
+@router.post("/bulk/assign", response_model=DeviceBulkResponse)
+async def assign_devices(
+    bulk_request: DeviceBulkAssignRequest,
+    session: AsyncSession = Depends(deps.get_session),
+    current_user: User = Depends(deps.get_current_user),
+):
+    """
+    Assign many devices, each to a user given by username
+
+    Same prerequisites and effect as assigning a single device, devices
+    already assigned and unknown devices or users are rejected one by one.
+    """
+    return await _bulk_assign(session, list(enumerate(bulk_request.devices)), {})
+
+
+@router.post("/bulk/assign/csv", response_model=DeviceBulkResponse)
+async def assign_devices_csv(
+    file: UploadFile = File(...),
+    session: AsyncSession = Depends(deps.get_session),
+    current_user: User = Depends(deps.get_current_user),
+):
+    """
+    Assign many devices from a CSV upload
+
+    Columns: `device_name`, `username`, `lat`, `lon`, `serial_num`,
+    `description`.
+    """
+    items, results = await _read_csv(file, DeviceBulkAssignItemRequest)
+    return await _bulk_assign(session, items, results)
+
+
+@router.post("/bulk/unassign", response_model=DeviceBulkResponse)
+async def unassign_devices(
+    bulk_request: DeviceBulkUnassignRequest,
+    session: AsyncSession = Depends(deps.get_session),
+    current_user: User = Depends(deps.get_current_user),
+):
+    """
+    Unassign many devices from their users, status will be set to Inactive
+    """
+    return await _bulk_unassign(session, list(enumerate(bulk_request.devices)), {})
+
+
+@router.post("/bulk/unassign/csv", response_model=DeviceBulkResponse)
+async def unassign_devices_csv(
+    file: UploadFile = File(...),
+    session: AsyncSession = Depends(deps.get_session),
+    current_user: User = Depends(deps.get_current_user),
+):
+    """
+    Unassign many devices from a CSV upload
+
+    Columns: `device_name`.
+    """
+    items, results = await _read_csv(file, DeviceBulkUnassignItemRequest)
+    return await _bulk_unassign(session, items, results)
+
+
 @router.post("/{device_id}/assign/{user_id}", response_model=DeviceAssignResponse)
 async def assign_device_to_user(
     req: DeviceAssignRequest,
@@ -150,16 +687,20 @@ async def assign_device_to_user(
         raise HTTPException(
             status_code=400, detail="User id {} not found".format(user_id)
         )
+    previous_owner = device.user_id
     try:
         device.user_id = user.id
         device.lat = req.lat
         device.lon = req.lon
+        device.geohash = geohash.encode(req.lat, req.lon)
         device.serial_num = req.serial_num
         device.description = req.description
         device.status = Status.active
         device.modified_at = datetime.now(timezone)
         session.add(device)
         await session.commit()
+        await device_repository.invalidate_owned_devices(previous_owner, user.id)
+        await response_cache.responses.invalidate()
         await session.refresh(device)
         return device
     except Exception:
@@ -195,12 +736,15 @@ async def unassign_device_from_user(
         raise HTTPException(
             status_code=400, detail="User id {} not found".format(user_id)
         )
+    previous_owner = device.user_id
     try:
         device.user_id = None
         device.modified_at = datetime.now(timezone)
         device.status = Status.inactive
         session.add(device)
         await session.commit()
+        await device_repository.invalidate_owned_devices(previous_owner)
+        await response_cache.responses.invalidate()
         await session.refresh(device)
         return device
     except Exception:
@@ -231,9 +775,12 @@ async def update_devices_profile(
     try:
         for k, v in device_data.dict().items():
             setattr(device, k, v)
+        setattr(device, "geohash", geohash.encode(device.lat, device.lon))
         setattr(device, "modified_at", datetime.now(timezone))
         session.add(device)
         await session.commit()
+        await device_repository.invalidate_owned_devices(device.user_id)
+        await response_cache.responses.invalidate()
         await session.refresh(device)
         return device
     except Exception as ex:
@@ -269,18 +816,16 @@ async def delete_device(
     if device.status == Status.inactive:
         # check whether device has invoices
         result = await session.exec(
-            select(Invoice, Device)
-            .join(Device)
-            .where(Device.id == id)
-            .where(Device.status == Status.inactive)
+            select(Invoice.id).where(Invoice.device_name == device.name).limit(1)
         )
-        devices = result.fetchmany(1)
-        if len(devices) != 0:
+        if result.first() is not None:
             raise HTTPException(status_code=400, detail="Device has invoices")
 
     try:
         await session.exec(delete(Device).where(Device.id == id))
         await session.commit()
+        await device_repository.invalidate_owned_devices(device.user_id)
+        await response_cache.responses.invalidate()
         return {"Ok": True, "message": f"Device {id} has been deleted"}
     except Exception:
         await session.rollback()
@@ -1,25 +1,128 @@
-from datetime import datetime
+import hashlib
+import uuid
+from datetime import date, datetime, time
+from decimal import Decimal
+from typing import Optional
 
 import pytz
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import StreamingResponse
+from sqlalchemy import String, cast, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import sessionmaker
 from sqlmodel import select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.api import deps
+from app.core import cache, export, metrics, outbox, rollups
 from app.core.config import settings
-from app.model.models import Device, Invoice, User
-from app.schemas.requests import InvoiceBaseRequest
-from app.schemas.responses import InvoiceBaseResponse
+from app.model.models import Invoice, Outbox, Role, User
+from app.repository import devices as device_repository
+from app.schemas.requests import ExportFormat, InvoiceBaseRequest, InvoiceBatchRequest
+from app.schemas.responses import (
+    InvoiceBaseResponse,
+    InvoiceBatchItemResponse,
+    InvoiceBatchResponse,
+)
 
 timezone = pytz.timezone(settings.TIMEZONE)
 router = APIRouter()
 
+# responses by Idempotency-Key, see `_replay`
+idempotency_cache = cache.create_cache(
+    "idempotency",
+    ttl=settings.IDEMPOTENCY_CACHE_TTL_SECONDS,
+    max_size=settings.IDEMPOTENCY_CACHE_MAX_SIZE,
+)
+
+# asyncpg accepts at most 32767 bind parameters per statement
+MAX_INVOICES_PER_INSERT = 32767 // len(Invoice.__table__.columns)
+INVOICE_COLUMNS = (
+    Invoice.id,
+    Invoice.device_name,
+    Invoice.username,
+    Invoice.invoice_num,
+    Invoice.invoice_date,
+    Invoice.tax_value,
+    Invoice.total_value,
+)
+# an invoice is identified by its number and date on a device, resubmissions
+# are ignored (the date is part of the key as invoice is partitioned by it)
+INVOICE_KEY = (Invoice.device_name, Invoice.invoice_num, Invoice.invoice_date)
+EXPORT_COLUMNS = (
+    "id",
+    "invoice_num",
+    "invoice_date",
+    "device_name",
+    "username",
+    "tax_value",
+    "total_value",
+)
+
+
+def _invoice_values(
+    invoice_request: InvoiceBaseRequest, username: str, now: datetime
+) -> dict:
+    invoice_date = invoice_request.invoice_date
+    if invoice_date.tzinfo is None:
+        # asyncpg stores naive datetimes as UTC, keep keys comparable with the db
+        invoice_date = invoice_date.replace(tzinfo=pytz.utc)
+    return {
+        "id": uuid.uuid4(),
+        "invoice_num": invoice_request.invoice_num,
+        "invoice_date": invoice_date,
+        "device_name": invoice_request.device_name,
+        "username": username,
+        "tax_value": invoice_request.tax_value,
+        "total_value": invoice_request.total_value,
+        "created_at": now,
+        "modified_at": now,
+    }
+
+
+def _fingerprint(request) -> str:
+    return hashlib.sha256(request.json().encode()).hexdigest()
+
+
+async def _replay(key: Optional[str], request) -> Optional[dict]:
+    """Response stored for Idempotency-Key `key`, None on first use
+
+    Reusing a key for a different request is rejected. When the cache lost
+    the key the write path runs again and the database uniqueness of
+    invoices keeps it from storing duplicates.
+    """
+    if not key:
+        return None
+    stored = await idempotency_cache.get(key)
+    if stored is None:
+        return None
+    if stored["fingerprint"] != _fingerprint(request):
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key was already used for a different request",
+        )
+    return stored["response"]
+
+
+async def _remember(key: Optional[str], request, response) -> None:
+    if key:
+        await idempotency_cache.set(
+            key,
+            {
+                "fingerprint": _fingerprint(request),
+                # Decimal as str, floats could change the amounts
+                "response": jsonable_encoder(response, custom_encoder={Decimal: str}),
+            },
+        )
+
 
 @router.post("/", response_model=InvoiceBaseResponse)
 async def submit_invoice(
     invoice_request: InvoiceBaseRequest,
     current_user: User = Depends(deps.get_current_user),
     session: AsyncSession = Depends(deps.get_session),
+    idempotency_key: Optional[str] = Header(None, min_length=1, max_length=255),
 ):
     """
     Submit invoice data.
@@ -28,40 +131,265 @@ async def submit_invoice(
     1. Device has been registered/added (as Administrator)
     2. Device has been assigned to a user (as Administrator)
     3. Login to get token then use the access token as Bearer token
+
+    Submitting an invoice number again for the same device is idempotent,
+    the invoice stored the first time is returned. Retries sending the same
+    `Idempotency-Key` header get the first response from cache.
     """
-    result = await session.exec(select(Device).where(Device.user_id == current_user.id))
-    devices = result.fetchall()
-    if len(devices) == 0:
+    cache_key = (
+        f"invoice:{current_user.id}:{idempotency_key}" if idempotency_key else None
+    )
+    replayed = await _replay(cache_key, invoice_request)
+    if replayed is not None:
+        return replayed
+
+    device_names = await device_repository.owned_device_names(session, current_user.id)
+    if len(device_names) == 0:
         raise HTTPException(status_code=400, detail="User has no device(s)")
-    found = False
-    for dev in devices:
-        if dev.name == invoice_request.device_name:
-            found = True
-    if not found:
+    if invoice_request.device_name not in device_names:
         raise HTTPException(
             status_code=400, detail=f"User has no device {invoice_request.device_name}"
         )
     try:
-        invoice = Invoice(
-            invoice_num=invoice_request.invoice_num,
-            invoice_date=invoice_request.invoice_date,
-            device_name=invoice_request.device_name,
-            username=current_user.username,
-            tax_value=invoice_request.tax_value,
-            total_value=invoice_request.total_value,
-            created_at=datetime.now(timezone).strftime("%Y-%m-%d %H:%M:%S"),
-            modified_at=datetime.now(timezone).strftime("%Y-%m-%d %H:%M:%S"),
+        now = datetime.now(timezone)
+        values = _invoice_values(invoice_request, current_user.username, now)
+        result = await session.exec(
+            insert(Invoice)
+            .values(values)
+            .on_conflict_do_nothing(index_elements=INVOICE_KEY)
+            .returning(*INVOICE_COLUMNS)
         )
-        session.add(invoice)
+        invoice = result.one_or_none()
+        if invoice is None:
+            # resubmitted, nothing to stream or count again
+            await session.rollback()
+            result = await session.exec(
+                select(*INVOICE_COLUMNS)
+                .where(Invoice.device_name == invoice_request.device_name)
+                .where(Invoice.invoice_num == invoice_request.invoice_num)
+                .where(Invoice.invoice_date == values["invoice_date"])
+            )
+            response = InvoiceBaseResponse(**result.one()._mapping)
+            metrics.INVOICES.labels("single", "duplicate").inc()
+            await _remember(cache_key, invoice_request, response)
+            return response
+        # streamed to kinesis by the outbox relay once committed
+        await session.exec(insert(Outbox).values(outbox.invoice_event(invoice, now)))
+        await rollups.add_invoices(session, [invoice])
         await session.commit()
-        await session.refresh(invoice)
-        # # TODO: put record in kinesis stream
-        # task = task_put_invoice.delay(**json.loads(invoice_request.json()))
-        return invoice
+        metrics.INVOICES.labels("single", "stored").inc()
+        response = InvoiceBaseResponse(**invoice._mapping)
+        await _remember(cache_key, invoice_request, response)
+        return response
+
+    except Exception as ex:
+        print(str(ex))
+        await session.rollback()
+        raise HTTPException(
+            status_code=500, detail="Something went wrong. Contact your admin"
+        )
+
+
+@router.post("/batch", response_model=InvoiceBatchResponse)
+async def submit_invoice_batch(
+    batch_request: InvoiceBatchRequest,
+    current_user: User = Depends(deps.get_current_user),
+    session: AsyncSession = Depends(deps.get_session),
+    idempotency_key: Optional[str] = Header(None, min_length=1, max_length=255),
+):
+    """
+    Submit many invoices at once (e.g. end-of-day flush of a device).
+
+    Device ownership is checked once for the whole batch, then every accepted
+    invoice is written with a multi-row INSERT ... RETURNING in one transaction.
+    Invoices for devices that do not belong to the user are rejected one by one,
+    `results` holds the outcome of each invoice in request order. Invoices
+    submitted before are reported with the invoice stored the first time.
+    Retries sending the same `Idempotency-Key` header get the first response
+    from cache.
+    """
+    cache_key = (
+        f"batch:{current_user.id}:{idempotency_key}" if idempotency_key else None
+    )
+    replayed = await _replay(cache_key, batch_request)
+    if replayed is not None:
+        return replayed
+
+    device_names = await device_repository.owned_device_names(session, current_user.id)
+    if len(device_names) == 0:
+        raise HTTPException(status_code=400, detail="User has no device(s)")
 
+    now = datetime.now(timezone)
+    results: list[InvoiceBatchItemResponse | None] = [None] * len(
+        batch_request.invoices
+    )
+    rows = {}
+    for index, invoice_request in enumerate(batch_request.invoices):
+        if invoice_request.device_name not in device_names:
+            results[index] = InvoiceBatchItemResponse(
+                index=index,
+                ok=False,
+                detail=f"User has no device {invoice_request.device_name}",
+            )
+            continue
+        values = _invoice_values(invoice_request, current_user.username, now)
+        rows[values["id"]] = (index, values)
+
+    values = [row for _, row in rows.values()]
+    stored_count = 0
+    try:
+        for start in range(0, len(values), MAX_INVOICES_PER_INSERT):
+            result = await session.exec(
+                insert(Invoice)
+                .values(values[start : start + MAX_INVOICES_PER_INSERT])
+                .on_conflict_do_nothing(index_elements=INVOICE_KEY)
+                .returning(*INVOICE_COLUMNS)
+            )
+            invoices = result.all()
+            stored_count += len(invoices)
+            for invoice in invoices:
+                index, _ = rows.pop(invoice.id)
+                results[index] = InvoiceBatchItemResponse(
+                    index=index,
+                    ok=True,
+                    invoice=InvoiceBaseResponse(**invoice._mapping),
+                )
+            if invoices:
+                await session.exec(
+                    insert(Outbox).values(
+                        [outbox.invoice_event(invoice, now) for invoice in invoices]
+                    )
+                )
+                await rollups.add_invoices(session, invoices)
+
+        if rows:
+            # not inserted: submitted before (or twice in this batch)
+            keys = [
+                (row["device_name"], row["invoice_num"], row["invoice_date"])
+                for _, row in rows.values()
+            ]
+            result = await session.exec(
+                select(*INVOICE_COLUMNS).where(tuple_(*INVOICE_KEY).in_(keys))
+            )
+            stored = {
+                (
+                    invoice.device_name,
+                    invoice.invoice_num,
+                    invoice.invoice_date,
+                ): invoice
+                for invoice in result.all()
+            }
+            for key, (index, _) in zip(keys, rows.values()):
+                results[index] = InvoiceBatchItemResponse(
+                    index=index,
+                    ok=True,
+                    detail="Invoice already submitted",
+                    invoice=InvoiceBaseResponse(**stored[key]._mapping),
+                )
+        await session.commit()
     except Exception as ex:
         print(str(ex))
         await session.rollback()
         raise HTTPException(
             status_code=500, detail="Something went wrong. Contact your admin"
         )
+
+    accepted = sum(1 for item in results if item.ok)
+    metrics.INVOICES.labels("batch", "stored").inc(stored_count)
+    metrics.INVOICES.labels("batch", "duplicate").inc(accepted - stored_count)
+    metrics.INVOICES.labels("batch", "rejected").inc(len(results) - accepted)
+    response = InvoiceBatchResponse(
+        accepted=accepted,
+        rejected=len(results) - accepted,
+        results=results,
+    )
+    await _remember(cache_key, batch_request, response)
+    return response
+
+
+def _parquet_schema():
+    return export.pyarrow.schema(
+        [
+            ("id", export.pyarrow.string()),
+            ("invoice_num", export.pyarrow.string()),
+            ("invoice_date", export.pyarrow.timestamp("us", tz="UTC")),
+            ("device_name", export.pyarrow.string()),
+            ("username", export.pyarrow.string()),
+            ("tax_value", export.pyarrow.decimal128(15, 2)),
+            ("total_value", export.pyarrow.decimal128(15, 2)),
+        ]
+    )
+
+
+@router.get("/export")
+async def export_invoices(
+    start: date,
+    end: date,
+    device_name: Optional[str] = None,
+    username: Optional[str] = None,
+    format: ExportFormat = ExportFormat.csv,
+    current_user: User = Depends(deps.get_current_user),
+    session_factory: sessionmaker = Depends(deps.get_session_factory),
+):
+    """
+    Export invoices (e.g. for tax auditors) as CSV or Parquet
+
+    * `start`, `end`: invoice date range [start, end), days in server timezone
+    * `device_name`, `username`: restrict to one device or merchant
+
+    The file is streamed (chunked transfer encoding) while it is produced,
+    CSV by Postgres COPY, Parquet in row groups from a server-side cursor, so
+    exports of millions of invoices never sit in memory. Invoices are ordered
+    by invoice date. Merchants only get their own invoices.
+    """
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    if current_user.role != Role.admin:
+        if username not in (None, current_user.username):
+            raise HTTPException(status_code=403, detail="Not allowed")
+        username = current_user.username
+    if format == ExportFormat.parquet and export.pyarrow is None:
+        raise HTTPException(status_code=400, detail="Parquet export is not available")
+
+    start_at = timezone.localize(datetime.combine(start, time.min))
+    end_at = timezone.localize(datetime.combine(end, time.min))
+    filename = f"invoices_{start}_{end}.{format.value}"
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+
+    if format == ExportFormat.parquet:
+        statement = (
+            select(
+                cast(Invoice.id, String),
+                *(getattr(Invoice, column) for column in EXPORT_COLUMNS[1:]),
+            )
+            .where(Invoice.invoice_date >= start_at)
+            .where(Invoice.invoice_date < end_at)
+            .order_by(Invoice.invoice_date)
+        )
+        if username:
+            statement = statement.where(Invoice.username == username)
+        if device_name:
+            statement = statement.where(Invoice.device_name == device_name)
+        return StreamingResponse(
+            export.parquet(session_factory, statement, _parquet_schema()),
+            media_type="application/vnd.apache.parquet",
+            headers=headers,
+        )
+
+    args = [start_at, end_at]
+    filters = ["invoice_date >= $1", "invoice_date < $2"]
+    if username:
+        args.append(username)
+        filters.append(f"username = ${len(args)}")
+    if device_name:
+        args.append(device_name)
+        filters.append(f"device_name = ${len(args)}")
+    query = (
+        f"SELECT {', '.join(EXPORT_COLUMNS)} FROM invoice "
+        f"WHERE {' AND '.join(filters)} ORDER BY invoice_date"
+    )
+    return StreamingResponse(
+        export.copy_csv(session_factory, query, *args),
+        media_type="text/csv",
+        headers=headers,
+    )
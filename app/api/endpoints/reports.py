@@ -0,0 +1,80 @@
+import datetime
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy import Date, cast, func
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.api import deps
+from app.core import serialization
+from app.core.rollups import inline_literal
+from app.model.models import InvoiceDailyRollup, Role, User
+from app.schemas.requests import ReportGroup, ReportPeriod
+from app.schemas.responses import TaxReportResponse
+
+router = APIRouter()
+
+
+@router.get("/tax", response_model=List[TaxReportResponse])
+async def get_tax_report(
+    start: datetime.date,
+    end: datetime.date,
+    period: ReportPeriod = ReportPeriod.day,
+    group_by: Optional[ReportGroup] = None,
+    username: Optional[str] = None,
+    device_name: Optional[str] = None,
+    current_user: User = Depends(deps.get_current_user),
+    session: AsyncSession = Depends(deps.get_read_session),
+):
+    """
+    Tax and total value of invoices per day, week or month
+
+    * `start`, `end`: invoice date range [start, end), days in server timezone
+    * `group_by`: totals per merchant or per device, overall totals when empty
+    * `username`, `device_name`: restrict to one merchant or device
+
+    Merchants only get their own invoices. Totals come from the daily rollups,
+    never from a scan of the invoice table.
+    """
+    if end <= start:
+        raise HTTPException(status_code=400, detail="end must be after start")
+    if current_user.role != Role.admin:
+        if username not in (None, current_user.username):
+            raise HTTPException(status_code=403, detail="Not allowed")
+        username = current_user.username
+
+    rollup = InvoiceDailyRollup
+    bucket = cast(
+        func.date_trunc(inline_literal(period.value), rollup.day), Date
+    ).label("period")
+    columns = [bucket]
+    if group_by == ReportGroup.merchant:
+        columns.append(rollup.username)
+    elif group_by == ReportGroup.device:
+        columns += [rollup.device_name, rollup.username]
+    statement = (
+        select(
+            *columns,
+            func.sum(rollup.invoice_count).label("invoice_count"),
+            func.sum(rollup.tax_value).label("tax_value"),
+            func.sum(rollup.total_value).label("total_value"),
+        )
+        .where(rollup.day >= start)
+        .where(rollup.day < end)
+        .group_by(*columns)
+        .order_by(*columns)
+    )
+    if username:
+        statement = statement.where(rollup.username == username)
+    if device_name:
+        statement = statement.where(rollup.device_name == device_name)
+
+    result = await session.exec(statement)
+    # ungrouped reports have no username/device_name columns
+    return serialization.FastJSONResponse(
+        [
+            {"username": None, "device_name": None, **row._mapping}
+            for row in result.all()
+        ]
+    )
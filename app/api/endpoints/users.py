@@ -1,17 +1,21 @@
 import json
 import uuid
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
 import pytz
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import sessionmaker
 from sqlmodel import delete, select
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.api import deps
+from app.core import pagination, response_cache, serialization
 from app.core.config import settings
-from app.core.security import get_password_hash
-from app.model.models import Device, User
+from app.core.hashing import password_hasher
+from app.model.models import Role, User
+from app.repository import users as user_repository
 from app.schemas.requests import (
     UserCreateRequest,
     UserUpdatePasswordRequest,
@@ -26,25 +30,11 @@ timezone = pytz.timezone(settings.TIMEZONE)
 @router.get("/me", response_model=UserDeviceInResponse)
 async def read_current_user(
     current_user: User = Depends(deps.get_current_user),
-    session: AsyncSession = Depends(deps.get_session),
+    session: AsyncSession = Depends(deps.get_read_session),
 ):
     """Get current user"""
     try:
-        result = await session.exec(
-            select(Device).where(Device.user_id == current_user.id)
-        )
-        devices = result.fetchall()
-        response = UserDeviceInResponse(
-            id=current_user.id,
-            username=current_user.username,
-            nik=current_user.nik,
-            first_name=current_user.first_name,
-            last_name=current_user.last_name,
-            address=current_user.address,
-            role=current_user.role,
-            devices=devices,
-        )
-        return response
+        return await user_repository.get_with_devices(session, current_user.id)
     except Exception as ex:
         print(str(ex))
         raise HTTPException(
@@ -66,6 +56,8 @@ async def update_profile(
         session.add(current_user)
         await session.commit()
         await session.refresh(current_user)
+        await deps.invalidate_principal(current_user.id)
+        await response_cache.responses.invalidate()
         return current_user
     except Exception:
         await session.rollback()
@@ -74,37 +66,55 @@ async def update_profile(
         )
 
 
+@router.get("/with-devices", response_model=List[UserDeviceInResponse])
+async def get_user_list_with_devices(
+    response: Response,
+    current_user: User = Depends(deps.get_current_user),
+    session: AsyncSession = Depends(deps.get_read_session),
+    role: Optional[Role] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+):
+    """
+    Get user list with the devices of every user
+
+    Same ordering, filters and `X-Next-Cursor` paging as the user list. The
+    users of the page and all their devices are loaded with a single query.
+    """
+    users, next_cursor = await user_repository.list_with_devices(
+        session, role, created_from, created_to, cursor, limit
+    )
+    if next_cursor:
+        response.headers[pagination.NEXT_CURSOR_HEADER] = next_cursor
+    return users
+
+
 @router.get("/{id}", response_model=UserDeviceInResponse)
 async def get_user_by_id(
     id: uuid.UUID,
+    request: Request,
     current_user: User = Depends(deps.get_current_user),
-    session: AsyncSession = Depends(deps.get_session),
+    session_factory: sessionmaker = Depends(deps.get_session_factory),
 ):
-    """Get user detail by id"""
+    """
+    Get user detail by id
 
-    result = await session.exec(select(User).where(User.id == id))
-    user = result.one_or_none()
+    Cached until the next device or user change, see `get_device_list` for
+    `ETag` and `Last-Modified`.
+    """
+    key = await response_cache.responses.key(request, current_user.id)
+    cached = await response_cache.responses.get(request, key)
+    if cached is not None:
+        return cached
+    async with response_cache.responses.session_factory(session_factory)() as session:
+        user, last_modified = await user_repository.get_with_devices_modified(
+            session, id
+        )
     if user is None:
         raise HTTPException(status_code=400, detail=f"User with id {id} not found")
-    try:
-        result = await session.exec(select(Device).where(Device.user_id == id))
-        devices = result.fetchall()
-        response = UserDeviceInResponse(
-            id=user.id,
-            username=user.username,
-            nik=user.nik,
-            first_name=user.first_name,
-            last_name=user.last_name,
-            address=user.address,
-            role=user.role,
-            devices=devices,
-        )
-        return response
-    except Exception as ex:
-        print(str(ex))
-        raise HTTPException(
-            status_code=500, detail="Something went wrong. Contact your admin"
-        )
+    return await response_cache.responses.set(request, key, user.dict(), last_modified)
 
 
 @router.delete("/{id}")
@@ -130,6 +140,8 @@ async def delete_user_by_id(
     try:
         await session.exec(delete(User).where(User.id == id))
         await session.commit()
+        await deps.invalidate_principal(id)
+        await response_cache.responses.invalidate()
         return {"ok": True, "message": f"Delete {id} was successful"}
     except Exception:
         await session.rollback()
@@ -146,10 +158,13 @@ async def reset_current_user_password(
 ):
     """Update current user password"""
     try:
-        current_user.hashed_password = get_password_hash(user_update_password.password)
+        current_user.hashed_password = await password_hasher.hash(
+            user_update_password.password
+        )
         current_user.modified_at = datetime.now(timezone)
         session.add(current_user)
         await session.commit()
+        await deps.invalidate_principal(current_user.id)
         return current_user
     except Exception:
         await session.rollback()
@@ -173,7 +188,7 @@ async def register_new_user(
     try:
         user = User(
             username=new_user.username,
-            hashed_password=get_password_hash(new_user.password),
+            hashed_password=await password_hasher.hash(new_user.password),
             role=new_user.role,
             created_at=datetime.now(timezone),
             modified_at=datetime.now(timezone),
@@ -186,12 +201,72 @@ async def register_new_user(
         raise HTTPException(status_code=500, detail=json.dumps(str(e)))
 
 
+def _user_list_statement(
+    role: Optional[Role],
+    created_from: Optional[datetime],
+    created_to: Optional[datetime],
+):
+    # only the columns BaseUserResponse needs (+ created_at for the cursor)
+    statement = select(User.id, User.username, User.role, User.created_at)
+    if role:
+        statement = statement.where(User.role == role)
+    if created_from:
+        statement = statement.where(User.created_at >= created_from)
+    if created_to:
+        statement = statement.where(User.created_at < created_to)
+    return statement
+
+
+async def _stream_users(session_factory, statement):
+    # own session: the request scoped one may be closed before streaming ends
+    async with session_factory() as session:
+        result = await session.stream(statement)
+        async for user in result:
+            yield serialization.dumps(
+                {"id": user.id, "username": user.username, "role": user.role}
+            ) + b"\n"
+
+
 @router.get("/", response_model=List[BaseUserResponse])
 async def get_user_list(
     current_user: User = Depends(deps.get_current_user),
-    session: AsyncSession = Depends(deps.get_session),
+    session: AsyncSession = Depends(deps.get_read_session),
+    session_factory: sessionmaker = Depends(deps.get_session_factory),
+    role: Optional[Role] = None,
+    created_from: Optional[datetime] = None,
+    created_to: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    stream: bool = False,
 ):
-    """Get user list"""
-    result = await session.exec(select(User))
-    users = result.all()
-    return users
+    """
+    Get user list
+
+    Users are ordered by creation time and can be filtered by `role` and
+    creation time range [`created_from`, `created_to`). Pass the `X-Next-Cursor`
+    response header as `cursor` to get the next page, the header is missing on
+    the last page.
+
+    With `stream=true` all matching users (after `cursor`, `limit` is ignored)
+    are exported as NDJSON, one user per line, from a server-side cursor.
+    """
+    statement = _user_list_statement(role, created_from, created_to)
+    if stream:
+        return StreamingResponse(
+            _stream_users(
+                session_factory,
+                pagination.paginate(statement, User, cursor, limit=None),
+            ),
+            media_type="application/x-ndjson",
+        )
+
+    result = await session.exec(pagination.paginate(statement, User, cursor, limit))
+    users = result.fetchall()
+    next_cursor = pagination.next_cursor(users, limit)
+    return serialization.FastJSONResponse(
+        [
+            {"id": user.id, "username": user.username, "role": user.role}
+            for user in users
+        ],
+        headers={pagination.NEXT_CURSOR_HEADER: next_cursor} if next_cursor else None,
+    )
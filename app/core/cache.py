@@ -0,0 +1,145 @@
+"""
+Async key-value caches with a TTL, used to keep hot lookups away from Postgres.
+
+Backend is chosen with `CACHE_BACKEND`:
+
+* `memory` (default) - per process dict with LRU eviction bounded by `max_size`.
+  Invalidation only reaches the current process, entries cached by other
+  workers go away with their TTL.
+* `redis` - shared by every worker, so invalidation is global. Uses the Redis
+  server Celery already depends on (`REDIS_URL`). Values must be JSON
+  serializable, UUID and datetime are stored as strings, sets as lists.
+* `none` - caching disabled.
+
+Caches whose invalidation must reach every process (they back authorization
+decisions) are created with `shared=True`: on the `memory` backend they are
+disabled when the app runs more than one process (`WEB_CONCURRENCY`).
+
+Cache errors never fail a request, a broken Redis behaves like an empty cache.
+"""
+
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Optional
+
+from app.core import config
+
+logger = logging.getLogger(__name__)
+
+
+class Cache:
+    # False for the disabled cache, which never stores anything
+    enabled = False
+
+    def __init__(self, namespace: str, ttl: float):
+        self.namespace = namespace
+        self.ttl = ttl
+
+    async def get(self, key: str) -> Optional[Any]:
+        return None
+
+    async def set(self, key: str, value: Any) -> None:
+        pass
+
+    async def delete(self, key: str) -> None:
+        pass
+
+
+class MemoryCache(Cache):
+    enabled = True
+
+    def __init__(self, namespace: str, ttl: float, max_size: int):
+        super().__init__(namespace, ttl)
+        self.max_size = max_size
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def set(self, key: str, value: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def delete(self, key: str) -> None:
+        self._entries.pop(key, None)
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+    return str(value)
+
+
+class RedisCache(Cache):
+    enabled = True
+
+    def __init__(self, namespace: str, ttl: float, url: str):
+        from redis import asyncio as aioredis
+
+        super().__init__(namespace, ttl)
+        self._client = aioredis.from_url(url)
+
+    def _key(self, key: str) -> str:
+        return f"taxmon:{self.namespace}:{key}"
+
+    async def get(self, key: str) -> Optional[Any]:
+        try:
+            value = await self._client.get(self._key(key))
+        except Exception as ex:
+            logger.warning("cache %s get failed: %s", self.namespace, ex)
+            return None
+        return None if value is None else json.loads(value)
+
+    async def set(self, key: str, value: Any) -> None:
+        try:
+            await self._client.set(
+                self._key(key),
+                json.dumps(value, default=_json_default),
+                px=int(self.ttl * 1000),
+            )
+        except Exception as ex:
+            logger.warning("cache %s set failed: %s", self.namespace, ex)
+
+    async def delete(self, key: str) -> None:
+        try:
+            await self._client.delete(self._key(key))
+        except Exception as ex:
+            logger.warning("cache %s delete failed: %s", self.namespace, ex)
+
+
+def is_shared() -> bool:
+    """Whether every app process sees the same entries (and invalidations)"""
+    if config.settings.CACHE_BACKEND == "memory":
+        return config.settings.WEB_CONCURRENCY == 1
+    return config.settings.CACHE_BACKEND == "redis"
+
+
+def create_cache(
+    namespace: str, ttl: float, max_size: int, shared: bool = False
+) -> Cache:
+    """Create cache for `namespace` on the configured `CACHE_BACKEND`, with
+    `shared` only if invalidation reaches every app process"""
+    if config.settings.CACHE_BACKEND == "redis":
+        return RedisCache(namespace, ttl, config.settings.REDIS_URL)
+    if config.settings.CACHE_BACKEND == "memory":
+        if shared and not is_shared():
+            logger.warning(
+                "cache %s disabled, it needs CACHE_BACKEND=redis with %s processes",
+                namespace,
+                config.settings.WEB_CONCURRENCY,
+            )
+            return Cache(namespace, ttl)
+        return MemoryCache(namespace, ttl, max_size)
+    return Cache(namespace, ttl)
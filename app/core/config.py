@@ -21,8 +21,9 @@ See https://pydantic-docs.helpmanual.io/usage/settings/
 Note, complex types like lists are read as json-encoded strings.
 """
 
+import os
 from pathlib import Path
-from typing import Literal
+from typing import Literal, Optional
 
 import toml
 from pydantic import AnyHttpUrl, BaseSettings, EmailStr, PostgresDsn, validator
@@ -37,10 +38,64 @@ class Settings(BaseSettings):
     SECRET_KEY: str
     ENVIRONMENT: Literal["DEV", "PYTEST", "STG", "PRD"] = "DEV"
     SECURITY_BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASHER_EXECUTOR: Literal["thread", "process"] = "thread"
+    PASSWORD_HASHER_WORKERS: int = 2
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 11520  # 8 days
     REFRESH_TOKEN_EXPIRE_MINUTES: int = 40320  # 28 days
     BACKEND_CORS_ORIGINS: list[AnyHttpUrl] = []
     ALLOWED_HOSTS: list[str] = ["localhost"]
+    INVOICE_BATCH_MAX_SIZE: int = 2000
+    # invoice dates accepted by bulk imports, relative to now
+    IMPORT_MAX_INVOICE_AGE_DAYS: int = 3650
+    IMPORT_MAX_INVOICE_AHEAD_DAYS: int = 1
+    DEVICE_BULK_MAX_SIZE: int = 5000
+
+    # CACHES, use redis with more than one process (WEB_CONCURRENCY): memory
+    # caches only invalidate in their own process, see app/core/cache.py
+    CACHE_BACKEND: Literal["memory", "redis", "none"] = "memory"
+    REDIS_URL: str = "redis://localhost:6379/0"
+    PRINCIPAL_CACHE_TTL_SECONDS: int = 60
+    PRINCIPAL_CACHE_MAX_SIZE: int = 10000
+    IDEMPOTENCY_CACHE_TTL_SECONDS: int = 86400
+    IDEMPOTENCY_CACHE_MAX_SIZE: int = 100000
+    DEVICE_OWNER_CACHE_TTL_SECONDS: int = 60
+    DEVICE_OWNER_CACHE_MAX_SIZE: int = 10000
+    RESPONSE_CACHE_TTL_SECONDS: int = 30
+    RESPONSE_CACHE_MAX_SIZE: int = 10000
+
+    # CELERY WORKER AND KINESIS STREAM
+    CELERY_BROKER_URL: str = "redis://localhost:6379/0"
+    CELERY_RESULT_BACKEND: str = "redis://localhost"
+    AWS_REGION: str = "us-east-2"
+    KINESIS_STREAM_NAME: str = "invoices"
+    KINESIS_FLUSH_INTERVAL_SECONDS: float = 1.0
+    KINESIS_MAX_RETRIES: int = 5
+    OUTBOX_RELAY_BATCH_SIZE: int = 500
+    OUTBOX_RELAY_POLL_SECONDS: float = 1.0
+    CELERY_METRICS_PORT: Optional[int] = None
+
+    # DATABASE ENGINE, unset values come from the ENVIRONMENT profile
+    # (see app.core.session.ENGINE_PROFILES), pools are per process
+    DB_ECHO: Optional[bool] = None
+    DB_POOL_SIZE: Optional[int] = None
+    DB_MAX_OVERFLOW: Optional[int] = None
+    DB_POOL_PRE_PING: Optional[bool] = None
+    DB_POOL_RECYCLE_SECONDS: Optional[int] = None
+    DB_POOL_TIMEOUT_SECONDS: Optional[float] = None
+    DB_PREPARED_STATEMENT_CACHE_SIZE: Optional[int] = None
+    # app processes sharing the database, and connections kept for the rest
+    DB_RESERVED_CONNECTIONS: int = 10
+    # connections of all app processes together, caps the per process pool
+    # at DB_CONNECTION_BUDGET / WEB_CONCURRENCY. The default fits the default
+    # max_connections of Postgres (100) with DB_RESERVED_CONNECTIONS kept
+    DB_CONNECTION_BUDGET: int = 80
+
+    # APP SERVER, see app/server_config.py. 0 processes means one per CPU
+    # available, handlers are async so a process needs a single thread.
+    # Processes are replaced after WEB_MAX_REQUESTS requests (0 never)
+    WEB_CONCURRENCY: int = 0
+    WEB_MAX_REQUESTS: int = 10000
+    WEB_REQUEST_TIMEOUT_SECONDS: int = 60
 
     # PROJECT NAME, VERSION AND DESCRIPTION
     PROJECT_NAME: str = PYPROJECT_CONTENT["name"]
@@ -63,10 +118,28 @@ class Settings(BaseSettings):
     TEST_DATABASE_DB: str = "postgres"
     TEST_SQLALCHEMY_DATABASE_URI: str = ""
 
+    # POSTGRESQL READ REPLICA (optional), same user, password and database
+    # as the default one. Reads fall back to the default database while the
+    # replica lags more than REPLICA_MAX_LAG_SECONDS or is unreachable
+    REPLICA_DATABASE_HOSTNAME: Optional[str] = None
+    REPLICA_DATABASE_PORT: Optional[str] = None
+    REPLICA_SQLALCHEMY_DATABASE_URI: str = ""
+    REPLICA_MAX_LAG_SECONDS: float = 5.0
+    REPLICA_LAG_CHECK_SECONDS: float = 1.0
+
     # FIRST SUPERUSER
     FIRST_SUPERUSER_EMAIL: EmailStr
     FIRST_SUPERUSER_PASSWORD: str
 
+    @validator("WEB_CONCURRENCY")
+    def _default_web_concurrency(cls, v: int) -> int:
+        if v > 0:
+            return v
+        if hasattr(os, "sched_getaffinity"):
+            # CPUs this process may run on, less than cpu_count() when pinned
+            return len(os.sched_getaffinity(0))
+        return os.cpu_count() or 1
+
     @validator("DEFAULT_SQLALCHEMY_DATABASE_URI")
     def _assemble_default_db_connection(cls, v: str, values: dict[str, str]) -> str:
         return PostgresDsn.build(
@@ -89,6 +162,19 @@ class Settings(BaseSettings):
             path=f"/{values['TEST_DATABASE_DB']}",
         )
 
+    @validator("REPLICA_SQLALCHEMY_DATABASE_URI")
+    def _assemble_replica_db_connection(cls, v: str, values: dict[str, str]) -> str:
+        if not values.get("REPLICA_DATABASE_HOSTNAME"):
+            return ""
+        return PostgresDsn.build(
+            scheme="postgresql+asyncpg",
+            user=values["DEFAULT_DATABASE_USER"],
+            password=values["DEFAULT_DATABASE_PASSWORD"],
+            host=values["REPLICA_DATABASE_HOSTNAME"],
+            port=values["REPLICA_DATABASE_PORT"] or values["DEFAULT_DATABASE_PORT"],
+            path=f"/{values['DEFAULT_DATABASE_DB']}",
+        )
+
     class Config:
         env_file = f"{PROJECT_DIR}/.env"
         case_sensitive = True
@@ -0,0 +1,114 @@
+"""
+Streaming exports of large query results with bounded memory.
+
+* `copy_csv` - CSV produced by Postgres itself (`COPY (query) TO STDOUT`),
+  chunks are relayed to the client through a small queue, so a slow client
+  slows the COPY down instead of piling rows up in the worker.
+* `parquet` - rows fetched from a server-side cursor in batches, every batch
+  is written as a Parquet row group and sent as soon as it is encoded. Needs
+  the optional `pyarrow` package (`poetry install -E parquet`).
+
+Both open their own session from `session_factory`: they run after the
+endpoint has returned, while the response is being sent.
+"""
+
+import asyncio
+import contextlib
+from typing import AsyncIterator, Callable
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover
+    pyarrow = None
+
+COPY_QUEUE_CHUNKS = 16
+PARQUET_BATCH_ROWS = 50000
+
+
+async def copy_csv(
+    session_factory: Callable, query: str, *args, max_chunks=COPY_QUEUE_CHUNKS
+) -> AsyncIterator[bytes]:
+    """CSV with header of `query` (asyncpg style `$n` parameters)"""
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_chunks)
+
+    async def copy():
+        cancelled = False
+        try:
+            async with session_factory() as session:
+                connection = await session.connection()
+                raw = await connection.get_raw_connection()
+                await raw.driver_connection.copy_from_query(
+                    query, *args, output=queue.put, format="csv", header=True
+                )
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        finally:
+            # nobody reads the queue once cancelled, it may be full
+            if not cancelled:
+                await queue.put(None)
+
+    task = asyncio.create_task(copy())
+    try:
+        while (chunk := await queue.get()) is not None:
+            yield chunk
+        await task  # raises what failed the COPY
+    finally:
+        # client went away before the end
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+
+
+class _Sink:
+    """Write-only file object handing the written bytes over with `drain`"""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._position = 0
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self._chunks.append(data)
+        self._position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._position
+
+    def flush(self) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def parquet(
+    session_factory: Callable, statement, schema, batch_size=PARQUET_BATCH_ROWS
+) -> AsyncIterator[bytes]:
+    """Parquet file of `statement`, columns in the order of `schema`"""
+    sink = _Sink()
+    writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    async with session_factory() as session:
+        result = await session.stream(statement)
+        async for rows in result.partitions(batch_size):
+            table = pyarrow.Table.from_arrays(
+                [
+                    pyarrow.array(column, type=field.type)
+                    for column, field in zip(zip(*rows), schema)
+                ],
+                schema=schema,
+            )
+            # encoding is CPU bound, keep the event loop free
+            await asyncio.to_thread(writer.write_table, table)
+            yield sink.drain()
+    writer.close()
+    yield sink.drain()
@@ -0,0 +1,102 @@
+"""
+Geohash encoding and covering of areas, used for device location search.
+
+A geohash interleaves longitude and latitude bits into a base32 string, all
+points of a cell share the cell's geohash as prefix. Stored in a B-tree
+indexed column with the "C" collation (byte order), every cell is a range
+scan `geohash >= prefix AND geohash < prefix || '~'` ('~' sorts after every
+base32 character). An area is covered by a few cells (`cover`), the rows
+found are then filtered by exact coordinates.
+
+Areas are not split at the antimeridian, boxes are clamped to [-180, 180].
+"""
+
+import math
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+PRECISION = 12  # ~ 3.7cm x 1.9cm cells
+EARTH_RADIUS_M = 6371008.8
+# upper bound of a geohash range, sorts after every base32 character
+RANGE_END = "~"
+
+
+def encode(lat: float, lon: float, precision: int = PRECISION) -> str:
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    value = 0
+    even = True  # even bits are longitude
+    while len(chars) < precision:
+        interval, coordinate = (lon_range, lon) if even else (lat_range, lat)
+        middle = (interval[0] + interval[1]) / 2
+        value <<= 1
+        if coordinate >= middle:
+            value |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bits += 1
+        if bits == 5:
+            chars.append(BASE32[value])
+            bits = 0
+            value = 0
+    return "".join(chars)
+
+
+def cell_size(precision: int) -> tuple[float, float]:
+    """Height (degrees of latitude) and width (degrees of longitude) of a cell"""
+    lon_bits = math.ceil(5 * precision / 2)
+    lat_bits = 5 * precision - lon_bits
+    return 180.0 / 2**lat_bits, 360.0 / 2**lon_bits
+
+
+def cover(
+    min_lat: float,
+    min_lon: float,
+    max_lat: float,
+    max_lon: float,
+    max_cells: int = 16,
+) -> list[str]:
+    """Geohashes of the smallest cells covering the box, at most `max_cells`"""
+    min_lat, max_lat = max(min_lat, -90.0), min(max_lat, 90.0)
+    min_lon, max_lon = max(min_lon, -180.0), min(max_lon, 180.0)
+    cells = [""]
+    for precision in range(1, PRECISION + 1):
+        height, width = cell_size(precision)
+        rows = range(
+            _index(min_lat + 90, height, 180), _index(max_lat + 90, height, 180) + 1
+        )
+        columns = range(
+            _index(min_lon + 180, width, 360), _index(max_lon + 180, width, 360) + 1
+        )
+        if len(rows) * len(columns) > max_cells:
+            break
+        cells = [
+            encode(
+                -90 + (row + 0.5) * height,
+                -180 + (column + 0.5) * width,
+                precision,
+            )
+            for row in rows
+            for column in columns
+        ]
+    return cells
+
+
+def _index(offset: float, size: float, total: float) -> int:
+    return min(int(offset // size), int(total / size) - 1)
+
+
+def radius_box(
+    lat: float, lon: float, radius_m: float
+) -> tuple[float, float, float, float]:
+    """(min_lat, min_lon, max_lat, max_lon) of a box around the circle"""
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    cos_lat = math.cos(math.radians(lat))
+    if dlat >= 90 or cos_lat < 1e-9:
+        dlon = 180.0
+    else:
+        dlon = min(math.degrees(radius_m / (EARTH_RADIUS_M * cos_lat)), 180.0)
+    return lat - dlat, lon - dlon, lat + dlat, lon + dlon
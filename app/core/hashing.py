@@ -0,0 +1,84 @@
+"""
+Async password hashing service.
+
+bcrypt is CPU bound, see `security.verify_password`. Called directly from an
+async handler it blocks the event loop, so a single login stalls every other
+request served by the same worker. `PasswordHasher` runs hashing in a bounded
+thread or process pool (`PASSWORD_HASHER_EXECUTOR`, `PASSWORD_HASHER_WORKERS`)
+and records queue depth and wait time, see `app.core.metrics`.
+"""
+
+import asyncio
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Literal, Optional
+
+from app.core import config, metrics, security
+
+
+class PasswordHasher:
+    def __init__(
+        self, max_workers: int, executor: Literal["thread", "process"] = "thread"
+    ):
+        self.max_workers = max_workers
+        self.executor_type = executor
+        self._executor: Optional[Executor] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    @property
+    def executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_type == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="password-hasher"
+                )
+        return self._executor
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        # jobs wait here instead of in the executor queue, so the wait is measurable
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        return self._semaphore
+
+    async def _run(self, operation: str, func: Callable[..., Any], *args: Any) -> Any:
+        loop = asyncio.get_running_loop()
+        queued_at = time.perf_counter()
+        metrics.PASSWORD_HASHER_QUEUE_DEPTH.inc()
+        try:
+            await self.semaphore.acquire()
+        finally:
+            metrics.PASSWORD_HASHER_QUEUE_DEPTH.dec()
+        started_at = time.perf_counter()
+        metrics.PASSWORD_HASHER_WAIT_SECONDS.observe(started_at - queued_at)
+        try:
+            with metrics.PASSWORD_HASHER_IN_PROGRESS.track_inprogress():
+                return await loop.run_in_executor(self.executor, func, *args)
+        finally:
+            self.semaphore.release()
+            metrics.PASSWORD_HASHER_DURATION_SECONDS.labels(operation).observe(
+                time.perf_counter() - started_at
+            )
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """Async version of `security.verify_password`"""
+        return await self._run(
+            "verify", security.verify_password, plain_password, hashed_password
+        )
+
+    async def hash(self, password: str) -> str:
+        """Async version of `security.get_password_hash`"""
+        return await self._run("hash", security.get_password_hash, password)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    max_workers=config.settings.PASSWORD_HASHER_WORKERS,
+    executor=config.settings.PASSWORD_HASHER_EXECUTOR,
+)
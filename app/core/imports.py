@@ -0,0 +1,379 @@
+"""
+Bulk import of invoices from CSV or NDJSON files, see `app/import_invoices.py`.
+
+Going through `submit_invoice` costs a round trip per invoice. An import
+instead runs in four steps, every one set-based:
+
+* `load` - source rows are parsed in chunks and sent with `COPY` (asyncpg
+  `copy_records_to_table`) to the unlogged `invoice_import_staging` table.
+  Rows that do not parse are staged too, with the reason in `error`, so are
+  rows dated outside the window of `date_window` (a typo in the year would
+  otherwise create partitions for centuries).
+* `validate` - device and username references of all staged rows are checked
+  at once (anti joins), partitions are created for the dates found.
+* `merge` - valid rows are inserted into `invoice` in chunks of source lines,
+  one `INSERT ... SELECT` per chunk which also adds them to the daily rollups
+  (and to the outbox when asked). Invoices already stored are skipped, like
+  resubmissions to `submit_invoice`.
+* `write_errors` and `finish` - rejected rows go to an error file (source
+  line and reason), the staged rows are deleted.
+
+Every chunk commits together with the progress kept in `import_job`, an
+interrupted import resumes after its last committed chunk.
+
+Device ownership is not checked: legacy invoices may predate a reassignment.
+"""
+
+import csv
+import datetime
+import json
+from decimal import Decimal
+from typing import AsyncIterator, Iterable, Iterator, Optional, TextIO
+
+from sqlalchemy import exists, func, text, update
+from sqlmodel import delete, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core import partitions, rollups
+from app.core.config import settings
+from app.core.outbox import INVOICE_TOPIC
+from app.core.serialization import orjson
+from app.model.models import Device, ImportJob, ImportStatus, InvoiceImportStaging, User
+
+FORMATS = ("csv", "ndjson")
+COLUMNS = (
+    "invoice_num",
+    "invoice_date",
+    "device_name",
+    "username",
+    "tax_value",
+    "total_value",
+)
+STAGING_COLUMNS = ("job_id", "line", *COLUMNS, "error")
+LOAD_CHUNK_ROWS = 50000
+MERGE_CHUNK_LINES = 100000
+ERROR_BATCH_ROWS = 10000
+
+CENT = Decimal("0.01")
+# condecimal(max_digits=15, decimal_places=2)
+MAX_AMOUNT = Decimal(10) ** 13
+
+loads = orjson.loads if orjson is not None else json.loads
+
+# (error condition, reason) checked by `validate`
+REFERENCE_CHECKS = (
+    (
+        ~exists().where(Device.name == InvoiceImportStaging.device_name),
+        "device_name: no such device",
+    ),
+    (
+        ~exists().where(User.username == InvoiceImportStaging.username),
+        "username: no such user",
+    ),
+)
+
+MERGE = """
+WITH merged AS (
+    INSERT INTO invoice (
+        id, invoice_num, invoice_date, device_name, username,
+        tax_value, total_value, created_at, modified_at
+    )
+    SELECT gen_random_uuid(), invoice_num, invoice_date, device_name, username,
+        tax_value, total_value, :now, :now
+    FROM invoice_import_staging
+    WHERE job_id = :job_id AND line > :after AND line <= :through
+        AND error IS NULL
+    ON CONFLICT (device_name, invoice_num, invoice_date) DO NOTHING
+    RETURNING id, invoice_num, invoice_date, device_name, username,
+        tax_value, total_value
+), rollup AS (
+    INSERT INTO invoice_daily_rollup (
+        day, device_name, username, invoice_count, tax_value, total_value
+    )
+    SELECT CAST(timezone(CAST(:timezone AS text), invoice_date) AS date),
+        device_name, username, count(*), sum(tax_value), sum(total_value)
+    FROM merged
+    GROUP BY 1, 2, 3
+    ORDER BY 1, 2, 3
+    ON CONFLICT (day, device_name, username) DO UPDATE SET
+        invoice_count = invoice_daily_rollup.invoice_count
+            + excluded.invoice_count,
+        tax_value = invoice_daily_rollup.tax_value + excluded.tax_value,
+        total_value = invoice_daily_rollup.total_value + excluded.total_value
+){events}
+SELECT
+    (SELECT count(*) FROM merged),
+    (
+        SELECT count(*) FROM invoice_import_staging
+        WHERE job_id = :job_id AND line > :after AND line <= :through
+            AND error IS NULL
+    )
+"""
+
+MERGE_EVENTS = """, events AS (
+    INSERT INTO outbox (topic, payload, created_at)
+    SELECT :topic, jsonb_build_object(
+        'id', id, 'invoice_num', invoice_num, 'device_name', device_name,
+        'username', username, 'tax_value', tax_value,
+        'total_value', total_value, 'invoice_date', invoice_date
+    ), :now
+    FROM merged
+)"""
+
+
+def read_csv(file: TextIO) -> Iterator[tuple[int, Optional[dict], Optional[str]]]:
+    """(line, values, error) of the records of a CSV file with header"""
+    reader = csv.DictReader(file)
+    missing = set(COLUMNS) - set(reader.fieldnames or ())
+    if missing:
+        raise ValueError(f"CSV header misses {', '.join(sorted(missing))}")
+    for values in reader:
+        yield reader.line_num, values, None
+
+
+def read_ndjson(file: TextIO) -> Iterator[tuple[int, Optional[dict], Optional[str]]]:
+    """(line, values, error) of the objects of a newline delimited JSON file"""
+    for line, content in enumerate(file, 1):
+        if not content.strip():
+            continue
+        try:
+            yield line, loads(content), None
+        except ValueError:
+            yield line, None, "not valid JSON"
+
+
+READERS = {"csv": read_csv, "ndjson": read_ndjson}
+
+
+def _timestamp(value: str) -> datetime.datetime:
+    if not isinstance(value, str):
+        raise ValueError("not an ISO 8601 string")
+    if value.endswith(("Z", "z")):
+        value = value[:-1] + "+00:00"
+    timestamp = datetime.datetime.fromisoformat(value)
+    if timestamp.tzinfo is None:
+        # asyncpg stores naive datetimes as UTC
+        timestamp = timestamp.replace(tzinfo=datetime.timezone.utc)
+    return timestamp
+
+
+def _amount(value) -> Decimal:
+    try:
+        amount = Decimal(str(value))
+    except ArithmeticError:
+        raise ValueError("not a decimal")
+    if (
+        not amount.is_finite()
+        or abs(amount) >= MAX_AMOUNT
+        or amount.quantize(CENT) != amount
+    ):
+        raise ValueError("not a decimal of at most 15 digits, 2 decimal places")
+    return amount
+
+
+def date_window() -> tuple[datetime.datetime, datetime.datetime]:
+    """Earliest and latest invoice_date accepted from now, see the IMPORT_*
+    settings"""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return (
+        now - datetime.timedelta(days=settings.IMPORT_MAX_INVOICE_AGE_DAYS),
+        now + datetime.timedelta(days=settings.IMPORT_MAX_INVOICE_AHEAD_DAYS),
+    )
+
+
+def _parse(values, window: tuple[datetime.datetime, datetime.datetime]) -> tuple:
+    """Typed values of COLUMNS, raises ValueError with the reason"""
+    if not isinstance(values, dict):
+        raise ValueError("not an object")
+    parsed = []
+    for column in COLUMNS:
+        value = values.get(column)
+        if value is None or value == "":
+            raise ValueError(f"{column}: missing")
+        try:
+            if column == "invoice_date":
+                value = _timestamp(value)
+                if not window[0] <= value <= window[1]:
+                    raise ValueError(
+                        f"not between {window[0]:%Y-%m-%d} and {window[1]:%Y-%m-%d}"
+                    )
+            elif column in ("tax_value", "total_value"):
+                value = _amount(value)
+            else:
+                value = str(value)
+        except (ValueError, TypeError) as ex:
+            raise ValueError(f"{column}: {ex}")
+        parsed.append(value)
+    return tuple(parsed)
+
+
+def staged_row(
+    job_id,
+    line: int,
+    values,
+    error: Optional[str],
+    window: tuple[datetime.datetime, datetime.datetime],
+) -> tuple:
+    """Values of STAGING_COLUMNS for a source record, dated within `window`"""
+    if error is None:
+        try:
+            return (job_id, line, *_parse(values, window), None)
+        except ValueError as ex:
+            error = str(ex)
+    return (job_id, line, None, None, None, None, None, None, error)
+
+
+async def create_job(session: AsyncSession, filename: str, format: str) -> ImportJob:
+    now = datetime.datetime.now(rollups.timezone)
+    job = ImportJob(
+        filename=filename,
+        format=format,
+        status=ImportStatus.loading,
+        created_at=now,
+        modified_at=now,
+    )
+    session.add(job)
+    await session.commit()
+    return job
+
+
+async def _save(session: AsyncSession, job: ImportJob) -> None:
+    """Write the progress of `job`, starts the transaction of the next chunk"""
+    job.modified_at = datetime.datetime.now(rollups.timezone)
+    session.add(job)
+    await session.flush()
+
+
+async def load(
+    session: AsyncSession,
+    job: ImportJob,
+    records: Iterable[tuple[int, Optional[dict], Optional[str]]],
+    chunk_size: int = LOAD_CHUNK_ROWS,
+) -> AsyncIterator[ImportJob]:
+    """Stage `records` (see READERS) after `job.loaded_through`, one commit per
+    chunk, yields the job after every chunk"""
+    chunk: list[tuple] = []
+    line = job.loaded_through
+    window = date_window()
+    for line, values, error in records:
+        if line <= job.loaded_through:
+            continue
+        chunk.append(staged_row(job.id, line, values, error, window))
+        if len(chunk) >= chunk_size:
+            await _load_chunk(session, job, chunk, line)
+            chunk = []
+            yield job
+    await _load_chunk(session, job, chunk, max(line, job.loaded_through))
+    yield job
+
+
+async def _load_chunk(
+    session: AsyncSession, job: ImportJob, chunk: list[tuple], line: int
+) -> None:
+    job.loaded_through = line
+    job.loaded_rows += len(chunk)
+    # COPY must run in the transaction of the progress update
+    await _save(session, job)
+    if chunk:
+        connection = await session.connection()
+        raw = await connection.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            InvoiceImportStaging.__tablename__,
+            records=chunk,
+            columns=STAGING_COLUMNS,
+        )
+    await session.commit()
+
+
+async def validate(session: AsyncSession, job: ImportJob) -> None:
+    """Reject staged rows with unknown references, create missing partitions"""
+    staged = InvoiceImportStaging
+    for missing, reason in REFERENCE_CHECKS:
+        await session.exec(
+            update(staged)
+            .where(staged.job_id == job.id)
+            .where(staged.error.is_(None))
+            .where(missing)
+            .values(error=reason)
+        )
+    result = await session.exec(
+        select(
+            # partitions are only needed for the rows merged
+            func.min(staged.invoice_date).filter(staged.error.is_(None)),
+            func.max(staged.invoice_date).filter(staged.error.is_(None)),
+            func.count(staged.error),
+        ).where(staged.job_id == job.id)
+    )
+    first, last, rejected = result.one()
+    if first is not None:
+        await partitions.ensure_partitions(
+            await session.connection(),
+            rollups.invoice_day(first),
+            rollups.invoice_day(last) + datetime.timedelta(days=1),
+        )
+    job.rejected_rows = rejected
+    job.status = ImportStatus.merging
+    await _save(session, job)
+    await session.commit()
+
+
+async def merge(
+    session: AsyncSession,
+    job: ImportJob,
+    chunk_lines: int = MERGE_CHUNK_LINES,
+    events: bool = False,
+) -> AsyncIterator[ImportJob]:
+    """Insert valid staged rows after `job.merged_through` into `invoice`, one
+    commit per chunk, yields the job after every chunk
+
+    With `events` an outbox event is added for every invoice inserted.
+    """
+    statement = text(MERGE.format(events=MERGE_EVENTS if events else ""))
+    while job.merged_through < job.loaded_through:
+        through = min(job.merged_through + chunk_lines, job.loaded_through)
+        result = await session.exec(
+            statement,
+            params={
+                "job_id": job.id,
+                "after": job.merged_through,
+                "through": through,
+                "now": datetime.datetime.now(rollups.timezone),
+                "timezone": settings.TIMEZONE,
+                "topic": INVOICE_TOPIC,
+            },
+        )
+        merged, valid = result.one()
+        job.merged_through = through
+        job.merged_rows += merged
+        job.duplicate_rows += valid - merged
+        await _save(session, job)
+        await session.commit()
+        yield job
+
+
+async def write_errors(session: AsyncSession, job: ImportJob, file: TextIO) -> int:
+    """CSV of the line and reason of every rejected row, returns their count"""
+    staged = InvoiceImportStaging
+    writer = csv.writer(file)
+    writer.writerow(("line", "error"))
+    written = 0
+    result = await session.stream(
+        select(staged.line, staged.error)
+        .where(staged.job_id == job.id)
+        .where(staged.error.isnot(None))
+        .order_by(staged.line)
+    )
+    async for rows in result.partitions(ERROR_BATCH_ROWS):
+        writer.writerows(rows)
+        written += len(rows)
+    await session.commit()
+    return written
+
+
+async def finish(session: AsyncSession, job: ImportJob) -> None:
+    await session.exec(
+        delete(InvoiceImportStaging).where(InvoiceImportStaging.job_id == job.id)
+    )
+    job.status = ImportStatus.done
+    await _save(session, job)
+    await session.commit()
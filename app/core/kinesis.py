@@ -0,0 +1,232 @@
+"""
+Buffered Kinesis producer used by the Celery worker.
+
+One boto3 client is created per worker process and reused by every task.
+Records are buffered and sent with `put_records` once a batch is full
+(500 records or 5 MB) or `flush_interval` seconds passed, whatever comes
+first. Records are partitioned by device name so invoices spread over all
+shards while invoices of one device keep their order.
+
+Only the entries Kinesis reports as failed are retried (exponential backoff,
+`max_retries` attempts). Records that still fail, or a whole batch when
+`put_records` raises, are put back in the front of the buffer and sent again
+by the next flush. The producer is the only one retrying: `put` and `flush`
+do not raise delivery errors, so callers never hand the same record in twice.
+Records still buffered when the process stops are lost (logged by `close`),
+so the buffer is for fire-and-forget records only.
+
+`send` delivers records right away, outside of the buffer, and raises
+`KinesisDeliveryError` with the ones still failing: callers that must not
+lose records (retried Celery tasks) retry the call.
+"""
+
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Optional
+
+import boto3
+
+logger = logging.getLogger(__name__)
+
+MAX_RECORDS_PER_REQUEST = 500
+MAX_BYTES_PER_REQUEST = 5 * 1024 * 1024
+MAX_BYTES_PER_RECORD = 1024 * 1024
+
+
+class KinesisDeliveryError(Exception):
+    def __init__(self, message: str, records: list[dict]):
+        super().__init__(message)
+        self.records = records
+
+
+class KinesisProducer:
+    def __init__(
+        self,
+        stream_name: str,
+        client_factory: Callable[[], Any],
+        flush_interval: float = 1.0,
+        max_retries: int = 5,
+        max_records: int = MAX_RECORDS_PER_REQUEST,
+        max_bytes: int = MAX_BYTES_PER_REQUEST,
+    ):
+        self.stream_name = stream_name
+        self.client_factory = client_factory
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._stop = threading.Event()
+        self.reset()
+
+    def reset(self) -> None:
+        """Forget client, buffer and flusher thread (e.g. inherited through fork)"""
+        self._client = None
+        self._buffer: list[dict] = []
+        self._buffer_bytes = 0
+        self._flusher: Optional[threading.Thread] = None
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = self.client_factory()
+        return self._client
+
+    def put(self, data: dict, partition_key: str) -> None:
+        """Buffer one record, sends a batch first when the buffer is full"""
+        record = _record(data, partition_key)
+        size = _record_size(record)
+        with self._lock:
+            full = (
+                len(self._buffer) >= self.max_records
+                or self._buffer_bytes + size > self.max_bytes
+            )
+            batch = self._take() if full else []
+        if batch:
+            # failed records go back to the buffer, before the new one
+            self._send(batch)
+        with self._lock:
+            self._buffer.append(record)
+            self._buffer_bytes += size
+        self._ensure_flusher()
+
+    def flush(self) -> bool:
+        """Send everything buffered so far, False when records are left over
+        after a failed batch (they stay buffered for the next flush)"""
+        while True:
+            with self._lock:
+                batch = self._take()
+            if not batch:
+                return True
+            if not self._send(batch):
+                return False
+
+    def send(self, items: list[tuple[dict, str]]) -> None:
+        """Deliver (data, partition key) pairs now, without the buffer
+
+        Raises KinesisDeliveryError with the records not delivered, after the
+        failed entries have been retried.
+        """
+        records = [_record(data, partition_key) for data, partition_key in items]
+        failed: list[dict] = []
+        while records:
+            count = _batch_length(records, self.max_records, self.max_bytes)
+            batch, records = records[:count], records[count:]
+            try:
+                self._put_records(batch)
+            except KinesisDeliveryError as ex:
+                failed.extend(ex.records)
+            except Exception as ex:
+                logger.error("kinesis put_records failed: %s", ex)
+                failed.extend(batch)
+        if failed:
+            raise KinesisDeliveryError(
+                f"{len(failed)} records could not be delivered to "
+                f"{self.stream_name}",
+                failed,
+            )
+
+    def close(self) -> None:
+        self._stop.set()
+        if not self.flush():
+            logger.error(
+                "kinesis producer closed with %s undelivered records",
+                len(self._buffer),
+            )
+
+    def _take(self) -> list[dict]:
+        """Pop the next batch that fits one put_records call, caller holds the lock"""
+        count = _batch_length(self._buffer, self.max_records, self.max_bytes)
+        batch = self._buffer[:count]
+        del self._buffer[:count]
+        self._buffer_bytes -= sum(_record_size(record) for record in batch)
+        return batch
+
+    def _send(self, records: list[dict]) -> bool:
+        """Deliver `records`, put the undelivered ones back in the buffer"""
+        with self._send_lock:
+            try:
+                self._put_records(records)
+                return True
+            except KinesisDeliveryError as ex:
+                logger.error("%s, will retry", ex)
+                self._requeue(ex.records)
+            except Exception as ex:
+                logger.error("kinesis put_records failed, will retry: %s", ex)
+                self._requeue(records)
+            return False
+
+    def _put_records(self, records: list[dict]) -> None:
+        attempt = 0
+        while True:
+            response = self.client.put_records(
+                StreamName=self.stream_name, Records=records
+            )
+            if response["FailedRecordCount"] == 0:
+                return
+            # results are in request order, retry just the failed entries
+            records = [
+                record
+                for record, result in zip(records, response["Records"])
+                if "ErrorCode" in result
+            ]
+            attempt += 1
+            if attempt > self.max_retries:
+                raise KinesisDeliveryError(
+                    f"{len(records)} records could not be delivered to "
+                    f"{self.stream_name}",
+                    records,
+                )
+            time.sleep(min(0.1 * 2**attempt, 5))
+
+    def _requeue(self, records: list[dict]) -> None:
+        with self._lock:
+            self._buffer[:0] = records
+            self._buffer_bytes += sum(_record_size(record) for record in records)
+
+    def _ensure_flusher(self) -> None:
+        if self._flusher is None or not self._flusher.is_alive():
+            self._stop.clear()
+            self._flusher = threading.Thread(
+                target=self._flush_periodically, name="kinesis-flusher", daemon=True
+            )
+            self._flusher.start()
+
+    def _flush_periodically(self) -> None:
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+
+
+def _record(data: dict, partition_key: str) -> dict:
+    record = {"Data": json.dumps(data).encode(), "PartitionKey": partition_key}
+    size = _record_size(record)
+    if size > MAX_BYTES_PER_RECORD:
+        raise ValueError(f"Kinesis record of {size} bytes is too large")
+    return record
+
+
+def _record_size(record: dict) -> int:
+    return len(record["Data"]) + len(record["PartitionKey"].encode())
+
+
+def _batch_length(records: list[dict], max_records: int, max_bytes: int) -> int:
+    """How many of the first `records` fit one put_records call"""
+    count, size = 0, 0
+    for record in records:
+        record_size = _record_size(record)
+        if count == max_records or size + record_size > max_bytes:
+            break
+        count += 1
+        size += record_size
+    return count
+
+
+def create_producer(stream_name: str, region_name: str, **kwargs) -> KinesisProducer:
+    return KinesisProducer(
+        stream_name,
+        client_factory=lambda: boto3.client("kinesis", region_name=region_name),
+        **kwargs,
+    )
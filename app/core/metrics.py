@@ -0,0 +1,213 @@
+"""
+Prometheus metrics of the API and the Celery worker.
+
+All metrics live in the default registry of `prometheus_client`. When the app
+runs in several processes (uvicorn/unit workers, celery prefork) set the
+`PROMETHEUS_MULTIPROC_DIR` env variable to an empty directory shared by the
+processes, every process then writes its samples there and `render` merges
+them, so any process can answer a scrape with the numbers of all of them.
+"""
+
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from sqlalchemy.pool import AsyncAdaptedQueuePool
+from starlette.routing import Match
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+MULTIPROCESS = "PROMETHEUS_MULTIPROC_DIR" in os.environ
+
+HTTP_REQUEST_DURATION_SECONDS = Histogram(
+    "taxmon_http_request_duration_seconds",
+    "Time spent answering HTTP requests",
+    ["method", "route", "status"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+HTTP_REQUESTS_IN_PROGRESS = Gauge(
+    "taxmon_http_requests_in_progress",
+    "HTTP requests currently being answered",
+    ["method", "route"],
+    multiprocess_mode="livesum",
+)
+HTTP_RESPONSE_SIZE_BYTES = Histogram(
+    "taxmon_http_response_size_bytes",
+    "Size of HTTP response bodies",
+    ["method", "route"],
+    buckets=(100, 1_000, 10_000, 100_000, 1_000_000, 10_000_000, 100_000_000),
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    "taxmon_db_pool_checked_out",
+    "Database connections currently checked out of the pool",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_OVERFLOW = Gauge(
+    "taxmon_db_pool_overflow",
+    "Database connections opened above the pool size",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+DB_POOL_WAIT_SECONDS = Histogram(
+    "taxmon_db_pool_wait_seconds",
+    "Time spent waiting for a database connection from the pool",
+    ["pool"],
+    buckets=(0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 5, 30),
+)
+DB_REPLICA_LAG_SECONDS = Gauge(
+    "taxmon_db_replica_lag_seconds",
+    "Replication lag of the read replica at the last check",
+    multiprocess_mode="max",
+)
+DB_REPLICA_FALLBACKS = Counter(
+    "taxmon_db_replica_fallbacks",
+    "Reads sent to the primary because the replica lagged or was unreachable",
+)
+INVOICES = Counter(
+    "taxmon_invoices",
+    "Submitted invoices by endpoint and result (stored, duplicate, rejected)",
+    ["endpoint", "result"],
+)
+CELERY_TASKS = Counter(
+    "taxmon_celery_tasks",
+    "Finished celery task runs by outcome (success, failure, retry)",
+    ["task", "outcome"],
+)
+PASSWORD_HASHER_QUEUE_DEPTH = Gauge(
+    "taxmon_password_hasher_queue_depth",
+    "Password hashing jobs waiting for a free hasher worker",
+    multiprocess_mode="livesum",
+)
+PASSWORD_HASHER_IN_PROGRESS = Gauge(
+    "taxmon_password_hasher_in_progress",
+    "Password hashing jobs currently running",
+    multiprocess_mode="livesum",
+)
+PASSWORD_HASHER_WAIT_SECONDS = Histogram(
+    "taxmon_password_hasher_wait_seconds",
+    "Time password hashing jobs wait for a free hasher worker",
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+PASSWORD_HASHER_DURATION_SECONDS = Histogram(
+    "taxmon_password_hasher_duration_seconds",
+    "Time spent hashing or verifying a password",
+    ["operation"],
+    buckets=(0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 2.5, 5),
+)
+
+
+def registry() -> CollectorRegistry:
+    """Registry to expose, merging the samples of all processes if needed"""
+    if not MULTIPROCESS:
+        return REGISTRY
+    merged = CollectorRegistry()
+    multiprocess.MultiProcessCollector(merged)
+    return merged
+
+
+def render() -> tuple[bytes, str]:
+    """Body and content type of a scrape response"""
+    return generate_latest(registry()), CONTENT_TYPE_LATEST
+
+
+def mark_process_dead(pid: int) -> None:
+    """Drop the live gauges of an exiting process from the merged numbers"""
+    if MULTIPROCESS:
+        multiprocess.mark_process_dead(pid)
+
+
+def _route_template(scope: Scope) -> str:
+    # label by path template (/api/v1/users/{id}) to keep cardinality bounded
+    for route in scope["app"].routes:
+        match, _ = route.matches(scope)
+        if match == Match.FULL:
+            return getattr(route, "path", "unknown")
+    return "unmatched"
+
+
+class PrometheusMiddleware:
+    """
+    ASGI middleware recording latency, in-flight requests and response size of
+    every HTTP request per route template. Written as plain ASGI so streamed
+    responses are measured until their last chunk is sent.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = _route_template(scope)
+        status = 500
+        size = 0
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status, size
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body":
+                size += len(message.get("body", b""))
+            await send(message)
+
+        in_progress = HTTP_REQUESTS_IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_progress.dec()
+            HTTP_REQUEST_DURATION_SECONDS.labels(method, route, status).observe(
+                time.perf_counter() - started
+            )
+            HTTP_RESPONSE_SIZE_BYTES.labels(method, route).observe(size)
+
+
+class InstrumentedQueuePool(AsyncAdaptedQueuePool):
+    """
+    Async queue pool reporting checked-out connections, overflow and the time
+    spent waiting for a connection. Use `instrumented_pool` to get a subclass
+    labelled with the pool name, the label survives `engine.dispose()`.
+    """
+
+    pool_name = "default"
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            DB_POOL_WAIT_SECONDS.labels(self.pool_name).observe(
+                time.perf_counter() - started
+            )
+            self._report()
+
+    def _do_return_conn(self, conn):
+        try:
+            super()._do_return_conn(conn)
+        finally:
+            self._report()
+
+    def _report(self) -> None:
+        DB_POOL_CHECKED_OUT.labels(self.pool_name).set(self.checkedout())
+        # overflow() counts up from -pool_size until the pool is full
+        DB_POOL_OVERFLOW.labels(self.pool_name).set(max(self.overflow(), 0))
+
+
+def instrumented_pool(name: str) -> type[InstrumentedQueuePool]:
+    """Pool class to pass as `poolclass` to the engine"""
+    return type(
+        f"InstrumentedQueuePool[{name}]", (InstrumentedQueuePool,), {"pool_name": name}
+    )
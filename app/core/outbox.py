@@ -0,0 +1,80 @@
+"""
+Transactional outbox.
+
+Handlers never call the Celery broker. They add an `Outbox` row in the same
+transaction as the data it describes, so an event exists if and only if its
+data was committed. `relay` (run by `app/relay.py`) moves committed events to
+the worker in large batches.
+
+Events are deleted once the broker accepted the task carrying them, which is
+not yet delivery to Kinesis: from there the task is responsible. It is only
+acknowledged after `put_records` confirmed every record and is retried until
+then (`app.worker.task_put_invoices`), so delivery stays at least once end to
+end as long as the broker keeps queued tasks (a persistent Redis).
+"""
+
+import asyncio
+from datetime import datetime
+from typing import Callable
+
+from fastapi.encoders import jsonable_encoder
+from sqlmodel import delete, select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.model.models import Outbox
+
+INVOICE_TOPIC = "invoice"
+
+
+def invoice_event(invoice, created_at: datetime) -> dict:
+    """Outbox row values for a stored invoice (ORM object or row)"""
+    return {
+        "topic": INVOICE_TOPIC,
+        "payload": jsonable_encoder(
+            {
+                "id": invoice.id,
+                "invoice_num": invoice.invoice_num,
+                "device_name": invoice.device_name,
+                "username": invoice.username,
+                "tax_value": invoice.tax_value,
+                "total_value": invoice.total_value,
+                "invoice_date": invoice.invoice_date,
+            }
+        ),
+        "created_at": created_at,
+    }
+
+
+async def relay(
+    session: AsyncSession,
+    topic: str,
+    deliver: Callable[[list[dict]], object],
+    batch_size: int,
+) -> int:
+    """Hand over the oldest `batch_size` events of `topic`, returns their count
+
+    Rows are claimed with FOR UPDATE SKIP LOCKED, so several relays can run
+    side by side without sending the same batch twice.
+    """
+    result = await session.exec(
+        select(Outbox.id, Outbox.payload)
+        .where(Outbox.topic == topic)
+        .order_by(Outbox.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    events = result.all()
+    if not events:
+        await session.rollback()
+        return 0
+    try:
+        # broker client is blocking, keep it off the event loop
+        await asyncio.to_thread(deliver, [event.payload for event in events])
+        await session.exec(
+            delete(Outbox).where(Outbox.id.in_([event.id for event in events]))
+        )
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        raise
+    return len(events)
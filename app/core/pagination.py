@@ -0,0 +1,55 @@
+"""
+Keyset (cursor) pagination helpers.
+
+Lists are ordered by `(created_at, id)` and every page starts right after the
+last row of the previous one, so fetching page N costs the same as page 1
+(no OFFSET scan). The cursor given to clients is an opaque urlsafe token of
+that last key, returned in the `X-Next-Cursor` response header. `created_at`
+must be NOT NULL on paginated tables (row values comparisons skip NULLs).
+"""
+
+import base64
+import datetime
+import json
+import uuid
+from typing import Optional
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_cursor(created_at: datetime.datetime, id: uuid.UUID) -> str:
+    raw = json.dumps([created_at.isoformat(), str(id)])
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[datetime.datetime, uuid.UUID]:
+    try:
+        created_at, id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.datetime.fromisoformat(created_at), uuid.UUID(id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+def paginate(statement, model, cursor: Optional[str], limit: Optional[int]):
+    """Apply keyset ordering on `(model.created_at, model.id)` to `statement`
+
+    `limit` of None means no limit (used when streaming).
+    """
+    if cursor:
+        statement = statement.where(
+            tuple_(model.created_at, model.id) > tuple_(*decode_cursor(cursor))
+        )
+    statement = statement.order_by(model.created_at, model.id)
+    if limit is not None:
+        statement = statement.limit(limit)
+    return statement
+
+
+def next_cursor(rows: list, limit: int) -> Optional[str]:
+    """Cursor of the page after `rows`, None when `rows` is the last page"""
+    if len(rows) < limit:
+        return None
+    return encode_cursor(rows[-1].created_at, rows[-1].id)
@@ -0,0 +1,158 @@
+"""
+Monthly range partitions of the `invoice` table.
+
+`invoice` is partitioned by `invoice_date`, one partition per calendar month
+in `TIMEZONE` named `invoice_pYYYY_MM`, plus `invoice_default` for dates no
+partition covers yet. Partitions should be created ahead of time (see
+`app/partitions.py`) so the default partition stays empty. Old partitions are
+detached, then archived to another schema or dropped. Reports keep working
+for detached months since they read `invoice_daily_rollup`.
+"""
+
+import datetime
+
+import pytz
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection
+
+from app.core.config import settings
+
+timezone = pytz.timezone(settings.TIMEZONE)
+
+TABLE = "invoice"
+DEFAULT_PARTITION = "invoice_default"
+
+
+def month_start(day: datetime.date) -> datetime.date:
+    return day.replace(day=1)
+
+
+def next_month(month: datetime.date) -> datetime.date:
+    return (month.replace(day=28) + datetime.timedelta(days=4)).replace(day=1)
+
+
+def months(start: datetime.date, end: datetime.date) -> list[datetime.date]:
+    """First days of the months overlapping [start, end)"""
+    result, month = [], month_start(start)
+    while month < end:
+        result.append(month)
+        month = next_month(month)
+    return result
+
+
+def partition_name(month: datetime.date) -> str:
+    return f"{TABLE}_p{month.year}_{month.month:02d}"
+
+
+def _bound(day: datetime.date) -> str:
+    return timezone.localize(
+        datetime.datetime.combine(day, datetime.time())
+    ).isoformat()
+
+
+def partition_bounds(month: datetime.date) -> tuple[str, str]:
+    return _bound(month), _bound(next_month(month))
+
+
+def create_partition_sql(month: datetime.date) -> str:
+    lower, upper = partition_bounds(month)
+    return (
+        f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {TABLE} "
+        f"FOR VALUES FROM ('{lower}') TO ('{upper}')"
+    )
+
+
+async def list_partitions(connection: AsyncConnection) -> list[str]:
+    result = await connection.execute(
+        text(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid "
+            "WHERE i.inhparent = CAST(:table AS regclass) ORDER BY c.relname"
+        ),
+        {"table": TABLE},
+    )
+    return list(result.scalars())
+
+
+async def create_partition(connection: AsyncConnection, month: datetime.date) -> bool:
+    """Create partition of `month`, False if it exists already
+
+    Rows of that month already in the default partition are moved into it.
+    """
+    name = partition_name(month)
+    if name in await list_partitions(connection):
+        return False
+    lower, upper = partition_bounds(month)
+    in_range = {"lower": lower, "upper": upper}
+    result = await connection.execute(
+        text(
+            f"SELECT count(*) FROM {DEFAULT_PARTITION} "
+            "WHERE invoice_date >= CAST(:lower AS timestamptz) "
+            "AND invoice_date < CAST(:upper AS timestamptz)"
+        ),
+        in_range,
+    )
+    if result.scalar() == 0:
+        await connection.execute(text(create_partition_sql(month)))
+        return True
+
+    await connection.execute(
+        text(f"ALTER TABLE {TABLE} DETACH PARTITION {DEFAULT_PARTITION}")
+    )
+    await connection.execute(text(create_partition_sql(month)))
+    await connection.execute(
+        text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+            "WHERE invoice_date >= CAST(:lower AS timestamptz) "
+            "AND invoice_date < CAST(:upper AS timestamptz) RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ),
+        in_range,
+    )
+    await connection.execute(
+        text(f"ALTER TABLE {TABLE} ATTACH PARTITION {DEFAULT_PARTITION} DEFAULT")
+    )
+    return True
+
+
+async def ensure_partitions(
+    connection: AsyncConnection, start: datetime.date, end: datetime.date
+) -> list[str]:
+    """Create missing partitions for invoice dates in [start, end)"""
+    created = []
+    for month in months(start, end):
+        if await create_partition(connection, month):
+            created.append(partition_name(month))
+    return created
+
+
+async def detach_partitions(
+    connection: AsyncConnection,
+    before: datetime.date,
+    archive_schema: str | None = None,
+    drop: bool = False,
+) -> list[str]:
+    """Detach partitions of months before `before`
+
+    Detached partitions become plain tables, moved to `archive_schema` when
+    given or dropped with `drop`.
+    """
+    detached = []
+    for name in await list_partitions(connection):
+        if name == DEFAULT_PARTITION:
+            continue
+        year, month = name.removeprefix(f"{TABLE}_p").split("_")
+        if datetime.date(int(year), int(month), 1) >= month_start(before):
+            continue
+        await connection.execute(text(f"ALTER TABLE {TABLE} DETACH PARTITION {name}"))
+        if drop:
+            await connection.execute(text(f"DROP TABLE {name}"))
+        elif archive_schema:
+            await connection.execute(
+                text(f"CREATE SCHEMA IF NOT EXISTS {archive_schema}")
+            )
+            await connection.execute(
+                text(f"ALTER TABLE {name} SET SCHEMA {archive_schema}")
+            )
+        detached.append(name)
+    return detached
@@ -0,0 +1,141 @@
+"""
+Cached JSON responses of polled read endpoints, with conditional GET.
+
+Responses are cached per route, query string and principal (the user asking)
+on the `CACHE_BACKEND`. Write handlers call `invalidate`, which moves the
+cache to a new generation: the generation is part of every key, entries of
+older ones are never read again and expire with their TTL. The generation is
+read before the database, so a response built while a write commits is
+stored under the old generation. Entries are built from the primary
+(`session_factory`): a response read from a lagging replica just after a
+write would be stored under the new generation and served for the whole TTL.
+
+Every response carries an `ETag` (hash of the body) and a `Last-Modified`
+(latest `modified_at` of the rows, or of the last write when later, so
+deletions count too). Requests with a matching `If-None-Match`, or without it
+and an `If-Modified-Since` not older than `Last-Modified`, get
+`304 Not Modified` without a body.
+
+Invalidation must reach every process, so with the `memory` backend and
+more than one process nothing is cached (see `cache.create_cache`). Responses
+are then read like uncached ones, and still carry an `ETag` for `304`s.
+"""
+
+import datetime
+import email.utils
+import hashlib
+import time
+from typing import Optional
+
+from fastapi import Request
+from fastapi.responses import Response
+from sqlalchemy.orm import sessionmaker
+
+from app.core import cache, config, serialization
+from app.core.session import SessionLocal
+
+# generations must outlive the entries stored under them
+GENERATION_TTL_SECONDS = 86400
+GENERATION_KEY = "current"
+
+
+class ResponseCache:
+    def __init__(self, namespace: str, ttl: float, max_size: int):
+        self.entries = cache.create_cache(namespace, ttl, max_size, shared=True)
+        self.generations = cache.create_cache(
+            f"{namespace}_generation", GENERATION_TTL_SECONDS, 1, shared=True
+        )
+
+    def session_factory(self, read_factory: sessionmaker) -> sessionmaker:
+        """Session factory to build a response with: the primary when it is
+        cached, `read_factory` (see `deps.get_session_factory`) otherwise"""
+        return SessionLocal if self.entries.enabled else read_factory
+
+    async def _generation(self) -> int:
+        """Time (ns) of the last write, starts a new generation when unknown"""
+        generation = await self.generations.get(GENERATION_KEY)
+        if generation is None:
+            generation = time.time_ns()
+            await self.generations.set(GENERATION_KEY, generation)
+        return int(generation)
+
+    async def invalidate(self) -> None:
+        """Forget every cached response, call it after a write committed"""
+        await self.generations.set(GENERATION_KEY, time.time_ns())
+
+    async def key(self, request: Request, principal) -> tuple[int, str]:
+        """(generation, cache key) of a request, get it before querying"""
+        query = "&".join(sorted(request.url.query.split("&")))
+        generation = await self._generation()
+        return generation, f"{generation}:{request.url.path}?{query}:{principal}"
+
+    async def get(self, request: Request, key: tuple[int, str]) -> Optional[Response]:
+        entry = await self.entries.get(key[1])
+        return None if entry is None else _response(request, entry)
+
+    async def set(
+        self,
+        request: Request,
+        key: tuple[int, str],
+        content,
+        last_modified: Optional[datetime.datetime],
+        headers: Optional[dict] = None,
+    ) -> Response:
+        """Store `content` (shaped like the response model) and respond with it"""
+        written_at = key[0] / 1e9
+        if last_modified is None or last_modified.timestamp() < written_at:
+            last_modified = datetime.datetime.fromtimestamp(
+                written_at, datetime.timezone.utc
+            )
+        body = serialization.dumps(content)
+        entry = {
+            # JSON text, the redis backend stores entries as JSON
+            "body": body.decode(),
+            "etag": f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"',
+            "last_modified": email.utils.format_datetime(
+                last_modified.astimezone(datetime.timezone.utc), usegmt=True
+            ),
+            "headers": headers or {},
+        }
+        await self.entries.set(key[1], entry)
+        return _response(request, entry)
+
+
+def _not_modified(request: Request, entry: dict) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        return "*" in tags or entry["etag"] in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None:
+        return False
+    try:
+        since = email.utils.parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=datetime.timezone.utc)
+    return email.utils.parsedate_to_datetime(entry["last_modified"]) <= since
+
+
+def _response(request: Request, entry: dict) -> Response:
+    headers = {
+        "ETag": entry["etag"],
+        "Last-Modified": entry["last_modified"],
+        # may be kept by the client only, and revalidated every time
+        "Cache-Control": "private, no-cache",
+        **entry["headers"],
+    }
+    if _not_modified(request, entry):
+        return Response(status_code=304, headers=headers)
+    return Response(
+        content=entry["body"], media_type="application/json", headers=headers
+    )
+
+
+# GET /devices and GET /users/{id}, invalidated by every device or user write
+responses = ResponseCache(
+    "response",
+    ttl=config.settings.RESPONSE_CACHE_TTL_SECONDS,
+    max_size=config.settings.RESPONSE_CACHE_MAX_SIZE,
+)
@@ -0,0 +1,135 @@
+"""
+Incrementally maintained invoice rollups.
+
+`add_invoices` upserts the daily totals of new invoices into
+`invoice_daily_rollup` in the same transaction as the invoices themselves,
+so reports never scan `invoice`. `rebuild` recomputes a date range from
+`invoice` with one set-based statement, for backfills and repairs
+(see `app/rollups.py`).
+
+Days are calendar days in `TIMEZONE`.
+"""
+
+import datetime
+from collections import defaultdict
+from decimal import Decimal
+from typing import Iterable
+
+import pytz
+from sqlalchemy import Date, String, bindparam, cast, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlmodel import delete
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core.config import settings
+from app.model.models import Invoice, InvoiceDailyRollup
+
+timezone = pytz.timezone(settings.TIMEZONE)
+
+
+def inline_literal(value: str):
+    """String rendered into the SQL instead of bound
+
+    Needed when an expression is both selected and grouped by: every bound
+    parameter gets its own positional placeholder with asyncpg and Postgres
+    would not see both expressions as equal.
+    """
+    return bindparam(None, value, String, literal_execute=True)
+
+
+def invoice_day(invoice_date: datetime.datetime) -> datetime.date:
+    if invoice_date.tzinfo is None:
+        # asyncpg stores naive datetimes as UTC
+        invoice_date = invoice_date.replace(tzinfo=datetime.timezone.utc)
+    return invoice_date.astimezone(timezone).date()
+
+
+async def add_invoices(session: AsyncSession, invoices: Iterable) -> None:
+    """Add invoices (ORM objects or rows) to the daily rollups"""
+    totals: dict[tuple, list] = defaultdict(lambda: [0, Decimal(0), Decimal(0)])
+    for invoice in invoices:
+        key = (
+            invoice_day(invoice.invoice_date),
+            invoice.device_name,
+            invoice.username,
+        )
+        totals[key][0] += 1
+        totals[key][1] += Decimal(invoice.tax_value)
+        totals[key][2] += Decimal(invoice.total_value)
+    if not totals:
+        return
+    statement = insert(InvoiceDailyRollup).values(
+        [
+            {
+                "day": day,
+                "device_name": device_name,
+                "username": username,
+                "invoice_count": count,
+                "tax_value": tax_value,
+                "total_value": total_value,
+            }
+            # sorted keys: concurrent upserts lock rows in the same order
+            for (day, device_name, username), (count, tax_value, total_value) in sorted(
+                totals.items()
+            )
+        ]
+    )
+    table = InvoiceDailyRollup.__table__
+    await session.exec(
+        statement.on_conflict_do_update(
+            index_elements=[table.c.day, table.c.device_name, table.c.username],
+            set_={
+                "invoice_count": table.c.invoice_count
+                + statement.excluded.invoice_count,
+                "tax_value": table.c.tax_value + statement.excluded.tax_value,
+                "total_value": table.c.total_value + statement.excluded.total_value,
+            },
+        )
+    )
+
+
+async def rebuild(
+    session: AsyncSession, start: datetime.date, end: datetime.date
+) -> None:
+    """Recompute rollups of days in [start, end) from invoices, caller commits"""
+    day = cast(
+        func.timezone(inline_literal(settings.TIMEZONE), Invoice.invoice_date), Date
+    )
+    await session.exec(
+        delete(InvoiceDailyRollup)
+        .where(InvoiceDailyRollup.day >= start)
+        .where(InvoiceDailyRollup.day < end)
+    )
+    aggregate = (
+        Invoice.__table__.select()
+        .with_only_columns(
+            day,
+            Invoice.device_name,
+            Invoice.username,
+            func.count(),
+            func.coalesce(func.sum(Invoice.tax_value), 0),
+            func.coalesce(func.sum(Invoice.total_value), 0),
+        )
+        .where(Invoice.invoice_date >= _day_start(start))
+        .where(Invoice.invoice_date < _day_start(end))
+        .where(Invoice.device_name.isnot(None))
+        .where(Invoice.username.isnot(None))
+        .group_by(day, Invoice.device_name, Invoice.username)
+    )
+    await session.exec(
+        insert(InvoiceDailyRollup).from_select(
+            [
+                "day",
+                "device_name",
+                "username",
+                "invoice_count",
+                "tax_value",
+                "total_value",
+            ],
+            aggregate,
+        )
+    )
+
+
+def _day_start(day: datetime.date) -> datetime.datetime:
+    return timezone.localize(datetime.datetime.combine(day, datetime.time()))
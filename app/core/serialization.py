@@ -0,0 +1,60 @@
+"""
+Fast JSON encoding for list and export endpoints.
+
+Endpoints returning many rows can hand plain dicts of column values straight
+to `FastJSONResponse` (or `dumps` for NDJSON lines) instead of going through
+pydantic validation and `jsonable_encoder` for every row. They keep their
+`response_model` for the OpenAPI docs, so the dicts must already have the
+shape of that model.
+
+Uses orjson when installed, the stdlib json module otherwise. The output
+matches FastAPI's default encoding: UUID and datetime as strings (ISO 8601),
+enums by value and Decimal as a JSON number.
+"""
+
+import datetime
+import decimal
+import enum
+import json
+import uuid
+from typing import Any
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+
+def _default(obj: Any) -> Any:
+    if isinstance(obj, decimal.Decimal):
+        return float(obj)
+    if orjson is None:
+        if isinstance(obj, uuid.UUID):
+            return str(obj)
+        if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+            return obj.isoformat()
+        if isinstance(obj, enum.Enum):
+            return obj.value
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+
+    def dumps(obj: Any) -> bytes:
+        return orjson.dumps(obj, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+else:
+
+    def dumps(obj: Any) -> bytes:
+        return json.dumps(obj, default=_default, separators=(",", ":")).encode()
+
+
+class FastJSONResponse(Response):
+    """JSON response of already shaped content, no validation or encoding pass"""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
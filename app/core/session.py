@@ -9,29 +9,217 @@
 #     sqlalchemy_database_uri = config.settings.DEFAULT_SQLALCHEMY_DATABASE_URI
 
 
-from sqlalchemy.ext.asyncio import create_async_engine
+import asyncio
+import logging
+import os
+import time
+from typing import Optional
+
+from pydantic import BaseModel
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
 
 # engine = create_engine(sqlalchemy_database_uri)
 from sqlalchemy.orm import sessionmaker
 from sqlmodel.ext.asyncio.session import AsyncSession
 
 from app.core import config as app_config
+from app.core import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class EngineProfile(BaseModel):
+    """Engine and pool options, the pool is per process"""
+
+    echo: bool
+    pool_size: int
+    max_overflow: int
+    pool_pre_ping: bool
+    pool_recycle: int  # seconds, -1 never recycles
+    pool_timeout: float
+    # asyncpg prepared statements kept per connection, 0 disables them
+    # (needed behind pgbouncer in transaction mode)
+    prepared_statement_cache_size: int
+
+
+ENGINE_PROFILES = {
+    "DEV": EngineProfile(
+        echo=True,
+        pool_size=5,
+        max_overflow=10,
+        pool_pre_ping=True,
+        pool_recycle=3600,
+        pool_timeout=30,
+        prepared_statement_cache_size=100,
+    ),
+    "PYTEST": EngineProfile(
+        echo=False,
+        pool_size=5,
+        max_overflow=10,
+        pool_pre_ping=False,
+        pool_recycle=-1,
+        pool_timeout=30,
+        prepared_statement_cache_size=100,
+    ),
+    "STG": EngineProfile(
+        echo=False,
+        pool_size=10,
+        max_overflow=5,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+        pool_timeout=10,
+        prepared_statement_cache_size=500,
+    ),
+    "PRD": EngineProfile(
+        echo=False,
+        pool_size=10,
+        max_overflow=5,
+        pool_pre_ping=True,
+        pool_recycle=1800,
+        pool_timeout=10,
+        prepared_statement_cache_size=500,
+    ),
+}
+
+
+def engine_profile(settings: app_config.Settings) -> EngineProfile:
+    """Profile of the environment, overridden by the DB_* settings that are set
+
+    The pool (first `pool_size`, then `max_overflow`) is capped at the share
+    of `DB_CONNECTION_BUDGET` of one of `WEB_CONCURRENCY` processes.
+    """
+    overrides = {
+        "echo": settings.DB_ECHO,
+        "pool_size": settings.DB_POOL_SIZE,
+        "max_overflow": settings.DB_MAX_OVERFLOW,
+        "pool_pre_ping": settings.DB_POOL_PRE_PING,
+        "pool_recycle": settings.DB_POOL_RECYCLE_SECONDS,
+        "pool_timeout": settings.DB_POOL_TIMEOUT_SECONDS,
+        "prepared_statement_cache_size": settings.DB_PREPARED_STATEMENT_CACHE_SIZE,
+    }
+    profile = ENGINE_PROFILES[settings.ENVIRONMENT].copy(
+        update={key: value for key, value in overrides.items() if value is not None}
+    )
+    share = max(settings.DB_CONNECTION_BUDGET // settings.WEB_CONCURRENCY, 1)
+    pool_size = min(profile.pool_size, share)
+    return profile.copy(
+        update={
+            "pool_size": pool_size,
+            "max_overflow": min(profile.max_overflow, share - pool_size),
+        }
+    )
+
+
+def engine_options(profile: EngineProfile) -> dict:
+    """Keyword arguments of `create_async_engine` for a profile"""
+    return {
+        "echo": profile.echo,
+        "future": True,
+        "pool_size": profile.pool_size,
+        "max_overflow": profile.max_overflow,
+        "pool_pre_ping": profile.pool_pre_ping,
+        "pool_recycle": profile.pool_recycle,
+        "pool_timeout": profile.pool_timeout,
+        "connect_args": {
+            "prepared_statement_cache_size": profile.prepared_statement_cache_size
+        },
+    }
+
+
+async def check_connection_budget(
+    engine: AsyncEngine, profile: EngineProfile, processes: int, reserved: int
+) -> None:
+    """
+    Fail if `processes` pools filled up to their overflow, plus `reserved`
+    connections for the relay, workers and maintenance, could exceed what
+    Postgres accepts from non superusers.
+    """
+    needed = processes * (profile.pool_size + profile.max_overflow) + reserved
+    async with engine.connect() as connection:
+        max_connections = int(
+            (await connection.execute(text("SHOW max_connections"))).scalar()
+        )
+        superuser_reserved = int(
+            (
+                await connection.execute(text("SHOW superuser_reserved_connections"))
+            ).scalar()
+        )
+    available = max_connections - superuser_reserved
+    if needed > available:
+        raise RuntimeError(
+            f"{processes} processes x (pool_size {profile.pool_size} + "
+            f"max_overflow {profile.max_overflow}) + {reserved} reserved = "
+            f"{needed} connections, Postgres accepts {available}"
+        )
+    logger.info("Database connections: up to %s of %s", needed, available)
+
+
+# 0 on a primary (e.g. a replica URI pointing at the default database)
+REPLICA_LAG = text(
+    """
+    SELECT COALESCE(
+        CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END,
+        0
+    )
+    """
+)
+
 
-DB_POOL_SIZE = 83
-WEB_CONCURRENCY = 10
-POOL_SIZE = max(DB_POOL_SIZE // WEB_CONCURRENCY, 8)
-SIZE_POOL_AIOHTTP = 100
+class ReplicaGuard:
+    """
+    Tells whether the replica is fit for reads: reachable and lagging at most
+    `max_lag` seconds. The lag is measured at most once every `interval`
+    seconds per process, requests in between reuse the last answer.
+    """
 
-# connect_args = {"check_same_thread": False}
+    def __init__(
+        self, engine: AsyncEngine, max_lag: float, interval: float, timeout=1.0
+    ):
+        self.engine = engine
+        self.max_lag = max_lag
+        self.interval = interval
+        self.timeout = timeout
+        self._checked_at = float("-inf")
+        self._healthy = False
+        self._lock: Optional[asyncio.Lock] = None
 
-# engine = create_engine(settings.SQLALCHEMY_DATABASE_URI, echo=True, connect_args=connect_args, pool_size=POOL_SIZE, max_overflow=64)
+    async def healthy(self) -> bool:
+        if time.monotonic() - self._checked_at < self.interval:
+            return self._healthy
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # checked by another request while waiting for the lock
+            if time.monotonic() - self._checked_at >= self.interval:
+                self._healthy = await self._check()
+                self._checked_at = time.monotonic()
+        return self._healthy
+
+    async def _check(self) -> bool:
+        try:
+            lag = await asyncio.wait_for(self._lag(), self.timeout)
+        except Exception as ex:
+            logger.warning("Read replica unavailable: %s", ex)
+            return False
+        metrics.DB_REPLICA_LAG_SECONDS.set(lag)
+        if lag > self.max_lag:
+            logger.warning("Read replica lags %.1fs behind", lag)
+            return False
+        return True
+
+    async def _lag(self) -> float:
+        async with self.engine.connect() as connection:
+            return float((await connection.execute(REPLICA_LAG)).scalar())
+
+
+profile = engine_profile(app_config.settings)
 
 engine = create_async_engine(
     app_config.settings.DEFAULT_SQLALCHEMY_DATABASE_URI,
-    echo=True,
-    future=True,
-    pool_size=POOL_SIZE,
-    max_overflow=64,
+    poolclass=metrics.instrumented_pool("primary"),
+    **engine_options(profile),
 )
 
 SessionLocal = sessionmaker(
@@ -41,3 +229,48 @@ SessionLocal = sessionmaker(
     class_=AsyncSession,
     expire_on_commit=False,
 )
+
+# Read only traffic, see deps.get_read_session. Without a replica configured
+# reads simply use the default database.
+replica_engine: Optional[AsyncEngine] = None
+replica_guard: Optional[ReplicaGuard] = None
+if app_config.settings.REPLICA_SQLALCHEMY_DATABASE_URI:
+    replica_engine = create_async_engine(
+        app_config.settings.REPLICA_SQLALCHEMY_DATABASE_URI,
+        poolclass=metrics.instrumented_pool("replica"),
+        **engine_options(profile),
+    )
+    replica_guard = ReplicaGuard(
+        replica_engine,
+        max_lag=app_config.settings.REPLICA_MAX_LAG_SECONDS,
+        interval=app_config.settings.REPLICA_LAG_CHECK_SECONDS,
+    )
+
+
+def _dispose_in_child() -> None:
+    # A forked process must not use the connections of its parent, it gets
+    # new pools and leaves the inherited connections to the parent
+    for forked in filter(None, [engine, replica_engine]):
+        forked.sync_engine.dispose(close=False)
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_dispose_in_child)
+
+ReadSessionLocal = sessionmaker(
+    autocommit=False,
+    autoflush=False,
+    bind=replica_engine or engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+)
+
+
+async def read_session_factory() -> sessionmaker:
+    """Session factory of the replica, or of the primary while it is not fit"""
+    if replica_guard is None:
+        return SessionLocal
+    if await replica_guard.healthy():
+        return ReadSessionLocal
+    metrics.DB_REPLICA_FALLBACKS.inc()
+    return SessionLocal
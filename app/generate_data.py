@@ -0,0 +1,311 @@
+"""
+Generate a large, realistic data set for benchmarks and query plan checks.
+
+Merchants own devices located around a few cities and their invoices follow
+daily, weekly and yearly patterns, everything drawn from one seeded random
+generator (same seed, same data; only the password hash salt differs):
+
+python -m app.generate_data --users 1000 --devices 10000 --invoices 20000000
+
+* merchants `gen-N@example.com` (password `generated`), a few of them own
+  most of the devices (Pareto distribution)
+* devices `gen-device-N` spread around city centers, some busier than others
+* invoices over --months months up to --end: more in the evening and at
+  weekends, growing over time, log-normal totals (IDR) with 10% tax
+
+Rows are loaded with COPY in chunks of --chunk-size, generating the next chunk
+while the previous one is copied. Missing partitions are created first and
+the invoice rollups are rebuilt at the end. Meant for an empty database (or
+one without generated data), nothing is sent to the outbox.
+"""
+
+import argparse
+import asyncio
+import datetime
+import itertools
+import math
+import random
+import time
+import uuid
+from decimal import Decimal
+
+from sqlalchemy import text
+
+from app.core import geohash, partitions, rollups, security
+from app.core.session import SessionLocal, engine
+
+PASSWORD = "generated"
+CHUNK_ROWS = 100000
+
+# (lat, lon, share of the devices)
+CITIES = [
+    (-6.2088, 106.8456, 0.35),  # Jakarta
+    (-7.2575, 112.7521, 0.15),  # Surabaya
+    (-6.9175, 107.6191, 0.12),  # Bandung
+    (3.5952, 98.6722, 0.10),  # Medan
+    (-6.9667, 110.4167, 0.08),  # Semarang
+    (-5.1477, 119.4327, 0.08),  # Makassar
+    (-8.6705, 115.2126, 0.12),  # Denpasar
+]
+CITY_SPREAD_DEGREES = 0.08
+# Monday to Sunday
+WEEKDAY_WEIGHTS = [0.85, 0.85, 0.9, 0.95, 1.15, 1.35, 1.25]
+# 00:00 to 23:00, lunch and dinner peaks
+# fmt: off
+HOUR_WEIGHTS = [
+    0.2, 0.1, 0.05, 0.05, 0.05, 0.1, 0.3, 0.6, 0.8, 0.9, 1.0, 1.6,
+    2.2, 1.8, 1.1, 1.0, 1.1, 1.5, 2.3, 2.6, 2.2, 1.5, 0.9, 0.4,
+]
+# fmt: on
+# January to December
+MONTH_WEIGHTS = [0.95, 0.9, 0.95, 1.0, 1.0, 1.0, 1.05, 1.0, 1.0, 1.0, 1.05, 1.3]
+# business grows by this factor over the generated period
+GROWTH = 2.0
+# log-normal total, median and spread
+TOTAL_MEDIAN = 150000
+TOTAL_SIGMA = 0.9
+TAX_RATE = Decimal("0.10")
+CENT = Decimal("0.01")
+DESCRIPTIONS = ["cash register", "POS terminal", "tablet POS", "self service kiosk"]
+FIRST_NAMES = ["Budi", "Siti", "Agus", "Dewi", "Eko", "Rina", "Andi", "Putri"]
+LAST_NAMES = ["Santoso", "Wijaya", "Saputra", "Lestari", "Hidayat", "Pratama"]
+
+USER_COLUMNS = [
+    "id",
+    "username",
+    "hashed_password",
+    "nik",
+    "first_name",
+    "last_name",
+    "address",
+    "role",
+    "created_at",
+    "modified_at",
+]
+DEVICE_COLUMNS = [
+    "id",
+    "name",
+    "user_id",
+    "serial_num",
+    "description",
+    "lat",
+    "lon",
+    "geohash",
+    "status",
+    "created_at",
+    "modified_at",
+]
+INVOICE_COLUMNS = [
+    "id",
+    "invoice_num",
+    "invoice_date",
+    "device_name",
+    "username",
+    "tax_value",
+    "total_value",
+    "created_at",
+    "modified_at",
+]
+
+
+class Generator:
+    """Users, devices and invoices drawn from one seeded random generator"""
+
+    def __init__(self, seed: int, start: datetime.date, end: datetime.date):
+        self.random = random.Random(seed)
+        self.start = partitions.timezone.localize(
+            datetime.datetime.combine(start, datetime.time())
+        )
+        self.days = [
+            start + datetime.timedelta(days=i) for i in range((end - start).days)
+        ]
+        self.users: list[tuple] = []
+        self.devices: list[tuple] = []
+
+    def uuid(self) -> uuid.UUID:
+        return uuid.UUID(int=self.random.getrandbits(128), version=4)
+
+    def created_at(self) -> datetime.datetime:
+        return self.start + datetime.timedelta(seconds=self.random.random() * 86400)
+
+    def generate_users(self, count: int, hashed_password: str) -> list[tuple]:
+        for i in range(count):
+            created_at = self.created_at()
+            self.users.append(
+                (
+                    self.uuid(),
+                    f"gen-{i}@example.com",
+                    hashed_password,
+                    f"{3100000000000000 + i:016d}",
+                    self.random.choice(FIRST_NAMES),
+                    self.random.choice(LAST_NAMES),
+                    f"Jl. Generated No. {i}",
+                    "merchant",
+                    created_at,
+                    created_at,
+                )
+            )
+        return self.users
+
+    def generate_devices(self, count: int) -> list[tuple]:
+        owner_weights = [self.random.paretovariate(1.2) for _ in self.users]
+        owners = self.random.choices(self.users, weights=owner_weights, k=count)
+        cities = self.random.choices(CITIES, weights=[c[2] for c in CITIES], k=count)
+        for i, (owner, (lat, lon, _)) in enumerate(zip(owners, cities)):
+            lat = self.random.gauss(lat, CITY_SPREAD_DEGREES)
+            lon = self.random.gauss(lon, CITY_SPREAD_DEGREES)
+            created_at = self.created_at()
+            self.devices.append(
+                (
+                    self.uuid(),
+                    f"gen-device-{i}",
+                    owner[0],
+                    f"GEN{i:010d}",
+                    self.random.choice(DESCRIPTIONS),
+                    lat,
+                    lon,
+                    geohash.encode(lat, lon),
+                    "active",
+                    created_at,
+                    created_at,
+                )
+            )
+        return self.devices
+
+    def prepare_invoices(self) -> None:
+        """Cumulative weights of days and devices, and device owners"""
+        last = max(len(self.days) - 1, 1)
+        self.day_starts = [
+            partitions.timezone.localize(
+                datetime.datetime.combine(day, datetime.time())
+            )
+            for day in self.days
+        ]
+        self.day_weights = list(
+            itertools.accumulate(
+                WEEKDAY_WEIGHTS[day.weekday()]
+                * MONTH_WEIGHTS[day.month - 1]
+                * (1 + (GROWTH - 1) * i / last)
+                for i, day in enumerate(self.days)
+            )
+        )
+        self.hour_weights = list(itertools.accumulate(HOUR_WEIGHTS))
+        self.device_weights = list(
+            itertools.accumulate(self.random.lognormvariate(0, 1) for _ in self.devices)
+        )
+        usernames = {user[0]: user[1] for user in self.users}
+        self.device_owners = [
+            (device[1], usernames[device[2]]) for device in self.devices
+        ]
+        self.invoice_counts = [0] * len(self.devices)
+
+    def generate_invoices(self, count: int) -> list[tuple]:
+        rnd = self.random
+        days = rnd.choices(self.day_starts, cum_weights=self.day_weights, k=count)
+        hours = rnd.choices(range(24), cum_weights=self.hour_weights, k=count)
+        devices = rnd.choices(
+            range(len(self.devices)), cum_weights=self.device_weights, k=count
+        )
+        mu = math.log(TOTAL_MEDIAN)
+        invoices = []
+        for day_start, hour, device in zip(days, hours, devices):
+            self.invoice_counts[device] += 1
+            device_name, username = self.device_owners[device]
+            invoice_date = day_start + datetime.timedelta(
+                hours=hour, seconds=rnd.random() * 3600
+            )
+            # prices end in hundreds of rupiah
+            total = Decimal(round(rnd.lognormvariate(mu, TOTAL_SIGMA), -2))
+            invoices.append(
+                (
+                    uuid.UUID(int=rnd.getrandbits(128), version=4),
+                    f"INV-{self.invoice_counts[device]:08d}",
+                    invoice_date,
+                    device_name,
+                    username,
+                    (total * TAX_RATE).quantize(CENT),
+                    total,
+                    invoice_date,
+                    invoice_date,
+                )
+            )
+        return invoices
+
+
+async def copy(table: str, columns: list[str], records: list[tuple]) -> None:
+    async with engine.begin() as connection:
+        raw = await connection.get_raw_connection()
+        await raw.driver_connection.copy_records_to_table(
+            table, records=records, columns=columns
+        )
+
+
+async def main(args: argparse.Namespace) -> None:
+    start = partitions.month_start(args.end)
+    for _ in range(args.months):
+        start = partitions.month_start(start - datetime.timedelta(days=1))
+    print(f"Generate data from {start} to {args.end}, seed {args.seed}")
+    async with engine.connect() as connection:
+        result = await connection.execute(
+            text("SELECT count(*) FROM \"user\" WHERE username LIKE 'gen-%'")
+        )
+        if result.scalar():
+            raise SystemExit("Generated users exist already, use an empty database")
+    async with engine.begin() as connection:
+        created = await partitions.ensure_partitions(connection, start, args.end)
+    print(f"Created partitions: {', '.join(created) or 'none'}")
+
+    generator = Generator(args.seed, start, args.end)
+    hashed_password = security.get_password_hash(PASSWORD)
+    await copy(
+        "user", USER_COLUMNS, generator.generate_users(args.users, hashed_password)
+    )
+    await copy("device", DEVICE_COLUMNS, generator.generate_devices(args.devices))
+    print(f"Loaded {args.users} users and {args.devices} devices")
+
+    generator.prepare_invoices()
+    sizes = [
+        min(args.chunk_size, args.invoices - offset)
+        for offset in range(0, args.invoices, args.chunk_size)
+    ]
+    started = time.perf_counter()
+    loaded = 0
+    pending = None
+    for i, size in enumerate(sizes):
+        chunk = await (pending or asyncio.to_thread(generator.generate_invoices, size))
+        if i + 1 < len(sizes):
+            # generate the next chunk while this one is copied
+            pending = asyncio.ensure_future(
+                asyncio.to_thread(generator.generate_invoices, sizes[i + 1])
+            )
+        await copy("invoice", INVOICE_COLUMNS, chunk)
+        loaded += len(chunk)
+        rate = loaded / (time.perf_counter() - started)
+        print(f"Loaded {loaded} of {args.invoices} invoices ({rate:.0f} rows/s)")
+
+    print("Rebuild invoice rollups")
+    async with SessionLocal() as session:
+        await rollups.rebuild(session, start, args.end)
+        await session.commit()
+    await engine.dispose()
+    print("Data generated")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--devices", type=int, default=10000)
+    parser.add_argument("--invoices", type=int, default=1000000)
+    parser.add_argument("--months", type=int, default=24)
+    parser.add_argument(
+        "--end",
+        type=datetime.date.fromisoformat,
+        default=partitions.next_month(datetime.date.today()),
+        help="exclusive, default: start of next month",
+    )
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_ROWS)
+    args = parser.parse_args()
+    asyncio.run(main(args))
@@ -0,0 +1,115 @@
+"""
+Import invoices from a CSV or NDJSON file, see `app/core/imports.py`.
+
+CSV files need a header with the columns invoice_num, invoice_date,
+device_name, username, tax_value and total_value, NDJSON files one object per
+line with these keys. Dates are ISO 8601, UTC when without offset:
+
+python -m app.import_invoices invoices.csv
+
+The id of the import job is printed first, an interrupted import is resumed
+with it:
+
+python -m app.import_invoices invoices.csv --job 0b6f8a4e-...
+
+Rejected rows (source line and reason) are written to invoices.csv.errors.csv
+or to the file given with --errors. Imported invoices are only sent to the
+invoice stream with --events.
+"""
+
+import argparse
+import asyncio
+import os
+import time
+import uuid
+
+from app.core import imports
+from app.core.session import SessionLocal, engine
+from app.model.models import ImportJob, ImportStatus
+
+
+class Progress:
+    """Rows per second since the start of this run"""
+
+    def __init__(self, done: int):
+        self.started = time.perf_counter()
+        self.done = done
+
+    def rate(self, done: int) -> float:
+        return (done - self.done) / max(time.perf_counter() - self.started, 1e-9)
+
+
+async def main(args: argparse.Namespace) -> None:
+    filename = os.path.abspath(args.file)
+    async with SessionLocal() as session:
+        if args.job:
+            job = await session.get(ImportJob, args.job)
+            if job is None:
+                raise SystemExit(f"Import job {args.job} not found")
+            if job.filename != filename:
+                raise SystemExit(f"Import job {job.id} imports {job.filename}")
+        else:
+            format = args.format or os.path.splitext(filename)[1].lstrip(".")
+            if format not in imports.FORMATS:
+                raise SystemExit("Unknown file format, use --format")
+            job = await imports.create_job(session, filename, format)
+        print(f"Import job {job.id} ({job.status.value})")
+
+        if job.status == ImportStatus.loading:
+            progress = Progress(job.loaded_rows)
+            with open(filename, newline="", encoding="utf-8") as file:
+                records = imports.READERS[job.format](file)
+                async for job in imports.load(session, job, records, args.chunk_size):
+                    print(
+                        f"Loaded {job.loaded_rows} rows through line "
+                        f"{job.loaded_through} ({progress.rate(job.loaded_rows):.0f}"
+                        " rows/s)"
+                    )
+            await imports.validate(session, job)
+            print(f"Validated, {job.rejected_rows} rows rejected")
+
+        if job.status == ImportStatus.merging:
+            progress = Progress(job.merged_rows + job.duplicate_rows)
+            async for job in imports.merge(session, job, args.merge_lines, args.events):
+                done = job.merged_rows + job.duplicate_rows
+                print(
+                    f"Merged through line {job.merged_through} of "
+                    f"{job.loaded_through}, {job.merged_rows} invoices imported "
+                    f"({progress.rate(done):.0f} rows/s)"
+                )
+            errors = args.errors or f"{filename}.errors.csv"
+            with open(errors, "w", newline="", encoding="utf-8") as file:
+                rejected = await imports.write_errors(session, job, file)
+            if rejected:
+                print(f"{rejected} rejected rows listed in {errors}")
+            await imports.finish(session, job)
+
+        print(
+            f"Import job {job.id} done: {job.merged_rows} invoices imported, "
+            f"{job.duplicate_rows} already stored, {job.rejected_rows} rejected"
+        )
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("file")
+    parser.add_argument("--format", choices=imports.FORMATS, help="default: extension")
+    parser.add_argument("--job", type=uuid.UUID, help="resume this import job")
+    parser.add_argument("--errors", help="default: FILE.errors.csv")
+    parser.add_argument(
+        "--chunk-size", type=int, default=imports.LOAD_CHUNK_ROWS, help="rows per COPY"
+    )
+    parser.add_argument(
+        "--merge-lines",
+        type=int,
+        default=imports.MERGE_CHUNK_LINES,
+        help="source lines merged per transaction",
+    )
+    parser.add_argument(
+        "--events", action="store_true", help="add imported invoices to the outbox"
+    )
+    args = parser.parse_args()
+    asyncio.run(main(args))
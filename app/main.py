@@ -1,11 +1,15 @@
 """Main FastAPI app instance declaration."""
 # import uvicorn
-from fastapi import FastAPI
+import os
+
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
 
 from app.api.api import api_router
-from app.core import config
+from app.core import config, metrics
+from app.core.hashing import password_hasher
+from app.core.session import check_connection_budget, engine, profile, replica_engine
 
 app = FastAPI(
     title=config.settings.PROJECT_NAME,
@@ -29,5 +33,43 @@ app.add_middleware(
 # Guards against HTTP Host Header attacks
 app.add_middleware(TrustedHostMiddleware, allowed_hosts=config.settings.ALLOWED_HOSTS)
 
+# Outermost, so rejected and failed requests are measured too
+app.add_middleware(metrics.PrometheusMiddleware)
+
+
+@app.get("/metrics", include_in_schema=False)
+def get_metrics():
+    """Prometheus scrape endpoint, see app.core.metrics"""
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+
+@app.on_event("startup")
+async def check_database_connections():
+    try:
+        for database in filter(None, [engine, replica_engine]):
+            await check_connection_budget(
+                database,
+                profile,
+                config.settings.WEB_CONCURRENCY,
+                config.settings.DB_RESERVED_CONNECTIONS,
+            )
+    except RuntimeError:
+        raise
+    except Exception as ex:
+        # database not reachable yet, the pool connects on first use
+        print(str(ex))
+
+
+@app.on_event("shutdown")
+def shutdown_password_hasher():
+    password_hasher.shutdown()
+
+
+@app.on_event("shutdown")
+def shutdown_metrics():
+    metrics.mark_process_dead(os.getpid())
+
+
 # if __name__ == "__main__":
 #     uvicorn.run(app, host="0.0.0.0", port=8008)
@@ -21,7 +21,21 @@ from typing import List, Optional
 
 import pytz
 from pydantic import EmailStr, condecimal
-from sqlmodel import VARCHAR, Column, DateTime, Enum, Field, Relationship, SQLModel
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlmodel import (
+    VARCHAR,
+    BigInteger,
+    Column,
+    Date,
+    DateTime,
+    Enum,
+    Field,
+    Index,
+    PrimaryKeyConstraint,
+    Relationship,
+    SQLModel,
+    UniqueConstraint,
+)
 
 from app.core.config import settings
 
@@ -45,6 +59,8 @@ class Status(str, enum.Enum):
 
 
 class User(SQLModel, table=True):
+    __table_args__ = (Index("ix_user_created_at_id", "created_at", "id"),)
+
     id: Optional[uuid.UUID] = Field(default_factory=uuid.uuid4, primary_key=True)
     username: EmailStr = Field(sa_column=Column("username", VARCHAR, unique=True))
     hashed_password: str
@@ -55,8 +71,9 @@ class User(SQLModel, table=True):
     last_name: Optional[str]
     address: Optional[str]
     role: Role = Field(sa_column=Column(Enum(Role)))
+    # NOT NULL, it is part of the keyset pagination cursor
     created_at: datetime.datetime = Field(
-        sa_column=Column("created_at", DateTime(timezone=True)), nullable=False
+        sa_column=Column("created_at", DateTime(timezone=True), nullable=False)
     )
     modified_at: datetime.datetime = Field(
         sa_column=Column("modified_at", DateTime(timezone=True)), nullable=False
@@ -65,18 +82,30 @@ class User(SQLModel, table=True):
 
 
 class Device(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_device_created_at_id", "created_at", "id"),
+        Index("ix_device_geohash", "geohash"),
+    )
+
     id: Optional[uuid.UUID] = Field(default_factory=uuid.uuid4, primary_key=True)
     name: Optional[str] = Field(
         sa_column=Column("name", VARCHAR, unique=True), primary_key=True
     )
-    user_id: Optional[uuid.UUID] = Field(default=None, foreign_key="user.id")
+    user_id: Optional[uuid.UUID] = Field(
+        default=None, foreign_key="user.id", index=True
+    )
     serial_num: Optional[str]
     description: Optional[str]
     lat: Optional[float]
     lon: Optional[float]
+    # of (lat, lon), byte ordered for prefix range scans, see app.core.geohash
+    geohash: Optional[str] = Field(
+        sa_column=Column("geohash", VARCHAR(12, collation="C"))
+    )
     status: Status = Field(sa_column=Column(Enum(Status)))
+    # NOT NULL, it is part of the keyset pagination cursor
     created_at: datetime.datetime = Field(
-        sa_column=Column("created_at", DateTime(timezone=True)), nullable=False
+        sa_column=Column("created_at", DateTime(timezone=True), nullable=False)
     )
     modified_at: datetime.datetime = Field(
         sa_column=Column("modified_at", DateTime(timezone=True)), nullable=False
@@ -85,10 +114,30 @@ class Device(SQLModel, table=True):
 
 
 class Invoice(SQLModel, table=True):
+    """Partitioned by month of `invoice_date`, see `app/core/partitions.py`
+
+    Unique keys of a partitioned table must contain the partition key, hence
+    `invoice_date` in the primary key and in the resubmission key.
+    """
+
+    __table_args__ = (
+        # resubmitted invoices are ignored, see `submit_invoice`
+        UniqueConstraint(
+            "device_name",
+            "invoice_num",
+            "invoice_date",
+            name="uq_invoice_device_name_invoice_num_invoice_date",
+        ),
+        Index("ix_invoice_username_invoice_date", "username", "invoice_date"),
+        Index("ix_invoice_invoice_date", "invoice_date"),
+        {"postgresql_partition_by": "RANGE (invoice_date)"},
+    )
+
     id: Optional[uuid.UUID] = Field(default_factory=uuid.uuid4, primary_key=True)
     invoice_num: Optional[str]
     invoice_date: datetime.datetime = Field(
-        sa_column=Column("invoice_date", DateTime(timezone=True)), nullable=False
+        sa_column=Column("invoice_date", DateTime(timezone=True), primary_key=True),
+        nullable=False,
     )
     device_name: Optional[str] = Field(default=None, foreign_key="device.name")
     username: Optional[EmailStr] = Field(default=None, foreign_key="user.username")
@@ -100,3 +149,93 @@ class Invoice(SQLModel, table=True):
     modified_at: datetime.datetime = Field(
         sa_column=Column("modified_at", DateTime(timezone=True)), nullable=False
     )
+
+
+class Outbox(SQLModel, table=True):
+    """Events written in the same transaction as their data, see `app/relay.py`"""
+
+    __table_args__ = (Index("ix_outbox_topic_id", "topic", "id"),)
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    topic: str
+    payload: dict = Field(sa_column=Column("payload", JSONB, nullable=False))
+    created_at: datetime.datetime = Field(
+        sa_column=Column("created_at", DateTime(timezone=True)), nullable=False
+    )
+
+
+class InvoiceDailyRollup(SQLModel, table=True):
+    """Invoice totals per device and merchant and day (in `TIMEZONE`)
+
+    Maintained in the invoice write transaction, see `app/core/rollups.py`.
+    """
+
+    __tablename__ = "invoice_daily_rollup"
+    __table_args__ = (Index("ix_invoice_daily_rollup_username_day", "username", "day"),)
+
+    day: datetime.date = Field(sa_column=Column("day", Date, primary_key=True))
+    device_name: str = Field(primary_key=True)
+    username: str = Field(primary_key=True)
+    invoice_count: int = Field(default=0)
+    tax_value: condecimal(max_digits=20, decimal_places=2) = Field(default=0)
+    total_value: condecimal(max_digits=20, decimal_places=2) = Field(default=0)
+
+
+class ImportStatus(str, enum.Enum):
+    loading = "Loading"
+    merging = "Merging"
+    done = "Done"
+
+
+class ImportJob(SQLModel, table=True):
+    """Progress of an invoice import, see `app/import_invoices.py`
+
+    `loaded_through` and `merged_through` are the last source line staged and
+    merged, a resumed import continues after them.
+    """
+
+    __tablename__ = "import_job"
+
+    id: Optional[uuid.UUID] = Field(default_factory=uuid.uuid4, primary_key=True)
+    filename: str
+    format: str
+    status: ImportStatus = Field(sa_column=Column(Enum(ImportStatus)))
+    loaded_through: int = Field(default=0, sa_column=Column(BigInteger))
+    merged_through: int = Field(default=0, sa_column=Column(BigInteger))
+    loaded_rows: int = Field(default=0)
+    rejected_rows: int = Field(default=0)
+    merged_rows: int = Field(default=0)
+    duplicate_rows: int = Field(default=0)
+    created_at: datetime.datetime = Field(
+        sa_column=Column("created_at", DateTime(timezone=True)), nullable=False
+    )
+    modified_at: datetime.datetime = Field(
+        sa_column=Column("modified_at", DateTime(timezone=True)), nullable=False
+    )
+
+
+class InvoiceImportStaging(SQLModel, table=True):
+    """Source rows of import jobs, loaded with COPY and merged into `invoice`
+
+    Unlogged: nothing is written to the WAL, the rows are lost on a crash of
+    the database server (the import is then started over).
+    """
+
+    __tablename__ = "invoice_import_staging"
+    __table_args__ = (
+        PrimaryKeyConstraint("job_id", "line"),
+        {"prefixes": ["UNLOGGED"]},
+    )
+
+    job_id: uuid.UUID = Field(primary_key=True)
+    line: int = Field(sa_column=Column("line", BigInteger, primary_key=True))
+    invoice_num: Optional[str]
+    invoice_date: Optional[datetime.datetime] = Field(
+        sa_column=Column("invoice_date", DateTime(timezone=True))
+    )
+    device_name: Optional[str]
+    username: Optional[str]
+    tax_value: Optional[condecimal(max_digits=15, decimal_places=2)]
+    total_value: Optional[condecimal(max_digits=15, decimal_places=2)]
+    # why the row is not merged, set while parsing or by validation
+    error: Optional[str]
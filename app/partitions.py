@@ -0,0 +1,69 @@
+"""
+Manage monthly partitions of the invoice table, see `app/core/partitions.py`.
+
+Create partitions for the current and the next 3 months (run it daily, it is
+also included in `init.sh`):
+
+python -m app.partitions create --months-ahead 3
+
+Detach partitions older than 24 months and move them to schema `archive`
+(or drop them with --drop):
+
+python -m app.partitions detach --keep-months 24 --archive-schema archive
+"""
+
+import argparse
+import asyncio
+import datetime
+
+from app.core import partitions
+from app.core.session import engine
+
+
+async def create(months_ahead: int) -> None:
+    today = datetime.datetime.now(partitions.timezone).date()
+    end = partitions.month_start(today)
+    for _ in range(months_ahead + 1):
+        end = partitions.next_month(end)
+    async with engine.begin() as connection:
+        created = await partitions.ensure_partitions(connection, today, end)
+    print(f"Created partitions: {', '.join(created) or 'none'}")
+
+
+async def detach(keep_months: int, archive_schema: str | None, drop: bool) -> None:
+    before = partitions.month_start(datetime.datetime.now(partitions.timezone).date())
+    for _ in range(keep_months):
+        before = (before - datetime.timedelta(days=1)).replace(day=1)
+    async with engine.begin() as connection:
+        detached = await partitions.detach_partitions(
+            connection, before, archive_schema=archive_schema, drop=drop
+        )
+    print(f"Detached partitions: {', '.join(detached) or 'none'}")
+
+
+async def main(args: argparse.Namespace) -> None:
+    if args.command == "create":
+        await create(args.months_ahead)
+    else:
+        await detach(args.keep_months, args.archive_schema, args.drop)
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    create_parser = commands.add_parser("create")
+    create_parser.add_argument("--months-ahead", type=int, default=3)
+    detach_parser = commands.add_parser("detach")
+    detach_parser.add_argument("--keep-months", type=int, required=True)
+    detach_parser.add_argument("--archive-schema")
+    detach_parser.add_argument("--drop", action="store_true")
+    args = parser.parse_args()
+    if args.command == "detach":
+        if args.archive_schema and not args.archive_schema.isidentifier():
+            parser.error("--archive-schema must be a plain identifier")
+        if args.keep_months < 1:
+            parser.error("--keep-months must be at least 1")
+    asyncio.run(main(args))
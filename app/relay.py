@@ -0,0 +1,42 @@
+"""
+Outbox relay, moves committed invoice events to the Celery worker.
+
+Run it next to the API (any number of instances):
+
+python -m app.relay
+"""
+
+import asyncio
+
+from app.core import outbox
+from app.core.config import settings
+from app.core.session import SessionLocal
+from app.worker import task_put_invoices
+
+
+def deliver_invoices(payloads: list[dict]) -> None:
+    # retried by the worker until Kinesis has them all, see app.core.outbox
+    task_put_invoices.delay(payloads)
+
+
+async def main() -> None:
+    print("Start outbox relay")
+    while True:
+        try:
+            async with SessionLocal() as session:
+                count = await outbox.relay(
+                    session,
+                    outbox.INVOICE_TOPIC,
+                    deliver_invoices,
+                    settings.OUTBOX_RELAY_BATCH_SIZE,
+                )
+        except Exception as ex:
+            print(f"Outbox relay failed: {ex}")
+            count = 0
+        if count < settings.OUTBOX_RELAY_BATCH_SIZE:
+            # drained, wait for new events
+            await asyncio.sleep(settings.OUTBOX_RELAY_POLL_SECONDS)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,75 @@
+"""
+Device ownership lookups for invoice submission.
+
+The names of the devices of a user are cached per user id, so checking that
+an invoice comes from one of the user's devices is a set lookup without a
+query once the cache is warm. Endpoints changing the owner or name of a
+device must call `invalidate_owned_devices` for every user affected (old and
+new owner) after commit.
+
+Entries are keyed by a per user generation, like `response_cache`: the
+generation is read before the query and invalidation moves the user to a new
+one, so names read while an ownership change commits are stored under the
+old generation and never served.
+
+Ownership authorizes invoices, so the cache is only used when invalidation
+reaches every app process (redis backend, or a single process), see
+`cache.create_cache`.
+"""
+
+import time
+import uuid
+from typing import Optional
+
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core import cache, config
+from app.model.models import Device
+
+# generations must outlive the entries stored under them
+GENERATION_TTL_SECONDS = 86400
+
+owned_devices_cache = cache.create_cache(
+    "owned_devices",
+    ttl=config.settings.DEVICE_OWNER_CACHE_TTL_SECONDS,
+    max_size=config.settings.DEVICE_OWNER_CACHE_MAX_SIZE,
+    shared=True,
+)
+owned_devices_generations = cache.create_cache(
+    "owned_devices_generation",
+    ttl=GENERATION_TTL_SECONDS,
+    max_size=config.settings.DEVICE_OWNER_CACHE_MAX_SIZE,
+    shared=True,
+)
+
+
+async def _generation(user_id: uuid.UUID) -> int:
+    """Time (ns) of the last ownership change of the user, starts a new
+    generation when unknown"""
+    generation = await owned_devices_generations.get(str(user_id))
+    if generation is None:
+        generation = time.time_ns()
+        await owned_devices_generations.set(str(user_id), generation)
+    return int(generation)
+
+
+async def owned_device_names(
+    session: AsyncSession, user_id: uuid.UUID
+) -> frozenset[str]:
+    key = f"{user_id}:{await _generation(user_id)}"
+    names = await owned_devices_cache.get(key)
+    if names is None:
+        result = await session.exec(
+            select(Device.name).where(Device.user_id == user_id)
+        )
+        names = frozenset(result.all())
+        await owned_devices_cache.set(key, names)
+    # the redis backend gives back a list
+    return names if isinstance(names, frozenset) else frozenset(names)
+
+
+async def invalidate_owned_devices(*user_ids: Optional[uuid.UUID]) -> None:
+    for user_id in user_ids:
+        if user_id is not None:
+            await owned_devices_generations.set(str(user_id), time.time_ns())
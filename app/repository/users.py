@@ -0,0 +1,94 @@
+"""
+Users loaded together with their devices, in one round trip.
+
+A user and its devices come from a single `LEFT JOIN` query, a page of users
+from the same join restricted to the ids of the page, never one query per
+user. Rows are grouped back per user and returned as `UserDeviceInResponse`.
+
+Note: `User.devices` is not usable for eager loading, the SQLModel version we
+pin does not map `Relationship` attributes with SQLAlchemy 1.4.36, hence the
+explicit join.
+"""
+
+import datetime
+import uuid
+from typing import Optional
+
+from sqlmodel import select
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from app.core import pagination
+from app.model.models import Device, Role, User
+from app.schemas.responses import UserDeviceInResponse
+
+
+def _with_devices_statement(*criteria):
+    return (
+        select(User, Device)
+        .outerjoin(Device, Device.user_id == User.id)
+        .where(*criteria)
+        .order_by(User.created_at, User.id, Device.created_at, Device.id)
+    )
+
+
+def _group(rows) -> tuple[list[User], list[UserDeviceInResponse]]:
+    devices: dict[uuid.UUID, list[Device]] = {}
+    users: list[User] = []
+    for user, device in rows:
+        if user.id not in devices:
+            devices[user.id] = []
+            users.append(user)
+        if device is not None:
+            devices[user.id].append(device)
+    return users, [
+        UserDeviceInResponse(
+            **user.dict(exclude={"hashed_password"}), devices=devices[user.id]
+        )
+        for user in users
+    ]
+
+
+async def get_with_devices(
+    session: AsyncSession, user_id: uuid.UUID
+) -> Optional[UserDeviceInResponse]:
+    user, _ = await get_with_devices_modified(session, user_id)
+    return user
+
+
+async def get_with_devices_modified(
+    session: AsyncSession, user_id: uuid.UUID
+) -> tuple[Optional[UserDeviceInResponse], Optional[datetime.datetime]]:
+    """User with devices, and the latest `modified_at` of the user and devices"""
+    result = await session.exec(_with_devices_statement(User.id == user_id))
+    rows = result.all()
+    _, responses = _group(rows)
+    last_modified = max(
+        (entity.modified_at for row in rows for entity in row if entity is not None),
+        default=None,
+    )
+    return (responses[0], last_modified) if responses else (None, None)
+
+
+async def list_with_devices(
+    session: AsyncSession,
+    role: Optional[Role] = None,
+    created_from: Optional[datetime.datetime] = None,
+    created_to: Optional[datetime.datetime] = None,
+    cursor: Optional[str] = None,
+    limit: int = 100,
+) -> tuple[list[UserDeviceInResponse], Optional[str]]:
+    """
+    Page of users ordered like `get_user_list`, with the cursor of the next
+    page (see app.core.pagination)
+    """
+    page = select(User.id)
+    if role:
+        page = page.where(User.role == role)
+    if created_from:
+        page = page.where(User.created_at >= created_from)
+    if created_to:
+        page = page.where(User.created_at < created_to)
+    page = pagination.paginate(page, User, cursor, limit)
+    result = await session.exec(_with_devices_statement(User.id.in_(page)))
+    users, responses = _group(result.all())
+    return responses, pagination.next_cursor(users, limit)
@@ -0,0 +1,31 @@
+"""
+Rebuild invoice rollups of a date range from the invoice table.
+
+Rollups are kept up to date by the invoice endpoints, run this after bulk
+loads or to repair them:
+
+python -m app.rollups 2022-01-01 2023-01-01
+"""
+
+import argparse
+import asyncio
+import datetime
+
+from app.core import rollups
+from app.core.session import SessionLocal
+
+
+async def main(start: datetime.date, end: datetime.date) -> None:
+    print(f"Rebuild invoice rollups from {start} to {end}")
+    async with SessionLocal() as session:
+        await rollups.rebuild(session, start, end)
+        await session.commit()
+    print("Invoice rollups rebuilt")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("start", type=datetime.date.fromisoformat)
+    parser.add_argument("end", type=datetime.date.fromisoformat, help="exclusive")
+    args = parser.parse_args()
+    asyncio.run(main(args.start, args.end))
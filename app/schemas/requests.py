@@ -1,8 +1,10 @@
 import datetime
+import enum
 from typing import Optional
 
-from pydantic import BaseModel, EmailStr, condecimal
+from pydantic import BaseModel, EmailStr, condecimal, conlist
 
+from app.core.config import settings
 from app.model.models import Role
 
 
@@ -45,6 +47,37 @@ class DeviceAssignRequest(BaseRequest):
     description: Optional[str]
 
 
+class DeviceBulkCreateRequest(BaseRequest):
+    devices: conlist(
+        DeviceCreateRequest, min_items=1, max_items=settings.DEVICE_BULK_MAX_SIZE
+    )
+
+
+class DeviceBulkAssignItemRequest(DeviceAssignRequest):
+    device_name: str
+    username: EmailStr
+
+
+class DeviceBulkAssignRequest(BaseRequest):
+    devices: conlist(
+        DeviceBulkAssignItemRequest,
+        min_items=1,
+        max_items=settings.DEVICE_BULK_MAX_SIZE,
+    )
+
+
+class DeviceBulkUnassignItemRequest(BaseRequest):
+    device_name: str
+
+
+class DeviceBulkUnassignRequest(BaseRequest):
+    devices: conlist(
+        DeviceBulkUnassignItemRequest,
+        min_items=1,
+        max_items=settings.DEVICE_BULK_MAX_SIZE,
+    )
+
+
 class InvoiceBaseRequest(BaseRequest):
     invoice_num: str
     invoice_date: datetime.datetime
@@ -52,3 +85,25 @@ class InvoiceBaseRequest(BaseRequest):
     username: str
     tax_value: condecimal(max_digits=15, decimal_places=2)
     total_value: condecimal(max_digits=15, decimal_places=2)
+
+
+class InvoiceBatchRequest(BaseRequest):
+    invoices: conlist(
+        InvoiceBaseRequest, min_items=1, max_items=settings.INVOICE_BATCH_MAX_SIZE
+    )
+
+
+class ReportPeriod(str, enum.Enum):
+    day = "day"
+    week = "week"
+    month = "month"
+
+
+class ReportGroup(str, enum.Enum):
+    merchant = "merchant"
+    device = "device"
+
+
+class ExportFormat(str, enum.Enum):
+    csv = "csv"
+    parquet = "parquet"
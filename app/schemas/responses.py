@@ -67,6 +67,10 @@ class DeviceResponse(BaseResponse):
     owner: Optional[UserDeviceResponse] = None
 
 
+class DeviceGeoResponse(DeviceResponse):
+    distance_m: Optional[float] = None
+
+
 class DeviceAssignResponse(BaseResponse):
     id: uuid.UUID
     name: str
@@ -74,6 +78,19 @@ class DeviceAssignResponse(BaseResponse):
     status: Status
 
 
+class DeviceBulkItemResponse(BaseResponse):
+    index: int
+    ok: bool
+    detail: Optional[str] = None
+    device: Optional[DeviceAssignResponse] = None
+
+
+class DeviceBulkResponse(BaseResponse):
+    accepted: int
+    rejected: int
+    results: List[DeviceBulkItemResponse] = []
+
+
 class UserDeviceReadResponse(UserResponse):
     role: Role
     devices: List[DeviceCreatedResponse] = []
@@ -91,3 +108,25 @@ class InvoiceBaseResponse(BaseResponse):
     invoice_date: datetime.datetime
     tax_value: condecimal(max_digits=15, decimal_places=2)
     total_value: condecimal(max_digits=15, decimal_places=2)
+
+
+class InvoiceBatchItemResponse(BaseResponse):
+    index: int
+    ok: bool
+    detail: Optional[str] = None
+    invoice: Optional[InvoiceBaseResponse] = None
+
+
+class InvoiceBatchResponse(BaseResponse):
+    accepted: int
+    rejected: int
+    results: List[InvoiceBatchItemResponse] = []
+
+
+class TaxReportResponse(BaseResponse):
+    period: datetime.date
+    username: Optional[str] = None
+    device_name: Optional[str] = None
+    invoice_count: int
+    tax_value: condecimal(max_digits=20, decimal_places=2)
+    total_value: condecimal(max_digits=20, decimal_places=2)
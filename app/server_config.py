@@ -0,0 +1,54 @@
+"""
+Render the NGINX Unit configuration of the API from the settings.
+
+`init.sh` applies it when the container starts for the first time, in place
+of `nginx-unit-config.json` (which it takes as base):
+
+python -m app.server_config --base nginx-unit-config.json > unit.json
+curl -X PUT --data-binary @unit.json \\
+    --unix-socket /var/run/control.unit.sock http://localhost/config
+
+* WEB_CONCURRENCY processes (default: one per CPU available) with a single
+  thread each, handlers are async and one event loop keeps a core busy
+* a process is replaced after WEB_MAX_REQUESTS requests: Unit starts a new
+  one and the old one finishes the requests it is serving
+* requests are cut after WEB_REQUEST_TIMEOUT_SECONDS
+
+Database pools are per process, DB_CONNECTION_BUDGET sizes them for
+WEB_CONCURRENCY processes (see app/core/session.py).
+"""
+
+import argparse
+import json
+
+from app.core import config
+
+APPLICATION = "fastapi"
+
+
+def render(base: dict, settings: config.Settings) -> dict:
+    application = base["applications"][APPLICATION]
+    application["processes"] = settings.WEB_CONCURRENCY
+    application["threads"] = 1
+    limits = {"timeout": settings.WEB_REQUEST_TIMEOUT_SECONDS}
+    if settings.WEB_MAX_REQUESTS:
+        limits["requests"] = settings.WEB_MAX_REQUESTS
+    application["limits"] = limits
+    # the app checks its connection budget against the process count
+    application.setdefault("environment", {})["WEB_CONCURRENCY"] = str(
+        settings.WEB_CONCURRENCY
+    )
+    return base
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--base", default=str(config.PROJECT_DIR / "nginx-unit-config.json")
+    )
+    args = parser.parse_args()
+    with open(args.base) as file:
+        base = json.load(file)
+    print(json.dumps(render(base, config.settings), indent=2))
@@ -0,0 +1,60 @@
+import pytest
+
+from app.core import cache, config
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, "monotonic", lambda: now[0])
+    return now
+
+
+async def test_memory_cache_expires_entries(clock):
+    memory = cache.MemoryCache("test", ttl=10, max_size=10)
+    await memory.set("key", "value")
+    clock[0] += 9
+    assert await memory.get("key") == "value"
+    clock[0] += 2
+    assert await memory.get("key") is None
+
+
+async def test_memory_cache_evicts_least_recently_used():
+    memory = cache.MemoryCache("test", ttl=10, max_size=2)
+    await memory.set("a", 1)
+    await memory.set("b", 2)
+    await memory.get("a")
+    await memory.set("c", 3)
+    assert [await memory.get(key) for key in "abc"] == [1, None, 3]
+    await memory.delete("a")
+    assert await memory.get("a") is None
+
+
+@pytest.mark.parametrize(
+    "backend, processes, shared",
+    [("memory", 1, True), ("memory", 4, False), ("redis", 4, True), ("none", 1, False)],
+)
+def test_is_shared(monkeypatch, backend, processes, shared):
+    monkeypatch.setattr(config.settings, "CACHE_BACKEND", backend)
+    monkeypatch.setattr(config.settings, "WEB_CONCURRENCY", processes)
+    assert cache.is_shared() is shared
+
+
+@pytest.mark.parametrize(
+    "processes, shared, enabled",
+    [(1, True, True), (4, False, True), (4, True, False)],
+)
+def test_shared_memory_cache_is_disabled_with_many_processes(
+    monkeypatch, processes, shared, enabled
+):
+    monkeypatch.setattr(config.settings, "CACHE_BACKEND", "memory")
+    monkeypatch.setattr(config.settings, "WEB_CONCURRENCY", processes)
+    created = cache.create_cache("test", ttl=10, max_size=10, shared=shared)
+    assert created.enabled is enabled
+
+
+async def test_disabled_cache_stores_nothing(monkeypatch):
+    monkeypatch.setattr(config.settings, "CACHE_BACKEND", "none")
+    disabled = cache.create_cache("test", ttl=10, max_size=10)
+    await disabled.set("key", "value")
+    assert await disabled.get("key") is None
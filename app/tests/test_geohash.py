@@ -0,0 +1,20 @@
+from app.core import geohash
+
+
+def test_encode():
+    assert geohash.encode(57.64911, 10.40744, precision=11) == "u4pruydqqvj"
+    assert geohash.encode(-6.2, 106.816666) == geohash.encode(-6.2, 106.816666, 12)
+
+
+def test_cover_contains_the_points_of_the_box():
+    box = (-6.3, 106.7, -6.1, 106.9)
+    cells = geohash.cover(*box)
+    assert 0 < len(cells) <= 16
+    for lat, lon in [(-6.3, 106.7), (-6.2, 106.8), (-6.1, 106.9)]:
+        assert any(geohash.encode(lat, lon).startswith(cell) for cell in cells)
+
+
+def test_radius_box():
+    min_lat, min_lon, max_lat, max_lon = geohash.radius_box(0, 0, 111195)
+    assert round(max_lat, 3) == 1.0 and round(min_lat, 3) == -1.0
+    assert round(max_lon, 3) == 1.0 and round(min_lon, 3) == -1.0
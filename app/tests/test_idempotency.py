@@ -0,0 +1,50 @@
+from decimal import Decimal
+
+import pytest
+from fastapi import HTTPException
+
+from app.api.endpoints import invoices
+from app.core import cache
+from app.schemas.requests import InvoiceBaseRequest
+
+
+@pytest.fixture(autouse=True)
+def idempotency_cache(monkeypatch):
+    memory = cache.MemoryCache("idempotency", ttl=60, max_size=10)
+    monkeypatch.setattr(invoices, "idempotency_cache", memory)
+    return memory
+
+
+def invoice(**update) -> InvoiceBaseRequest:
+    return InvoiceBaseRequest(
+        **{
+            "invoice_num": "INV-1",
+            "invoice_date": "2026-10-17T08:00:00+07:00",
+            "device_name": "device-1",
+            "username": "merchant@example.com",
+            "tax_value": Decimal("10.00"),
+            "total_value": Decimal("110.00"),
+            **update,
+        }
+    )
+
+
+async def test_first_use_and_no_key_are_not_replayed():
+    assert await invoices._replay("invoice:user:key", invoice()) is None
+    await invoices._remember(None, invoice(), {"id": "1"})
+    assert await invoices._replay(None, invoice()) is None
+
+
+async def test_same_request_is_replayed():
+    response = {"id": "1", "tax_value": Decimal("10.00")}
+    await invoices._remember("invoice:user:key", invoice(), response)
+    replayed = await invoices._replay("invoice:user:key", invoice())
+    # amounts kept as exact strings
+    assert replayed == {"id": "1", "tax_value": "10.00"}
+
+
+async def test_key_reused_for_another_request_is_rejected():
+    await invoices._remember("invoice:user:key", invoice(), {"id": "1"})
+    with pytest.raises(HTTPException) as ex:
+        await invoices._replay("invoice:user:key", invoice(invoice_num="INV-2"))
+    assert ex.value.status_code == 422
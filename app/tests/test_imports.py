@@ -0,0 +1,83 @@
+import datetime
+import io
+from decimal import Decimal
+
+import pytest
+
+from app.core import imports
+
+NOW = datetime.datetime.now(datetime.timezone.utc)
+WINDOW = (NOW - datetime.timedelta(days=30), NOW + datetime.timedelta(days=1))
+
+
+def values(**update) -> dict:
+    return {
+        "invoice_num": "INV-1",
+        "invoice_date": NOW.isoformat(),
+        "device_name": "device-1",
+        "username": "merchant@example.com",
+        "tax_value": "10.00",
+        "total_value": "110.5",
+        **update,
+    }
+
+
+def test_staged_row():
+    row = imports.staged_row("job", 2, values(), None, WINDOW)
+    assert row == (
+        "job",
+        2,
+        "INV-1",
+        NOW,
+        "device-1",
+        "merchant@example.com",
+        Decimal("10.00"),
+        Decimal("110.5"),
+        None,
+    )
+
+
+def test_naive_and_zulu_dates_are_utc():
+    date = NOW.replace(microsecond=0, tzinfo=None).isoformat()
+    for invoice_date in (date, date + "Z"):
+        row = imports.staged_row(
+            "job", 2, values(invoice_date=invoice_date), None, WINDOW
+        )
+        assert row[3] == NOW.replace(microsecond=0)
+
+
+@pytest.mark.parametrize(
+    "update, error",
+    [
+        ({"device_name": ""}, "device_name: missing"),
+        ({"username": None}, "username: missing"),
+        ({"invoice_date": "17/10/2026"}, "invoice_date: "),
+        ({"invoice_date": "2016-10-17T00:00:00Z"}, "invoice_date: not between"),
+        ({"tax_value": "ten"}, "tax_value: not a decimal"),
+        ({"tax_value": "1.005"}, "tax_value: not a decimal of at most"),
+        ({"total_value": "1e13"}, "total_value: not a decimal of at most"),
+        ({"total_value": "NaN"}, "total_value: not a decimal of at most"),
+    ],
+)
+def test_rejected_values(update, error):
+    row = imports.staged_row("job", 2, values(**update), None, WINDOW)
+    assert row[2:8] == (None,) * 6
+    assert row[-1].startswith(error)
+
+
+def test_read_error_is_kept():
+    row = imports.staged_row("job", 3, None, "not valid JSON", WINDOW)
+    assert row == ("job", 3, None, None, None, None, None, None, "not valid JSON")
+
+
+def test_read_csv():
+    header = ",".join(imports.COLUMNS)
+    rows = list(imports.read_csv(io.StringIO(f"{header}\na,b,c,d,e,f\n")))
+    assert rows == [(2, dict(zip(imports.COLUMNS, "abcdef")), None)]
+    with pytest.raises(ValueError, match="CSV header misses username"):
+        list(imports.read_csv(io.StringIO(header.replace("username", "user"))))
+
+
+def test_read_ndjson():
+    rows = list(imports.read_ndjson(io.StringIO('{"a": 1}\n\n{oops\n')))
+    assert rows == [(1, {"a": 1}, None), (3, None, "not valid JSON")]
@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+from app.core.kinesis import KinesisDeliveryError, KinesisProducer
+
+
+class StubKinesis:
+    """put_records of a stream, failing the first `failures` calls as told"""
+
+    def __init__(self, failures: list[str]):
+        # "raise" the whole call, "partial" the first entry of the batch
+        self.failures = failures
+        self.calls = 0
+        self.delivered: list[int] = []
+
+    def put_records(self, StreamName: str, Records: list[dict]) -> dict:
+        self.calls += 1
+        failure = self.failures.pop(0) if self.failures else None
+        if failure == "raise":
+            raise ConnectionError("stream unreachable")
+        results = []
+        for i, record in enumerate(Records):
+            if failure == "partial" and i == 0:
+                results.append({"ErrorCode": "ProvisionedThroughputExceededException"})
+            else:
+                self.delivered.append(json.loads(record["Data"])["n"])
+                results.append({"SequenceNumber": str(len(self.delivered))})
+        failed = sum("ErrorCode" in result for result in results)
+        return {"FailedRecordCount": failed, "Records": results}
+
+
+def producer(stub: StubKinesis, max_retries: int = 0) -> KinesisProducer:
+    return KinesisProducer(
+        "invoices",
+        client_factory=lambda: stub,
+        flush_interval=3600,
+        max_retries=max_retries,
+        max_records=3,
+    )
+
+
+@pytest.mark.parametrize("failure", ["raise", "partial"])
+def test_failed_batch_is_delivered_once_by_next_flush(failure):
+    stub = StubKinesis([failure])
+    kinesis = producer(stub)
+    for n in range(10):
+        # the fourth record sends the first batch, which fails
+        kinesis.put({"n": n}, partition_key=f"device-{n}")
+    assert kinesis.flush()
+    kinesis.close()
+    assert sorted(stub.delivered) == list(range(10))
+
+
+@pytest.mark.parametrize("failure", ["raise", "partial"])
+def test_failed_flush_keeps_records_for_the_next_one(failure):
+    stub = StubKinesis([failure])
+    kinesis = producer(stub)
+    for n in range(3):
+        kinesis.put({"n": n}, partition_key="device")
+    assert not kinesis.flush()
+    assert kinesis.flush()
+    kinesis.close()
+    assert sorted(stub.delivered) == [0, 1, 2]
+
+
+def test_failed_entries_are_retried_without_the_delivered_ones():
+    stub = StubKinesis(["partial"])
+    kinesis = producer(stub, max_retries=1)
+    for n in range(3):
+        kinesis.put({"n": n}, partition_key="device")
+    assert kinesis.flush()
+    kinesis.close()
+    assert stub.calls == 2
+    assert sorted(stub.delivered) == [0, 1, 2]
+
+
+def test_send_retries_failed_entries_without_the_buffer():
+    stub = StubKinesis(["partial"])
+    kinesis = producer(stub, max_retries=1)
+    kinesis.send([({"n": n}, f"device-{n}") for n in range(7)])
+    assert sorted(stub.delivered) == list(range(7))
+    assert kinesis.flush()
+    assert stub.calls == 4
+
+
+@pytest.mark.parametrize("failure", ["raise", "partial"])
+def test_send_raises_with_the_records_not_delivered(failure):
+    stub = StubKinesis([failure])
+    kinesis = producer(stub)
+    with pytest.raises(KinesisDeliveryError) as raised:
+        kinesis.send([({"n": n}, "device") for n in range(5)])
+    failed = [json.loads(record["Data"])["n"] for record in raised.value.records]
+    # first batch of 3 failed (all of it, or its first entry), nothing buffered
+    assert failed == ([0, 1, 2] if failure == "raise" else [0])
+    assert sorted(stub.delivered + failed) == list(range(5))
+    assert kinesis.flush()
+    assert stub.calls == 2
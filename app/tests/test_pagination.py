@@ -0,0 +1,32 @@
+import datetime
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from fastapi import HTTPException
+
+from app.core import pagination
+
+
+def test_cursor_round_trip():
+    created_at = datetime.datetime(2026, 10, 17, 8, 30, tzinfo=datetime.timezone.utc)
+    id = uuid.uuid4()
+    cursor = pagination.encode_cursor(created_at, id)
+    assert pagination.decode_cursor(cursor) == (created_at, id)
+
+
+@pytest.mark.parametrize("cursor", ["not a cursor", "WyJ4Il0=", "WyJ4IiwgInkiXQ=="])
+def test_invalid_cursor_is_a_bad_request(cursor):
+    with pytest.raises(HTTPException) as ex:
+        pagination.decode_cursor(cursor)
+    assert ex.value.status_code == 400
+
+
+def test_next_cursor_only_on_full_pages():
+    now = datetime.datetime.now(datetime.timezone.utc)
+    rows = [SimpleNamespace(created_at=now, id=uuid.uuid4()) for _ in range(3)]
+    assert pagination.next_cursor(rows[:2], limit=3) is None
+    assert pagination.decode_cursor(pagination.next_cursor(rows, limit=3)) == (
+        now,
+        rows[-1].id,
+    )
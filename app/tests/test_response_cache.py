@@ -0,0 +1,98 @@
+import datetime
+import email.utils
+
+import pytest
+from starlette.requests import Request
+
+from app.core import config, response_cache
+
+
+@pytest.fixture
+def responses(monkeypatch):
+    monkeypatch.setattr(config.settings, "CACHE_BACKEND", "memory")
+    monkeypatch.setattr(config.settings, "WEB_CONCURRENCY", 1)
+    return response_cache.ResponseCache("test", ttl=60, max_size=100)
+
+
+def request(query: str = "", **headers) -> Request:
+    return Request(
+        {
+            "type": "http",
+            "method": "GET",
+            "path": "/api/v1/devices/",
+            "query_string": query.encode(),
+            "headers": [
+                (name.replace("_", "-").encode(), value.encode())
+                for name, value in headers.items()
+            ],
+        }
+    )
+
+
+LAST_MODIFIED = datetime.datetime(2026, 10, 17, tzinfo=datetime.timezone.utc)
+
+
+async def stored(responses, content=None):
+    key = await responses.key(request(), "user")
+    await responses.set(request(), key, content or [{"name": "d1"}], LAST_MODIFIED)
+    return key
+
+
+async def test_key_ignores_query_order(responses):
+    first = await responses.key(request("a=1&b=2"), "user")
+    assert first == await responses.key(request("b=2&a=1"), "user")
+    assert first != await responses.key(request("b=2&a=1"), "other")
+
+
+async def test_invalidate_moves_to_a_new_generation(responses):
+    key = await stored(responses)
+    assert await responses.get(request(), key) is not None
+    await responses.invalidate()
+    new_key = await responses.key(request(), "user")
+    assert new_key[0] > key[0]
+    assert await responses.get(request(), new_key) is None
+
+
+async def test_cached_response_has_validators(responses):
+    key = await stored(responses)
+    response = await responses.get(request(), key)
+    assert response.status_code == 200
+    assert response.body == b'[{"name":"d1"}]'
+    assert response.headers["etag"].startswith('"')
+    # the generation is later than the rows, it is the last write
+    assert (
+        email.utils.parsedate_to_datetime(response.headers["last-modified"])
+        > LAST_MODIFIED
+    )
+
+
+async def test_matching_etag_is_not_modified(responses):
+    key = await stored(responses)
+    etag = (await responses.get(request(), key)).headers["etag"]
+    response = await responses.get(request(if_none_match=f'W/{etag}, "x"'), key)
+    assert response.status_code == 304
+    assert response.body == b""
+    response = await responses.get(request(if_none_match='"x"'), key)
+    assert response.status_code == 200
+
+
+async def test_if_modified_since(responses):
+    key = await stored(responses)
+    last_modified = (await responses.get(request(), key)).headers["last-modified"]
+    response = await responses.get(request(if_modified_since=last_modified), key)
+    assert response.status_code == 304
+    earlier = email.utils.format_datetime(LAST_MODIFIED, usegmt=True)
+    response = await responses.get(request(if_modified_since=earlier), key)
+    assert response.status_code == 200
+    response = await responses.get(request(if_modified_since="yesterday"), key)
+    assert response.status_code == 200
+
+
+async def test_nothing_is_cached_across_processes_with_memory(monkeypatch):
+    monkeypatch.setattr(config.settings, "CACHE_BACKEND", "memory")
+    monkeypatch.setattr(config.settings, "WEB_CONCURRENCY", 4)
+    responses = response_cache.ResponseCache("test", ttl=60, max_size=100)
+    assert not responses.entries.enabled
+    assert not responses.generations.enabled
+    key = await stored(responses)
+    assert await responses.get(request(), key) is None
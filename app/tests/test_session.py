@@ -0,0 +1,47 @@
+import pytest
+
+from app.core import config
+from app.core.session import ENGINE_PROFILES, engine_options, engine_profile
+
+
+def settings(**update) -> config.Settings:
+    return config.settings.copy(update={"ENVIRONMENT": "PRD", **update})
+
+
+def test_profile_of_the_environment():
+    assert engine_profile(settings(WEB_CONCURRENCY=1)) == ENGINE_PROFILES["PRD"]
+
+
+def test_settings_override_the_profile():
+    profile = engine_profile(
+        settings(WEB_CONCURRENCY=1, DB_POOL_SIZE=20, DB_POOL_PRE_PING=False)
+    )
+    assert profile.pool_size == 20
+    assert profile.pool_pre_ping is False
+    assert profile.max_overflow == ENGINE_PROFILES["PRD"].max_overflow
+
+
+@pytest.mark.parametrize(
+    "budget, processes, pool_size, max_overflow",
+    [
+        # share 20: pool 10 + overflow 5 fit
+        (80, 4, 10, 5),
+        # share 12: pool 10, overflow cut to 2
+        (100, 8, 10, 2),
+        # share 5: pool cut, no overflow
+        (40, 8, 5, 0),
+        # at least one connection per process
+        (4, 8, 1, 0),
+    ],
+)
+def test_pool_is_capped_by_the_budget_share(budget, processes, pool_size, max_overflow):
+    profile = engine_profile(
+        settings(DB_CONNECTION_BUDGET=budget, WEB_CONCURRENCY=processes)
+    )
+    assert (profile.pool_size, profile.max_overflow) == (pool_size, max_overflow)
+
+
+def test_engine_options():
+    options = engine_options(ENGINE_PROFILES["PRD"])
+    assert options["pool_size"] == 10
+    assert options["connect_args"] == {"prepared_statement_cache_size": 500}
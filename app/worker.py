@@ -1,16 +1,71 @@
 # Celery worker
 # Task: deliver invoice data to aws kinesis
-import json
+import os
 
-import boto3
 from celery import Celery
+from celery.signals import (
+    task_failure,
+    task_retry,
+    task_success,
+    worker_init,
+    worker_process_init,
+    worker_process_shutdown,
+)
+from prometheus_client import start_http_server
 
-app = Celery("tasks", broker="redis://localhost:6379/0", backend="redis://localhost")
+from app.core import metrics
+from app.core.config import settings
+from app.core.kinesis import KinesisDeliveryError, create_producer
 
+app = Celery(
+    "tasks", broker=settings.CELERY_BROKER_URL, backend=settings.CELERY_RESULT_BACKEND
+)
 
-@app.task(name="invoice")
-def task_put_invoice(**args):
-    data = {
+# one client and buffer per worker process, see app.core.kinesis
+producer = create_producer(
+    settings.KINESIS_STREAM_NAME,
+    settings.AWS_REGION,
+    flush_interval=settings.KINESIS_FLUSH_INTERVAL_SECONDS,
+    max_retries=settings.KINESIS_MAX_RETRIES,
+)
+
+
+@worker_process_init.connect
+def reset_producer(**kwargs):
+    producer.reset()
+
+
+@worker_process_shutdown.connect
+def flush_producer(**kwargs):
+    producer.close()
+    metrics.mark_process_dead(os.getpid())
+
+
+@worker_init.connect
+def serve_metrics(**kwargs):
+    # prefork children write to PROMETHEUS_MULTIPROC_DIR, the main process
+    # serves the merged numbers
+    if settings.CELERY_METRICS_PORT:
+        start_http_server(settings.CELERY_METRICS_PORT, registry=metrics.registry())
+
+
+@task_success.connect
+def count_success(sender=None, **kwargs):
+    metrics.CELERY_TASKS.labels(sender.name, "success").inc()
+
+
+@task_failure.connect
+def count_failure(sender=None, **kwargs):
+    metrics.CELERY_TASKS.labels(sender.name, "failure").inc()
+
+
+@task_retry.connect
+def count_retry(sender=None, **kwargs):
+    metrics.CELERY_TASKS.labels(sender.name, "retry").inc()
+
+
+def _invoice_record(args: dict) -> dict:
+    return {
         "invoice_num": args["invoice_num"],
         "device_name": args["device_name"],
         "username": args["username"],
@@ -18,12 +73,37 @@ def task_put_invoice(**args):
         "total_value": args["total_value"],
         "invoice_date": args["invoice_date"],
     }
-    client = boto3.client("kinesis", region_name="us-east-2")
-    client.put_record(
-        StreamName="invoices", Data=json.dumps(data), PartitionKey="partitionkey"
-    )
+
+
+@app.task(name="invoice")
+def task_put_invoice(**args):
+    data = _invoice_record(args)
+    producer.put(data, partition_key=data["device_name"])
     return {
         "Ok": True,
         "data": data,
+        "message": "invoice data has been queued for the pipeline",
+    }
+
+
+# The outbox relay deletes its events once this task is queued, so the task
+# only succeeds when Kinesis took every invoice, and is retried until then
+# (acknowledged late: a worker dying midway leaves it queued). Retries send the
+# whole batch again, delivery is at least once.
+@app.task(
+    name="invoices",
+    acks_late=True,
+    reject_on_worker_lost=True,
+    autoretry_for=(KinesisDeliveryError,),
+    retry_backoff=True,
+    max_retries=None,
+)
+def task_put_invoices(invoices: list[dict]):
+    """Deliver many invoices now, without the buffer of the producer"""
+    records = [_invoice_record(args) for args in invoices]
+    producer.send([(data, data["device_name"]) for data in records])
+    return {
+        "Ok": True,
+        "count": len(invoices),
         "message": "invoice data has been delivered to pipeline",
     }
@@ -0,0 +1,333 @@
+"""
+Load test of the API hot paths with a stored baseline.
+
+Drives login, submit_invoice, get_device_list and read_current_user through
+the real application, in process with the httpx ASGI transport (default) or
+against a running server with --url, and prints requests per second and
+latency percentiles per endpoint:
+
+python -m benchmarks.api --concurrency 20 --requests 2000
+python -m benchmarks.api --url http://localhost:8000 --concurrency 50
+
+A merchant `api-bench@example.com` with device `api-bench-device` is created
+in the database first (also with --url, the database must be reachable).
+Save a baseline once, later runs with the same options are compared to it
+and exit with status 1 when throughput drops or p95 latency grows by more
+than --tolerance, or when a request fails:
+
+python -m benchmarks.api --save-baseline
+python -m benchmarks.api                       # compares to the baseline
+
+With --login-storm, read_current_user and get_device_list are measured twice,
+alone and while --storm-concurrency clients keep logging in (saturating the
+password hasher). Exits with status 1 when p99 latency under the storm grows
+by more than --tolerance:
+
+python -m benchmarks.api --login-storm --storm-concurrency 50
+
+Invoice values come from a seeded random generator, runs send the same
+requests except for the invoice numbers (every run stores new invoices).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime
+from decimal import Decimal
+
+import httpx
+from sqlalchemy import text
+
+from app.core import security
+from app.core.session import engine
+from app.main import app
+
+PREFIX = "/api/v1"
+USERNAME = "api-bench@example.com"
+PASSWORD = "api-bench-password"
+DEVICE = "api-bench-device"
+BASELINE = os.path.join(os.path.dirname(__file__), "api_baseline.json")
+SCENARIOS = ("login", "submit_invoice", "get_device_list", "read_current_user")
+STORM_SCENARIOS = ("read_current_user", "get_device_list")
+STORM_RAMP_SECONDS = 1
+
+FIXTURE = [
+    """
+    INSERT INTO "user" (id, username, hashed_password, role, created_at, modified_at)
+    VALUES (gen_random_uuid(), :username, :hashed_password, 'merchant', now(), now())
+    ON CONFLICT DO NOTHING
+    """,
+    """
+    INSERT INTO device (id, name, user_id, serial_num, status, created_at, modified_at)
+    SELECT gen_random_uuid(), :device, id, 'API-BENCH', 'active', now(), now()
+    FROM "user" WHERE username = :username
+    ON CONFLICT DO NOTHING
+    """,
+]
+
+
+async def create_fixture() -> None:
+    async with engine.begin() as connection:
+        for statement in FIXTURE:
+            await connection.execute(
+                text(statement),
+                {
+                    "username": USERNAME,
+                    "hashed_password": security.get_password_hash(PASSWORD),
+                    "device": DEVICE,
+                },
+            )
+
+
+class Requests:
+    """Request of every scenario, invoice values from a seeded generator"""
+
+    def __init__(self, token: str, seed: int):
+        self.headers = {"Authorization": f"Bearer {token}"}
+        self.random = random.Random(seed)
+        self.run = uuid.uuid4().hex[:8]
+        self.count = 0
+
+    def login(self, client: httpx.AsyncClient):
+        return client.post(
+            f"{PREFIX}/auth/access-token",
+            data={"username": USERNAME, "password": PASSWORD},
+        )
+
+    def submit_invoice(self, client: httpx.AsyncClient):
+        self.count += 1
+        total = Decimal(self.random.randint(1000, 5000000)) / 100
+        return client.post(
+            f"{PREFIX}/invoices/",
+            headers=self.headers,
+            json={
+                "invoice_num": f"api-bench-{self.run}-{self.count}",
+                "invoice_date": datetime.now().isoformat(),
+                "device_name": DEVICE,
+                "username": USERNAME,
+                "tax_value": str((total / 10).quantize(Decimal("0.01"))),
+                "total_value": str(total),
+            },
+        )
+
+    def get_device_list(self, client: httpx.AsyncClient):
+        return client.get(f"{PREFIX}/devices/", headers=self.headers)
+
+    def read_current_user(self, client: httpx.AsyncClient):
+        return client.get(f"{PREFIX}/users/me", headers=self.headers)
+
+
+async def run(client: httpx.AsyncClient, send, requests: int, concurrency: int) -> dict:
+    latencies: list[float] = []
+    errors = 0
+    remaining = requests
+
+    async def worker() -> None:
+        nonlocal errors, remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            response = await send(client)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else []
+    return {
+        "rps": len(latencies) / elapsed,
+        "p50": quantiles[49] * 1000 if quantiles else 0,
+        "p95": quantiles[94] * 1000 if quantiles else 0,
+        "p99": quantiles[98] * 1000 if quantiles else 0,
+        "errors": errors,
+    }
+
+
+async def flood(client: httpx.AsyncClient, send, concurrency: int, stop) -> int:
+    """Send requests from `concurrency` clients until `stop` is set"""
+    sent = 0
+
+    async def worker() -> None:
+        nonlocal sent
+        while not stop.is_set():
+            await send(client)
+            sent += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return sent
+
+
+async def login_storm(
+    client: httpx.AsyncClient, requests: Requests, args: argparse.Namespace
+) -> list[str]:
+    """p99 of STORM_SCENARIOS alone and during a login flood, returns the ones
+    growing by more than the tolerance"""
+    print(
+        f"{'endpoint':18} {'p99 ms':>8} {'storm p99':>10} {'logins/s':>9} "
+        f"{'errors':>7}"
+    )
+    found = []
+    for name in STORM_SCENARIOS:
+        send = getattr(requests, name)
+        await run(client, send, args.warmup, args.concurrency)
+        quiet = await run(client, send, args.requests, args.concurrency)
+
+        stop = asyncio.Event()
+        started = time.perf_counter()
+        logins = asyncio.ensure_future(
+            flood(client, requests.login, args.storm_concurrency, stop)
+        )
+        # let the logins fill the password hasher queue first
+        await asyncio.sleep(STORM_RAMP_SECONDS)
+        storm = await run(client, send, args.requests, args.concurrency)
+        stop.set()
+        login_rate = await logins / (time.perf_counter() - started)
+
+        errors = quiet["errors"] + storm["errors"]
+        print(
+            f"{name:18} {quiet['p99']:8.2f} {storm['p99']:10.2f} "
+            f"{login_rate:9.0f} {errors:7}"
+        )
+        if errors:
+            found.append(f"{name}: {errors} failed requests")
+        if storm["p99"] > quiet["p99"] * (1 + args.tolerance):
+            found.append(
+                f"{name}: p99 {storm['p99']:.2f} ms during the login storm, "
+                f"{quiet['p99']:.2f} ms without"
+            )
+    return found
+
+
+def regressions(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    found = []
+    for name, result in results.items():
+        if result["errors"]:
+            found.append(f"{name}: {result['errors']} failed requests")
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result["rps"] < expected["rps"] * (1 - tolerance):
+            found.append(
+                f"{name}: {result['rps']:.0f} requests/s, "
+                f"baseline {expected['rps']:.0f}"
+            )
+        if result["p95"] > expected["p95"] * (1 + tolerance):
+            found.append(
+                f"{name}: p95 {result['p95']:.2f} ms, "
+                f"baseline {expected['p95']:.2f} ms"
+            )
+    return found
+
+
+async def measure(
+    client: httpx.AsyncClient, requests: Requests, args: argparse.Namespace
+) -> dict:
+    print(
+        f"{'endpoint':18} {'requests/s':>10} {'p50 ms':>8} {'p95 ms':>8} "
+        f"{'p99 ms':>8} {'errors':>7}"
+    )
+    results = {}
+    for name in args.scenarios:
+        send = getattr(requests, name)
+        await run(client, send, args.warmup, args.concurrency)
+        result = results[name] = await run(
+            client, send, args.requests, args.concurrency
+        )
+        print(
+            f"{name:18} {result['rps']:10.0f} {result['p50']:8.2f} "
+            f"{result['p95']:8.2f} {result['p99']:8.2f} {result['errors']:7}"
+        )
+    return results
+
+
+async def shutdown(args: argparse.Namespace) -> None:
+    if not args.url:
+        await app.router.shutdown()
+    await engine.dispose()
+
+
+async def main(args: argparse.Namespace) -> int:
+    await create_fixture()
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=60)
+    else:
+        await app.router.startup()
+        client = httpx.AsyncClient(app=app, base_url="http://bench", timeout=60)
+
+    async with client:
+        response = await client.post(
+            f"{PREFIX}/auth/access-token",
+            data={"username": USERNAME, "password": PASSWORD},
+        )
+        response.raise_for_status()
+        requests = Requests(response.json()["access_token"], args.seed)
+
+        if args.login_storm:
+            found = await login_storm(client, requests, args)
+        else:
+            results = await measure(client, requests, args)
+    await shutdown(args)
+
+    if args.login_storm:
+        for regression in found:
+            print(f"REGRESSION {regression}")
+        return 1 if found else 0
+
+    options = {
+        "target": args.url or "asgi",
+        "concurrency": args.concurrency,
+        "requests": args.requests,
+    }
+    if args.save_baseline:
+        with open(args.baseline, "w") as file:
+            json.dump({"options": options, "results": results}, file, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+        return 0
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as file:
+            stored = json.load(file)
+        if stored["options"] == options:
+            baseline = stored["results"]
+        else:
+            print(f"Baseline taken with other options {stored['options']}, ignored")
+    else:
+        print(f"No baseline at {args.baseline}, save one with --save-baseline")
+
+    found = regressions(results, baseline, args.tolerance)
+    for regression in found:
+        print(f"REGRESSION {regression}")
+    return 1 if found else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--url", help="running server, default: in process")
+    parser.add_argument("--scenarios", nargs="+", default=SCENARIOS, choices=SCENARIOS)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=1000, help="per endpoint")
+    parser.add_argument("--warmup", type=int, default=50, help="per endpoint")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--login-storm", action="store_true")
+    parser.add_argument(
+        "--storm-concurrency", type=int, default=50, help="clients logging in"
+    )
+    parser.add_argument(
+        "--tolerance", type=float, default=0.2, help="allowed relative change"
+    )
+    args = parser.parse_args()
+    sys.exit(asyncio.run(main(args)))
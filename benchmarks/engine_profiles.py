@@ -0,0 +1,112 @@
+"""
+Throughput of the database engine profiles.
+
+Runs the same read queries from many concurrent tasks against one engine per
+profile of app.core.session.ENGINE_PROFILES and prints queries per second,
+latency percentiles and the longest pool checkout wait:
+
+python -m benchmarks.query_plans --seed 100000    # synthetic data, once
+python -m benchmarks.engine_profiles --concurrency 50 --seconds 20
+
+Statement log lines of profiles with `echo` go to /dev/null, their cost is
+still paid. Use --concurrency above pool_size + max_overflow to see pool
+timeouts and waits.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import time
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+from app.core.config import settings
+from app.core.session import ENGINE_PROFILES, engine_options
+
+QUERIES = [
+    "SELECT * FROM device WHERE user_id = :user_id",
+    'SELECT id, username, role, created_at FROM "user" WHERE id = :user_id',
+    "SELECT * FROM device ORDER BY created_at, id LIMIT 100",
+]
+
+SAMPLE = "SELECT user_id FROM device LIMIT 1"
+
+
+async def run(name: str, concurrency: int, seconds: float) -> dict:
+    engine = create_async_engine(
+        settings.DEFAULT_SQLALCHEMY_DATABASE_URI,
+        **engine_options(ENGINE_PROFILES[name]),
+    )
+    async with engine.connect() as connection:
+        user_id = (await connection.execute(text(SAMPLE))).scalar()
+    if user_id is None:
+        raise SystemExit("No devices found, seed with benchmarks.query_plans first")
+
+    latencies: list[float] = []
+    waits: list[float] = []
+    errors = 0
+    deadline = time.perf_counter() + seconds
+
+    async def client(offset: int) -> None:
+        nonlocal errors
+        i = offset
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                async with engine.connect() as connection:
+                    waits.append(time.perf_counter() - started)
+                    await connection.execute(
+                        text(QUERIES[i % len(QUERIES)]), {"user_id": user_id}
+                    )
+            except Exception:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            i += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    await engine.dispose()
+
+    quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else []
+    return {
+        "profile": name,
+        "qps": len(latencies) / elapsed,
+        "p50": quantiles[49] * 1000 if quantiles else 0,
+        "p95": quantiles[94] * 1000 if quantiles else 0,
+        "p99": quantiles[98] * 1000 if quantiles else 0,
+        "max_wait": max(waits, default=0) * 1000,
+        "errors": errors,
+    }
+
+
+async def main(profiles: list[str], concurrency: int, seconds: float) -> None:
+    devnull = logging.FileHandler(os.devnull)
+    logging.getLogger("sqlalchemy.engine.Engine").addHandler(devnull)
+
+    print(
+        f"{'profile':8} {'queries/s':>10} {'p50 ms':>8} {'p95 ms':>8} "
+        f"{'p99 ms':>8} {'max wait ms':>12} {'errors':>7}"
+    )
+    for name in profiles:
+        result = await run(name, concurrency, seconds)
+        print(
+            f"{result['profile']:8} {result['qps']:10.0f} {result['p50']:8.2f} "
+            f"{result['p95']:8.2f} {result['p99']:8.2f} {result['max_wait']:12.2f} "
+            f"{result['errors']:7}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "--profiles", nargs="+", default=list(ENGINE_PROFILES), choices=ENGINE_PROFILES
+    )
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--seconds", type=float, default=10)
+    args = parser.parse_args()
+    asyncio.run(main(args.profiles, args.concurrency, args.seconds))
@@ -0,0 +1,149 @@
+"""
+Query plans of the invoice hot paths.
+
+Prints EXPLAIN (ANALYZE, BUFFERS) and execution time of the queries behind
+submit_invoice, delete_device, per merchant lookups and the device list.
+Compare the output before and after the index migration (4b82c8751734) on
+an empty database, stepping through that one migration only:
+
+alembic upgrade 8bfe22d22b06                        # the revision before it
+python -m benchmarks.query_plans --seed 10000000    # synthetic data, once
+python -m benchmarks.query_plans > before.txt
+alembic upgrade 4b82c8751734
+python -m benchmarks.query_plans > after.txt
+alembic upgrade head
+
+Downgrading an up to date database to 8bfe22d22b06 would also undo the later
+migrations (partitioning 4b70f98aeea5, geohash 9c1d52e7a3f0, import tables
+1f6a3c9d8e42, NOT NULL created_at 5d3e9a4c71b2), mixing their effect into the
+comparison.
+
+Seeding inserts `bench-*` users and devices and N invoices spread over two
+years with generate_series (creating the monthly partitions they need), it is
+meant for plans, not realistic values.
+"""
+
+import argparse
+import asyncio
+import datetime
+import time
+
+from sqlalchemy import text
+
+from app.core import partitions
+from app.core.session import engine
+
+SEED_USERS = 1000
+SEED_DEVICES = 10000
+
+SEED = [
+    """
+    INSERT INTO "user" (id, username, hashed_password, role, created_at, modified_at)
+    SELECT gen_random_uuid(), 'bench-' || i || '@example.com', '-', 'merchant',
+           now() - i * interval '1 minute', now()
+    FROM generate_series(1, :users) i
+    ON CONFLICT DO NOTHING
+    """,
+    """
+    INSERT INTO device (id, name, user_id, status, created_at, modified_at)
+    SELECT gen_random_uuid(), 'bench-device-' || i, u.id, 'active',
+           now() - i * interval '1 second', now()
+    FROM generate_series(1, :devices) i
+    JOIN (
+        SELECT id, row_number() OVER (ORDER BY id) AS n
+        FROM "user" WHERE username LIKE 'bench-%'
+    ) u ON u.n = 1 + i % :users
+    ON CONFLICT DO NOTHING
+    """,
+    """
+    INSERT INTO invoice (id, invoice_num, invoice_date, device_name, username,
+                         tax_value, total_value, created_at, modified_at)
+    SELECT gen_random_uuid(), 'bench-' || i, now() - random() * interval '730 days',
+           d.name, d.username, round((t * 0.1)::numeric, 2), round(t::numeric, 2),
+           now(), now()
+    FROM (SELECT i, random() * 1000000 AS t FROM generate_series(1, :rows) i) g
+    JOIN (
+        SELECT device.name, "user".username,
+               row_number() OVER (ORDER BY device.name) AS n
+        FROM device JOIN "user" ON "user".id = device.user_id
+        WHERE device.name LIKE 'bench-device-%'
+    ) d ON d.n = 1 + g.i % :devices
+    """,
+]
+
+SAMPLE = """
+SELECT device.name AS device_name, device.user_id, "user".username,
+       invoice.invoice_num
+FROM invoice
+JOIN device ON device.name = invoice.device_name
+JOIN "user" ON "user".id = device.user_id
+LIMIT 1
+"""
+
+QUERIES = {
+    "devices of a user (submit_invoice)": (
+        "SELECT * FROM device WHERE user_id = :user_id"
+    ),
+    "resubmitted invoice (submit_invoice)": (
+        "SELECT id FROM invoice WHERE device_name = :device_name "
+        "AND invoice_num = :invoice_num"
+    ),
+    "device has invoices (delete_device)": (
+        "SELECT id FROM invoice WHERE device_name = :device_name LIMIT 1"
+    ),
+    "merchant invoices of a month": (
+        "SELECT count(*), sum(tax_value), sum(total_value) FROM invoice "
+        "WHERE username = :username "
+        "AND invoice_date >= now() - interval '60 days' "
+        "AND invoice_date < now() - interval '30 days'"
+    ),
+    "device list page (get_device_list)": (
+        "SELECT * FROM device ORDER BY created_at, id LIMIT 100"
+    ),
+}
+
+
+async def seed(rows: int) -> None:
+    async with engine.begin() as connection:
+        if await partitions.list_partitions(connection):
+            today = datetime.date.today()
+            await partitions.ensure_partitions(
+                connection, today - datetime.timedelta(days=731), today
+            )
+        for statement in SEED:
+            started = time.perf_counter()
+            await connection.execute(
+                text(statement),
+                {"users": SEED_USERS, "devices": SEED_DEVICES, "rows": rows},
+            )
+            print(f"seeded in {time.perf_counter() - started:.1f}s")
+        await connection.execute(text("ANALYZE"))
+
+
+async def explain() -> None:
+    async with engine.connect() as connection:
+        sample = (await connection.execute(text(SAMPLE))).one_or_none()
+        if sample is None:
+            raise SystemExit("No invoices found, run with --seed first")
+        params = dict(sample._mapping)
+        for name, query in QUERIES.items():
+            plan = await connection.execute(
+                text(f"EXPLAIN (ANALYZE, BUFFERS) {query}"), params
+            )
+            print(f"== {name}")
+            print("\n".join(line for (line,) in plan))
+            print()
+
+
+async def main(rows: int) -> None:
+    if rows:
+        await seed(rows)
+    await explain()
+    await engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--seed", type=int, default=0, help="invoices to insert")
+    args = parser.parse_args()
+    asyncio.run(main(args.seed))
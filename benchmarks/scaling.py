@@ -0,0 +1,171 @@
+"""
+Throughput of the API by number of worker processes.
+
+Starts `uvicorn app.main:app --workers N` for every N of --workers (with
+WEB_CONCURRENCY=N, so database pools follow DB_CONNECTION_BUDGET), loads it
+for --seconds from --clients processes sending the read_current_user and
+get_device_list requests of benchmarks.api, and prints requests per second
+and the speedup over the first run:
+
+python -m benchmarks.scaling --workers 1 2 4 --clients 4 --seconds 20
+
+Exits with status 1 when a run reaches less than --min-efficiency of linear
+scaling. Expected scaling stops at the CPUs available, and the client
+processes use CPUs too: compare worker counts well below the core count, or
+run the clients on another machine against a server started by hand (--url,
+a single run with the given --workers label).
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import httpx
+
+from app.core.session import engine
+from benchmarks import api
+
+STARTUP_SECONDS = 60
+
+
+async def _load(url: str, token: str, concurrency: int, seconds: float) -> tuple:
+    requests = api.Requests(token, seed=0)
+    sends = [requests.read_current_user, requests.get_device_list]
+    done = errors = 0
+    deadline = time.perf_counter() + seconds
+
+    async def worker(offset: int) -> None:
+        nonlocal done, errors
+        i = offset
+        while time.perf_counter() < deadline:
+            response = await sends[i % len(sends)](client)
+            done += 1
+            if response.status_code >= 400:
+                errors += 1
+            i += 1
+
+    async with httpx.AsyncClient(base_url=url, timeout=60) as client:
+        await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    return done, errors
+
+
+def load(url: str, token: str, concurrency: int, seconds: float) -> tuple:
+    """Requests sent and failed by one client process"""
+    return asyncio.run(_load(url, token, concurrency, seconds))
+
+
+def start(workers: int, port: int) -> subprocess.Popen:
+    return subprocess.Popen(
+        [
+            sys.executable,
+            "-m",
+            "uvicorn",
+            "app.main:app",
+            "--port",
+            str(port),
+            "--workers",
+            str(workers),
+            "--no-access-log",
+        ],
+        env=dict(os.environ, WEB_CONCURRENCY=str(workers)),
+    )
+
+
+def wait_ready(url: str) -> None:
+    deadline = time.monotonic() + STARTUP_SECONDS
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"{url}/metrics").raise_for_status()
+            return
+        except httpx.HTTPError:
+            time.sleep(0.5)
+    raise SystemExit(f"Server at {url} did not start")
+
+
+def login(url: str) -> str:
+    response = httpx.post(
+        f"{url}{api.PREFIX}/auth/access-token",
+        data={"username": api.USERNAME, "password": api.PASSWORD},
+    )
+    response.raise_for_status()
+    return response.json()["access_token"]
+
+
+def measure(url: str, clients: int, concurrency: int, seconds: float) -> dict:
+    token = login(url)
+    per_client = max(concurrency // clients, 1)
+    with ProcessPoolExecutor(max_workers=clients) as pool:
+        results = list(
+            pool.map(
+                load,
+                [url] * clients,
+                [token] * clients,
+                [per_client] * clients,
+                [seconds] * clients,
+            )
+        )
+    return {
+        "rps": sum(done for done, _ in results) / seconds,
+        "errors": sum(errors for _, errors in results),
+    }
+
+
+async def create_fixture() -> None:
+    await api.create_fixture()
+    await engine.dispose()
+
+
+def main(args: argparse.Namespace) -> int:
+    asyncio.run(create_fixture())
+    print(f"{'workers':>7} {'requests/s':>10} {'speedup':>8} {'errors':>7}")
+    runs = []
+    # a server started by hand is measured once, labelled with the first count
+    for workers in args.workers[:1] if args.url else args.workers:
+        if args.url:
+            result = measure(args.url, args.clients, args.concurrency, args.seconds)
+        else:
+            url = f"http://localhost:{args.port}"
+            server = start(workers, args.port)
+            try:
+                wait_ready(url)
+                result = measure(url, args.clients, args.concurrency, args.seconds)
+            finally:
+                server.terminate()
+                server.wait()
+        runs.append((workers, result))
+        speedup = result["rps"] / runs[0][1]["rps"] if runs[0][1]["rps"] else 0
+        print(f"{workers:7} {result['rps']:10.0f} {speedup:8.2f} {result['errors']:7}")
+
+    failed = False
+    first_workers, first = runs[0]
+    for workers, result in runs[1:]:
+        expected = workers / first_workers * args.min_efficiency
+        if result["rps"] < first["rps"] * expected:
+            print(
+                f"FAILED {workers} workers: {result['rps'] / first['rps']:.2f}x "
+                f"the throughput of {first_workers}, expected {expected:.2f}x"
+            )
+            failed = True
+    if any(result["errors"] for _, result in runs):
+        print("FAILED requests with errors")
+        failed = True
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser.add_argument("--url", help="running server, default: start uvicorn")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--clients", type=int, default=4, help="client processes")
+    parser.add_argument("--concurrency", type=int, default=64, help="in total")
+    parser.add_argument("--seconds", type=float, default=20)
+    parser.add_argument("--min-efficiency", type=float, default=0.7)
+    args = parser.parse_args()
+    sys.exit(main(args))
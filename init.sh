@@ -1,7 +1,21 @@
 #!/bin/bash
 
+if [ -n "$PROMETHEUS_MULTIPROC_DIR" ]; then
+    echo "Reset prometheus multiprocess directory"
+    rm -rf "$PROMETHEUS_MULTIPROC_DIR"
+    mkdir -p "$PROMETHEUS_MULTIPROC_DIR"
+fi
+
 echo "Run migrations"
 alembic upgrade head
 
 echo "Create initial data in DB"
 python -m app.initial_data
+
+echo "Create invoice partitions ahead"
+python -m app.partitions create
+
+echo "Configure app processes"
+python -m app.server_config --base /docker-entrypoint.d/config.json > /tmp/unit-config.json
+curl -fsS -X PUT --data-binary @/tmp/unit-config.json \
+    --unix-socket /var/run/control.unit.sock http://localhost/config